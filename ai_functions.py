@@ -0,0 +1,258 @@
+"""
+Monster turns with a time budget. Monsters plan their moves from a read only snapshot of the map, on a thread pool
+if asked, and the plans are carried out one monster at a time on the game's thread in a seeded order.
+"""
+
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+from classes import Monster, EntityIndex, get_entities_in_chunk
+from map_functions import MapChunk
+from pathfinding import NEIGHBOURS
+from profile_functions import profiler, timed
+from world_functions import read_only
+
+
+# Offsets of the tiles around a monster, in the order Monster.calculate_path tries them.
+NEIGHBOUR_DX = np.array([dx for dx, dy in NEIGHBOURS])
+NEIGHBOUR_DY = np.array([dy for dx, dy in NEIGHBOURS])
+
+
+def plan_moves(values, occupied, origin, map_x, map_y, target_x, target_y):
+    """
+    Choose a step for each of a group of monsters sharing a pathfinding map, the way Monster.calculate_path does:
+    the neighbouring tile with the lowest value, skipping tiles other entities are on.
+
+    :param values: pathfinding map as a MapWindow, e.g. a FlowField.
+    :param occupied: bool array of tiles with entities on them, indexed [x - origin x, y - origin y].
+    :param origin: (x, y) map tile at occupied[0, 0].
+    :param map_x: int array - x of each monster.
+    :param map_y: int array - y of each monster.
+    :param target_x: int array - x of each monster's target. The target's tile isn't skipped.
+    :param target_y: int array - y of each monster's target.
+    :return: dx and dy int arrays. 0, 0 for monsters with nowhere to go.
+    """
+    to_x = map_x[:, None] + NEIGHBOUR_DX
+    to_y = map_y[:, None] + NEIGHBOUR_DY
+
+    step_values = values.lookup(to_x, to_y)
+    in_the_way = occupied[to_x - origin[0], to_y - origin[1]] & ((to_x != target_x[:, None]) | (to_y != target_y[:, None]))
+    step_values = np.where(in_the_way, np.inf, step_values)
+
+    # argmin takes the first of equal values, like calculate_path. Walls and unreachable tiles are inf.
+    best = step_values.argmin(axis=1)
+    moving = np.isfinite(step_values[np.arange(len(best)), best])
+    return np.where(moving, NEIGHBOUR_DX[best], 0), np.where(moving, NEIGHBOUR_DY[best], 0)
+
+
+def plan_batch(occupied, origin, groups):
+    """
+    Plan moves for a batch of monsters. Safe to run on another thread: it only reads its arguments.
+
+    :param occupied: see plan_moves.
+    :param origin: see plan_moves.
+    :param groups: list of (pathfinding map, positions in the batch, map_x, map_y, target_x, target_y), one per map.
+    :return: list of (dx, dy) for the batch.
+    """
+    moves = [None] * sum(len(rows) for values, rows, map_x, map_y, target_x, target_y in groups)
+    for values, rows, map_x, map_y, target_x, target_y in groups:
+        dx, dy = plan_moves(values, occupied, origin, map_x, map_y, target_x, target_y)
+        for row, move in zip(rows, zip(dx.tolist(), dy.tolist())):
+            moves[row] = move
+    return moves
+
+
+class TurnSnapshot:
+    """
+    What monsters need to plan their moves, taken at the start of the monster turn: the tiles entities are on, and
+    the pathfinding maps monsters use. Arrays are read only, and nothing changes the map's tiles during the monster
+    turn, so plans can be made on other threads while moves are carried out.
+    """
+    def __init__(self, game_map, entities, area):
+        """
+        :param game_map: game map object
+        :param entities: list - tracking all entities in game.
+        :param area: MapChunk - every tile the monsters could step into.
+        """
+        self.game_map = game_map
+        self.fields = dict()  # (target, fleeing) -> read only pathfinding map, fetched when first needed.
+
+        # Tiles with entities on them.
+        self.origin = (area.x1, area.y1)
+        occupied = np.zeros((area.width, area.height), dtype=bool)
+        if isinstance(entities, EntityIndex):
+            store = entities.store
+            slots = store.in_rect(area.x1, area.x2, area.y1, area.y2)
+            occupied[store.map_x[slots] - area.x1, store.map_y[slots] - area.y1] = True
+        else:
+            for entity in get_entities_in_chunk(entities, area):
+                occupied[entity.map_x - area.x1, entity.map_y - area.y1] = True
+        self.occupied = read_only(occupied)
+
+    def field(self, target, fleeing):
+        # The pathfinding map for monsters chasing or fleeing a target. Only call from the game's thread.
+        values = self.fields.get((target, fleeing))
+        if values is None:
+            if fleeing:
+                values = self.game_map.flow_fields.flee_map(target)
+            else:
+                values = self.game_map.flow_fields.chase_map(target)
+            values = self.fields[(target, fleeing)] = values.read_only()
+        return values
+
+    def groups(self, batch):
+        # Split a batch of monsters by the pathfinding map they use, ready for plan_batch.
+        rows = dict()
+        for row, monster in enumerate(batch):
+            rows.setdefault((monster.target, bool(monster.flee)), list()).append(row)
+
+        groups = list()
+        for key, group_rows in rows.items():
+            monsters = [batch[row] for row in group_rows]
+            target = key[0]
+            groups.append((self.field(*key), group_rows,
+                           np.array([monster.map_x for monster in monsters]), np.array([monster.map_y for monster in monsters]),
+                           np.full(len(monsters), target.map_x), np.full(len(monsters), target.map_y)))
+        return groups
+
+
+class AIScheduler:
+    """
+    Runs the monster turn as plan then resolve, as a replacement for game_functions.monster_turn.
+
+    Monsters in the visible map chunk plan their moves in batches from a TurnSnapshot. With workers, the next batch is
+    planned on a thread pool while the current one is carried out. Moves are carried out on the calling thread in an
+    order shuffled each turn by a seeded generator, with Monster.act. When two monsters want the same tile, the first
+    in the order gets it, and the other waits, or attacks if its target is in reach.
+
+    With a time_budget, monsters still waiting when it runs out go first next turn, so a turn takes about the same
+    time however many monsters there are. As that depends on the clock, use max_monsters instead where games must
+    play out the same way for the same seed.
+    """
+    def __init__(self, workers=0, time_budget=None, max_monsters=None, batch_size=256, seed=0, line_of_sight=False):
+        """
+        :param workers: int - threads to plan moves on. 0 plans on the calling thread.
+        :param time_budget: float - seconds a monster turn may take, or None to let every monster act.
+        :param max_monsters: int - most monsters which act each turn, or None for no limit.
+        :param batch_size: int - monsters planned at a time.
+        :param seed: int - seed for the order monsters act in.
+        :param line_of_sight: bool - only monsters in the player's field of view act, rather than every monster in the
+                              visible map chunk. Walls then hide monsters. See game_map.visibility.
+        """
+        self.workers = workers
+        self.time_budget = time_budget
+        self.max_monsters = max_monsters
+        self.batch_size = batch_size
+        self.line_of_sight = line_of_sight
+        self.rng = np.random.default_rng(seed)
+        self.executor = ThreadPoolExecutor(max_workers=workers) if workers else None
+        self.waiting = list()  # Monsters which didn't get to act last turn, in the order they were due to.
+        self.last_turn = dict()  # Numbers from the last turn: active, acted, waiting and seconds.
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def clone(self, entity_map):
+        """
+        A copy of the scheduler for a copied game (see snapshot_functions.clone_game), which will order monsters the
+        same way. Copies plan on the calling thread, which gives the same moves as planning on a thread pool.
+
+        :param entity_map: dict of entity -> its copy.
+        """
+        scheduler = AIScheduler(0, self.time_budget, self.max_monsters, self.batch_size, line_of_sight=self.line_of_sight)
+        scheduler.rng.bit_generator.state = self.rng.bit_generator.state
+        scheduler.waiting = [entity_map[monster] for monster in self.waiting if monster in entity_map]
+        scheduler.last_turn = dict(self.last_turn)
+        return scheduler
+
+    def state(self, position):
+        """
+        The scheduler's state for a snapshot: its random number generator, and the monsters left waiting.
+
+        :param position: dict of entity -> its position in the entity list.
+        """
+        return {"rng": self.rng.bit_generator.state, "waiting": [position[monster] for monster in self.waiting if monster in position]}
+
+    def restore(self, state, entities):
+        # Put back a state from the state method, for the entities loaded from the same snapshot.
+        self.rng.bit_generator.state = state["rng"]
+        self.waiting = [entities[number] for number in state["waiting"]]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def queue(self, player, entities, game_map, visible_map_chunk):
+        # Monsters which act this turn, in the order they act: monsters left waiting first, then the rest shuffled.
+        active = [entity for entity in get_entities_in_chunk(entities, visible_map_chunk) if isinstance(entity, Monster)]
+        if self.line_of_sight:
+            can_see = game_map.visibility.can_see
+            active = [monster for monster in active if can_see(player, monster)]
+        for monster in active:
+            if not monster.target:  # If the monster doesn't have a target, set it to the player.
+                monster.target = player
+
+        active_set = set(active)
+        waiting = [monster for monster in self.waiting if monster in active_set]
+        waiting_set = set(waiting)
+        rest = [monster for monster in active if monster not in waiting_set]
+        return waiting + [rest[position] for position in self.rng.permutation(len(rest)).tolist()]
+
+    def plan(self, snapshot, batch):
+        # Start planning a batch of monsters. Returns a Future of the batch's moves.
+        groups = snapshot.groups(batch)
+        if self.executor is not None:
+            return self.executor.submit(plan_batch, snapshot.occupied, snapshot.origin, groups)
+
+        plan = Future()
+        plan.set_result(plan_batch(snapshot.occupied, snapshot.origin, groups))
+        return plan
+
+    @timed("ai_scheduler")
+    def monster_turn(self, player, entities, game_map, visible_map_chunk):
+        """
+        Let the monsters in the visible map chunk (and in the player's field of view, with line_of_sight) take their
+        turns, within the time budget.
+
+        :param player: player object
+        :param entities: list - tracking all entities in game.
+        :param game_map: game map object
+        :param visible_map_chunk: MapChunk - the area of the map the player can see.
+        """
+        start = time.perf_counter()
+        queue = self.queue(player, entities, game_map, visible_map_chunk)
+        monsters = queue if self.max_monsters is None else queue[:self.max_monsters]
+        snapshot = TurnSnapshot(game_map, entities, MapChunk(visible_map_chunk.x1 - 1, visible_map_chunk.x2 + 1,
+                                                             visible_map_chunk.y1 - 1, visible_map_chunk.y2 + 1))
+
+        batches = [monsters[first:first + self.batch_size] for first in range(0, len(monsters), self.batch_size)]
+        acted = 0
+        out_of_time = False
+        next_plan = self.plan(snapshot, batches[0]) if batches else None
+        for number, batch in enumerate(batches):
+            if out_of_time:
+                break
+
+            # Plan the next batch while this one moves.
+            moves = next_plan.result()
+            next_plan = self.plan(snapshot, batches[number + 1]) if number + 1 < len(batches) else None
+
+            for monster, (dx, dy) in zip(batch, moves):
+                monster.act(dx, dy, game_map, entities)
+                acted += 1
+
+                # At least one monster always acts, so nobody waits forever.
+                out_of_time = self.time_budget is not None and time.perf_counter() - start > self.time_budget
+                if out_of_time:
+                    break
+
+        if next_plan is not None:
+            next_plan.cancel()  # Out of time, so its monsters wait.
+
+        self.waiting = queue[acted:]
+        self.last_turn = {"active": len(queue), "acted": acted, "waiting": len(self.waiting), "seconds": time.perf_counter() - start}
+        profiler.count("monsters_acted", acted)
@@ -0,0 +1,71 @@
+"""
+Time taken to find the monsters which act this turn, the ones inside the visible map chunk, against the number of
+monsters. Compares the original test, (x, y) in visible_map_chunk scanning every tile of the chunk for each monster,
+with the spatial hash buckets and with the vectorised test of the entity store used by get_entities_in_chunk.
+
+Run from the repository root: python benchmarks/bench_activation.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from classes import Monster, StatBlock, EntityIndex, get_entities_in_chunk  # noqa: E402
+from map_functions import MapChunk  # noqa: E402
+
+
+def legacy_activation(entities, visible_map_chunk):
+    # The original monster turn loop: MapChunk had no __contains__, so "in" walked every tile of the chunk.
+    return [entity for entity in entities if any(xy == (entity.map_x, entity.map_y) for xy in iter(visible_map_chunk))]
+
+
+def bucket_activation(entities, visible_map_chunk):
+    return entities.in_rect(visible_map_chunk.x1, visible_map_chunk.x2, visible_map_chunk.y1, visible_map_chunk.y2)
+
+
+def spawn_monsters(count, map_size, seed=0):
+    rng = np.random.default_rng(seed)
+    entities = EntityIndex()
+    for map_x, map_y in rng.integers(1, map_size - 1, size=(count, 2)).tolist():
+        entities.append(Monster("Orc", map_x, map_y, colour=(255, 0, 0), game_map=None, stats=StatBlock(h=10, m=0, s=3, d=0)))
+    return entities
+
+
+def time_activation(activation, entities, visible_map_chunk, repeats):
+    timings = list()
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        activation(entities, visible_map_chunk)
+        timings.append(time.perf_counter() - start)
+    return np.median(timings) * 1000
+
+
+def main():
+    # A view port of 51 x 31 tiles, on a map small enough that about a quarter of the monsters are on screen.
+    map_size = 100
+    visible_map_chunk = MapChunk(20, 70, 20, 50)
+    activations = {"legacy": legacy_activation, "buckets": bucket_activation, "store": get_entities_in_chunk}
+
+    print("Median ms to find the monsters in the visible map chunk")
+    print("{:>9}{:>8}".format("monsters", "active") + "".join("{:>10}".format(name) for name in activations))
+    for count in (1000, 2000, 5000, 10000):
+        entities = spawn_monsters(count, map_size)
+        active = get_entities_in_chunk(entities, visible_map_chunk)
+        assert bucket_activation(entities, visible_map_chunk) == active
+        if count == 1000:
+            assert legacy_activation(entities, visible_map_chunk) == active
+
+        row = "{:>9}{:>8}".format(count, len(active))
+        for name, activation in activations.items():
+            if name == "legacy" and count > 2000:
+                row += "{:>10}".format("-")  # Takes too long to be worth waiting for.
+            else:
+                row += "{:10.3f}".format(time_activation(activation, entities, visible_map_chunk, repeats=1 if name == "legacy" else 20))
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
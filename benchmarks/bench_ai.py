@@ -0,0 +1,68 @@
+"""
+Time taken by the monster turn against the number of monsters, for game_functions.monster_turn (every monster takes
+its turn in full, one after another) and for AIScheduler without a time budget, with a budget, and planning on a
+thread pool. Also reports how many monsters acted per turn.
+
+Run from the repository root: python benchmarks/bench_ai.py
+"""
+
+import os
+import sys
+import time
+import random
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from classes import set_message_handler  # noqa: E402
+from ai_functions import AIScheduler  # noqa: E402
+from game_functions import new_game, player_turn, monster_turn  # noqa: E402
+from map_functions import get_visible_map_chunk  # noqa: E402
+
+
+def time_turns(monster_count, scheduler=None, turns=30, seed=1):
+    # Mean ms per monster turn and mean monsters acting per turn, with the player standing still.
+    player, entities, game_map = new_game(100, 80, monster_count, random.Random(seed))
+    player.stats.h = 10 ** 9  # Keep the player alive.
+    timings = list()
+    acted = list()
+
+    for turn in range(turns):
+        visible_map_chunk = get_visible_map_chunk(player, game_map, 800, 480)
+        player_turn({}, player, entities, game_map)
+
+        start = time.perf_counter()
+        if scheduler is None:
+            monster_turn(player, entities, game_map, visible_map_chunk)
+        else:
+            scheduler.monster_turn(player, entities, game_map, visible_map_chunk)
+        timings.append(time.perf_counter() - start)
+
+        if scheduler is not None:
+            acted.append(scheduler.last_turn["acted"])
+
+    return np.mean(timings[1:]) * 1000, np.mean(acted) if acted else None
+
+
+def main():
+    set_message_handler(None)
+    schedulers = {"monster_turn": lambda: None,
+                  "scheduler": lambda: AIScheduler(),
+                  "budget 5ms": lambda: AIScheduler(time_budget=0.005),
+                  "2 threads": lambda: AIScheduler(workers=2, time_budget=0.005)}
+
+    print("Mean ms per monster turn (monsters acting per turn), 100 x 80 map")
+    print("{:>9}".format("monsters") + "".join("{:>20}".format(name) for name in schedulers))
+    for monster_count in (100, 500, 1000, 2000, 4000):
+        row = "{:>9}".format(monster_count)
+        for name, make_scheduler in schedulers.items():
+            scheduler = make_scheduler()
+            milliseconds, acted = time_turns(monster_count, scheduler)
+            row += "{:>20}".format("{:.2f}".format(milliseconds) + (" ({:.0f})".format(acted) if acted is not None else ""))
+            if scheduler is not None:
+                scheduler.close()
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
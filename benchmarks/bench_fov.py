@@ -0,0 +1,71 @@
+"""
+Time taken to compute a field of view against its radius, and the cost of "can A see B" queries answered from the
+visibility cache. Also compares with the activation test, MapChunk.__contains__.
+
+Run from the repository root: python benchmarks/bench_fov.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from classes import Player, StatBlock  # noqa: E402
+from fov_functions import FieldOfView  # noqa: E402
+from map_functions import MapChunk  # noqa: E402
+from mapgen_functions import generate_map  # noqa: E402
+
+
+def time_fov(game_map, radius, samples=200, seed=0):
+    # Median time to compute a field of view from random open tiles.
+    rng = np.random.default_rng(seed)
+    open_tiles = np.argwhere(~game_map.blocked)
+    timings = list()
+
+    for x, y in open_tiles[rng.integers(0, len(open_tiles), size=samples)]:
+        start = time.perf_counter()
+        FieldOfView(game_map.tiles.opaque, (int(x), int(y)), radius, game_map.revision)
+        timings.append(time.perf_counter() - start)
+
+    return np.median(timings) * 1000
+
+
+def time_queries(game_map, queries=100000, seed=0):
+    # Mean time for a cached can_see query between the player and random tiles near them.
+    rng = np.random.default_rng(seed)
+    player = Player("Player", game_map.width // 2, game_map.height // 2, colour=(0, 255, 0), stats=StatBlock(h=100, m=0, s=10, d=10))
+    game_map.visibility.field_of_view(player)
+    targets = [(int(x), int(y)) for x, y in rng.integers(-15, 16, size=(queries, 2)) + (player.map_x, player.map_y)]
+
+    start = time.perf_counter()
+    for target in targets:
+        game_map.visibility.can_see(player, target)
+    return (time.perf_counter() - start) / queries * 10 ** 6
+
+
+def time_chunk_scan(queries=1000):
+    # Mean time for the monster activation test, (x, y) in visible_map_chunk.
+    chunk = MapChunk(0, 50, 0, 30)
+
+    start = time.perf_counter()
+    for query in range(queries):
+        (49, 29) in chunk
+    return (time.perf_counter() - start) / queries * 10 ** 6
+
+
+def main():
+    game_map = generate_map(400, 400, "caves", rng=1)
+
+    print("{:>8} {:>12}".format("radius", "fov ms"))
+    for radius in (4, 8, 16, 32, 64):
+        print("{:>8} {:12.3f}".format(radius, time_fov(game_map, radius)))
+
+    print()
+    print("Cached can_see query: {:8.2f} us".format(time_queries(game_map)))
+    print("Map chunk test:       {:8.2f} us".format(time_chunk_scan()))
+
+
+if __name__ == "__main__":
+    main()
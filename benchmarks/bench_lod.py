@@ -0,0 +1,75 @@
+"""
+Cost of keeping the world beyond the view port alive. Compares, per turn:
+
+    view only   game_functions.monster_turn on the visible map chunk, as the game runs now. Off screen monsters freeze.
+    everywhere  monster_turn on the whole map, every monster taking its turn in full. Small maps only.
+    tiered      lod_functions.TieredScheduler: full turns in view, coarse grid moves nearby, frozen further away.
+
+Reports mean ms per monster turn and how many monsters moved per turn, with the player walking across the map.
+Tiered pathfinding maps only reach field_radius steps from the player, where the other two search the whole map, so
+on big maps most of the difference is the first map being built. Monsters only get a target once they have been in
+view, so few move in the coarse tier here.
+
+Run from the repository root: python benchmarks/bench_lod.py
+"""
+
+import os
+import sys
+import time
+import random
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from classes import set_message_handler  # noqa: E402
+from game_functions import new_game, player_turn, monster_turn  # noqa: E402
+from lod_functions import TieredScheduler  # noqa: E402
+from map_functions import MapChunk, get_visible_map_chunk  # noqa: E402
+
+
+def time_turns(map_size, monster_count, mode, turns=30, seed=1):
+    # Mean ms per monster turn and mean monsters moved per turn.
+    player, entities, game_map = new_game(map_size[0], map_size[1], monster_count, random.Random(seed))
+    player.stats.h = 10 ** 9  # Keep the player alive.
+    whole_map = MapChunk(0, game_map.width, 0, game_map.height)
+    scheduler = TieredScheduler() if mode == "tiered" else None
+    timings = list()
+    moved = list()
+
+    for turn in range(turns):
+        visible_map_chunk = get_visible_map_chunk(player, game_map, 800, 480)
+        player_turn({"move": (1, 0) if turn // 15 % 2 == 0 else (-1, 0)}, player, entities, game_map)
+        before = entities.store.map_x[:len(entities.store.entities)].copy(), entities.store.map_y[:len(entities.store.entities)].copy()
+
+        start = time.perf_counter()
+        if scheduler is not None:
+            scheduler.monster_turn(player, entities, game_map, visible_map_chunk)
+        else:
+            monster_turn(player, entities, game_map, whole_map if mode == "everywhere" else visible_map_chunk)
+        timings.append(time.perf_counter() - start)
+
+        count = len(before[0])
+        moved.append(int(((entities.store.map_x[:count] != before[0]) | (entities.store.map_y[:count] != before[1])).sum()))
+
+    return np.mean(timings[1:]) * 1000, np.mean(moved[1:])
+
+
+def main():
+    set_message_handler(None)
+    modes = ("view only", "everywhere", "tiered")
+
+    print("Mean ms per monster turn (monsters moving per turn)")
+    print("{:>11} {:>9}".format("map", "monsters") + "".join("{:>22}".format(mode) for mode in modes))
+    for map_size, monster_count in (((200, 160), 1000), ((400, 320), 4000), ((1000, 1000), 20000), ((2000, 2000), 80000)):
+        row = "{:>11} {:>9}".format("{}x{}".format(*map_size), monster_count)
+        for mode in modes:
+            if mode == "everywhere" and monster_count > 4000:
+                row += "{:>22}".format("-")
+                continue
+            milliseconds, moved = time_turns(map_size, monster_count, mode)
+            row += "{:>22}".format("{:.2f} ({:.0f})".format(milliseconds, moved))
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
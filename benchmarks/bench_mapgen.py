@@ -0,0 +1,70 @@
+"""
+Time taken to build a game map against map size, for each generator in mapgen_functions and for the original
+approach: nested lists for the blocked array, a loop over every tile to block the borders and a randint per tile
+for noise.
+
+Run from the repository root: python benchmarks/bench_mapgen.py
+"""
+
+import os
+import sys
+import time
+import random
+from itertools import product
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from map_functions import GameMap  # noqa: E402
+from mapgen_functions import GENERATORS, generate_map  # noqa: E402
+
+
+def legacy_map(width, height, seed):
+    # The map as engine.main originally built it.
+    rng = random.Random(seed)
+    game_map = GameMap(width, height, block_borders=False)
+    game_map.blocked = np.array([[False for y in range(height + 1)] for x in range(width + 1)], dtype=bool)
+
+    for x, y in product(range(width), range(height)):
+        if y == 0 or x == 0:
+            game_map.blocked[x, y] = True
+
+        if y == height - 1 or x == width - 1:
+            game_map.blocked[x, y] = True
+
+    for x, y in game_map:
+        if rng.randint(1, 10) == 1:
+            game_map.blocked[x, y] = True
+
+    return game_map
+
+
+def time_build(build, size, repeats):
+    timings = list()
+    for seed in range(repeats):
+        start = time.perf_counter()
+        build(size, size, seed)
+        timings.append(time.perf_counter() - start)
+    return np.median(timings) * 1000
+
+
+def main():
+    sizes = (100, 250, 500, 1000, 2000)
+    builds = {"legacy": legacy_map}
+    for name in GENERATORS:
+        builds[name] = lambda width, height, seed, name=name: generate_map(width, height, name, seed)
+
+    print("Median ms to build a square map")
+    print("{:>6}".format("size") + "".join("{:>10}".format(name) for name in builds))
+    for size in sizes:
+        row = "{:>6}".format(size)
+        for name, build in builds.items():
+            if name == "legacy" and size > 500:
+                row += "{:>10}".format("-")  # Takes too long to be worth waiting for.
+            else:
+                row += "{:10.2f}".format(time_build(build, size, repeats=3 if name == "legacy" else 5))
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Observations per second for agents, against the number of games observed at once:
+
+    pixels    draw the view port with render_map and render_entities, then read the pixels back with surfarray
+    layers    Simulation.observation_layers, one game at a time
+    encode    ObservationEncoder.encode, one game at a time
+    batch     ObservationEncoder.encode_batch over every game, into one preallocated buffer
+    vector    VectorEnv.observation_channels, for games kept in one VectorEnv
+
+Also checks that the batched encoder gives the same observations as encoding one game at a time. Runs headless using
+the SDL dummy video driver.
+
+Run from the repository root: python benchmarks/bench_observation.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pygame  # noqa: E402
+from map_functions import get_visible_map_chunk  # noqa: E402
+from observation_functions import ObservationEncoder  # noqa: E402
+from render_functions import render_map, render_entities  # noqa: E402
+from simulation import Simulation  # noqa: E402
+from vector_env import VectorEnv  # noqa: E402
+
+
+def played(count, monster_count, steps=10):
+    # Games a few steps in, so monsters have moved and some are hurt.
+    games = list()
+    for seed in range(count):
+        simulation = Simulation(monster_count=monster_count, max_steps=10 ** 9)
+        simulation.reset(seed)
+        games.append(simulation)
+    for action in np.random.default_rng(0).integers(0, 9, size=steps).tolist():
+        for simulation in games:
+            simulation.step(action)
+    return games
+
+
+def scrape_pixels(surface, simulation):
+    # What training did before: draw the view port and read it back, one pixel per tile.
+    visible_map_chunk = get_visible_map_chunk(simulation.player, simulation.game_map, 800, 480)
+    render_map(surface, 0, 0, simulation.game_map, visible_map_chunk, dict())
+    render_entities(surface, 0, 0, simulation.entities, visible_map_chunk)
+    return pygame.surfarray.pixels3d(surface)[::16, ::16].copy()
+
+
+def per_second(function, count, repeats=20):
+    # Observations per second, from the best of several runs each observing count games.
+    best = float("inf")
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return count / best
+
+
+def main():
+    pygame.init()
+    surface = pygame.Surface((800, 480))
+    encoder = ObservationEncoder()
+    print("Observation shape {}, {} bytes as {}".format(encoder.shape, int(np.prod(encoder.shape)) * encoder.dtype.itemsize,
+                                                        encoder.dtype))
+
+    print("{:>6} {:>9} {:>10} {:>10} {:>10} {:>10} {:>10}  {}".format("games", "monsters", "pixels/s", "layers/s", "encode/s",
+                                                                      "batch/s", "vector/s", "same"))
+    for count in (1, 16, 64):
+        for monster_count in (10, 100):
+            games = played(count, monster_count)
+            states = [(simulation.player, simulation.entities, simulation.game_map) for simulation in games]
+            out = encoder.buffer(count)
+
+            env = VectorEnv(count, monster_count=monster_count, max_steps=10 ** 9)
+            env.reset(list(range(count)))
+            env.step(np.zeros(count, dtype=int))
+            vector_out = encoder.buffer(count)
+
+            rates = (per_second(lambda: [scrape_pixels(surface, simulation) for simulation in games], count, 3),
+                     per_second(lambda: [simulation.observation_layers() for simulation in games], count),
+                     per_second(lambda: [encoder.encode(*state) for state in states], count),
+                     per_second(lambda: encoder.encode_batch(states, out), count),
+                     per_second(lambda: env.observation_channels(encoder, vector_out), count))
+
+            same = all(np.array_equal(encoder.encode(*state), batch) for state, batch in zip(states, encoder.encode_batch(states, out)))
+            print("{:>6} {:>9} {:>10.0f} {:>10.0f} {:>10.0f} {:>10.0f} {:>10.0f}  {}".format(count, monster_count, *rates, same))
+
+    print("\nDownsampled batches of 64 games, 100 monsters")
+    games = played(64, 100)
+    states = [(simulation.player, simulation.entities, simulation.game_map) for simulation in games]
+    for downsample in (1, 2, 4):
+        encoder = ObservationEncoder(downsample=downsample)
+        out = encoder.buffer(len(states))
+        print("{:>3}x {:>14} {:>10.0f}/s".format(downsample, str(encoder.shape), per_second(lambda: encoder.encode_batch(states, out), len(states))))
+
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
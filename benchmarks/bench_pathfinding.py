@@ -0,0 +1,164 @@
+"""
+Compare the time taken by a monster turn phase using the shared flow field pathfinding against the original
+per-monster Manhattan distance map, and the cost of keeping a flow field up to date incrementally against
+rebuilding it every turn on larger maps.
+
+Run from the repository root: python benchmarks/bench_pathfinding.py
+"""
+
+import os
+import sys
+import time
+import random
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from classes import Player, Monster, StatBlock, EntityIndex  # noqa: E402
+from map_functions import GameMap, display_to_map  # noqa: E402
+from pathfinding import FlowField  # noqa: E402
+
+
+class LegacyMonster(Monster):
+    """
+    Monster using the original pathfinding: every monster walks every map tile each turn, in its own map sized array.
+    """
+    def __init__(self, name, map_x, map_y, colour, game_map, sprite=None, target=None, stats=None):
+        super().__init__(name, map_x, map_y, colour, game_map, sprite, target, stats)
+        self.dijkstra = np.array([[None for y in range(game_map.height + 1)] for x in range(game_map.width + 1)], dtype=float)
+
+    def update_dijkstra_map(self, game_map, target, entities):
+        self.dijkstra[target.map_x, target.map_y] = 0
+
+        for x, y in game_map:
+            if not game_map.blocked[x, y]:
+                self.dijkstra[x, y] = abs(x - target.map_x) + abs(y - target.map_y)
+
+        for entity in entities:
+            if entity is not target:
+                self.dijkstra[entity.map_x, entity.map_y] = None
+
+        if self.flee:
+            self.dijkstra = self.dijkstra * -1.2
+
+    def calculate_path(self):
+        cell = dict()
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                cell[self.dijkstra[(self.map_x + dx, self.map_y + dy)]] = (dx, dy)
+
+        viable_tiles = [key for key in cell.keys() if str(key) != "nan"]
+        if not viable_tiles:
+            return 0, 0
+        return cell[min(viable_tiles)]
+
+
+def build_world(monster_class, map_width, map_height, monster_count, seed):
+    rng = random.Random(seed)
+    game_map = GameMap(map_width, map_height)
+    for x, y in game_map:
+        if rng.randint(1, 10) == 1:
+            game_map.set_blocked(x, y)
+
+    def free_tile():
+        while True:
+            x, y = rng.randint(1, map_width - 2), rng.randint(1, map_height - 2)
+            if not game_map.blocked[x, y]:
+                return x, y
+
+    x, y = free_tile()
+    player = Player("Player", x, y, colour=(0, 255, 0), stats=StatBlock(h=10 ** 9, m=0, s=10, d=10))
+    entities = [player] if monster_class is LegacyMonster else EntityIndex([player])
+    for number in range(monster_count):
+        x, y = free_tile()
+        entities.append(monster_class("Orc " + str(number), x, y, colour=(255, 0, 0), game_map=game_map,
+                                      target=player, stats=StatBlock(h=10, m=0, s=12, d=8)))
+
+    return game_map, player, entities
+
+
+def time_turns(monster_class, map_width, map_height, monster_count, turns=20, seed=1):
+    game_map, player, entities = build_world(monster_class, map_width, map_height, monster_count, seed)
+    rng = random.Random(seed)
+    timings = list()
+
+    for turn in range(turns):
+        # Shuffle the player around so cached maps have to be rebuilt.
+        dx, dy = rng.choice(((0, 1), (0, -1), (1, 0), (-1, 0)))
+        if not game_map.blocked[player.map_x + dx, player.map_y + dy]:
+            player.move(dx, dy)
+
+        start = time.perf_counter()
+        for entity in entities:
+            if isinstance(entity, Monster):
+                entity.take_turn(game_map, entities)
+        timings.append(time.perf_counter() - start)
+
+    return np.median(timings) * 1000
+
+
+def time_field_updates(map_size, radius, turns=100, seed=1):
+    # Walk a source around an open map with the odd tile changing, timing incremental updates against rebuilds.
+    rng = np.random.default_rng(seed)
+    blocked = rng.random((map_size, map_size)) < 0.1
+    blocked[[0, -1], :] = blocked[:, [0, -1]] = True
+    source = (map_size // 2, map_size // 2)
+    blocked[source] = False
+    field = FlowField(blocked, source, 0, radius)
+
+    incremental = list()
+    rebuild = list()
+    for turn in range(turns):
+        dx, dy = rng.integers(-1, 2, size=2)
+        if not blocked[source[0] + dx, source[1] + dy]:
+            source = (source[0] + dx, source[1] + dy)
+
+        changed = list()
+        if turn % 5 == 0:
+            x, y = source[0] + rng.integers(-8, 9), source[1] + rng.integers(-8, 9)
+            if (x, y) != source and 0 < x < map_size - 1 and 0 < y < map_size - 1:
+                blocked[x, y] = not blocked[x, y]
+                changed.append((x, y))
+
+        start = time.perf_counter()
+        field.update(blocked, source, turn + 1, changed, 512)
+        incremental.append(time.perf_counter() - start)
+
+        if turn % 10 == 0:
+            start = time.perf_counter()
+            FlowField(blocked, source, 0, radius)
+            rebuild.append(time.perf_counter() - start)
+
+    return np.median(incremental) * 1000, np.mean(incremental) * 1000, np.median(rebuild) * 1000
+
+
+def main():
+    # Suppress the combat log while timing.
+    sys.stdout, stdout = open(os.devnull, "w"), sys.stdout
+    map_width, map_height = display_to_map(800 * 2, 640 * 2)
+    results = list()
+
+    try:
+        for monster_count in (10, 50, 100, 500):
+            legacy = time_turns(LegacyMonster, map_width, map_height, monster_count) if monster_count <= 100 else None
+            shared = time_turns(Monster, map_width, map_height, monster_count)
+            results.append((monster_count, legacy, shared))
+    finally:
+        sys.stdout = stdout
+
+    print("Map {}x{} - median monster phase per turn (ms)".format(map_width, map_height))
+    print("{:>9} {:>12} {:>12}".format("monsters", "legacy", "flow field"))
+    for monster_count, legacy, shared in results:
+        legacy_text = "{:12.2f}".format(legacy) if legacy is not None else "{:>12}".format("-")
+        print("{:>9} {} {:12.2f}".format(monster_count, legacy_text, shared))
+
+    print()
+    print("Flow field update per turn (ms)")
+    print("{:>9} {:>7} {:>12} {:>12} {:>12}".format("map", "radius", "inc median", "inc mean", "rebuild"))
+    for map_size, radius in ((100, None), (400, None), (400, 40), (2000, 40)):
+        median, mean, rebuild = time_field_updates(map_size, radius)
+        print("{:>9} {:>7} {:12.2f} {:12.2f} {:12.2f}".format(map_size, str(radius), median, mean, rebuild))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Cost of the profiling instrumentation: the time a timed wrapper adds to each call with the profiler off and on, and
+headless game steps per second with the profiler off, on, and on with the sampling profiler running.
+
+Run from the repository root: python benchmarks/bench_profiler.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from classes import Monster  # noqa: E402
+from profile_functions import profiler  # noqa: E402
+from simulation import Simulation  # noqa: E402
+
+
+def time_calls(function, calls=200000):
+    # Mean microseconds per call.
+    start = time.perf_counter()
+    for call in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls * 10 ** 6
+
+
+def steps_per_second(steps=2000, seed=0):
+    simulation = Simulation(monster_count=50)
+    simulation.reset(seed)
+    rng = np.random.default_rng(seed)
+    actions = rng.integers(0, 9, size=steps).tolist()
+
+    start = time.perf_counter()
+    for action in actions:
+        observation, reward, done, info = simulation.step(action)
+        if done:
+            simulation.reset(seed)
+    return steps / (time.perf_counter() - start)
+
+
+def main():
+    simulation = Simulation()
+    simulation.reset(0)
+    monster = next(entity for entity in simulation.entities if isinstance(entity, Monster))
+    monster.target = simulation.player
+    monster.update_dijkstra_map(simulation.game_map, monster.target, simulation.entities)
+
+    bare = time_calls(lambda: Monster.calculate_path.__wrapped__(monster))
+    off = time_calls(monster.calculate_path)
+    profiler.enable()
+    on = time_calls(monster.calculate_path)
+    profiler.disable()
+    print("Monster.calculate_path, us per call")
+    print("  not instrumented {:8.3f}\n  profiler off     {:8.3f}\n  profiler on      {:8.3f}".format(bare, off, on))
+
+    print("\nSimulation steps per second")
+    print("  profiler off     {:8.0f}".format(steps_per_second()))
+    profiler.enable()
+    print("  profiler on      {:8.0f}".format(steps_per_second()))
+    profiler.start_sampling()
+    print("  sampling         {:8.0f}".format(steps_per_second()))
+    sampler = profiler.stop_sampling()
+    profiler.disable()
+
+    print("\nMost sampled functions")
+    for name, share in sampler.top(5):
+        print("  {:40} {:6.1%}".format(name, share))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Compare frame times of the original per-tile renderer (a temporary Surface and a blit for every tile), the batched
+renderer (one Surface.blits call for the map and one for the entities) and the cached map renderer with dirty rect
+updates. Sprites come from the sprite atlas. Runs headless using the SDL dummy video driver.
+
+Run from the repository root: python benchmarks/bench_render.py
+"""
+
+import os
+import sys
+import time
+import random
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import pygame  # noqa: E402
+from classes import Player, Monster, StatBlock, EntityIndex  # noqa: E402
+from map_functions import GameMap, display_to_map, get_visible_map_chunk  # noqa: E402
+import render_functions  # noqa: E402
+from render_functions import render_all, MapRenderCache, SpriteAtlas, TERRAIN  # noqa: E402
+
+
+def legacy_render_map(screen_surface, view_port_x_offset, view_port_y_offset, game_map, visible_map_chunk, sprites):
+    # render_map as it was, drawing each tile through a temporary Surface.
+    for x, y in visible_map_chunk:
+        terrain = TERRAIN[game_map.tiles.terrain[x, y]]
+        tile_sprite = sprites.get(terrain["sprite"])
+        element_surface = pygame.Surface((16, 16))
+        if tile_sprite:
+            element_surface.blit(tile_sprite, (0, 0))
+        else:
+            element_surface.fill(terrain["colour"])
+        screen_surface.blit(element_surface, ((x - visible_map_chunk.x1) * 16 + view_port_x_offset, (y - visible_map_chunk.y1) * 16 + view_port_y_offset))
+
+
+def legacy_render_entities(screen_surface, view_port_x_offset, view_port_y_offset, entities, visible_map_chunk):
+    # render_entities as it was, one blit per entity.
+    for entity in entities:
+        if entity in visible_map_chunk:
+            screen_surface.blit(entity.surf, ((entity.map_x - visible_map_chunk.x1) * 16 + view_port_x_offset, (entity.map_y - visible_map_chunk.y1) * 16 + view_port_y_offset))
+
+
+def time_frames(screen_surface, sprites, renderer, monster_count, frames=200, scroll_every=10, seed=1):
+    rng = random.Random(seed)
+    screen_width, screen_height = screen_surface.get_size()
+    map_width, map_height = display_to_map(screen_width * 2, screen_height * 2)
+
+    game_map = GameMap(map_width, map_height)
+    for x, y in game_map:
+        if rng.randint(1, 10) == 1:
+            game_map.set_blocked(x, y)
+
+    player = Player("Player", map_width // 2, map_height // 2, colour=(0, 255, 0), sprite=sprites["player"],
+                    stats=StatBlock(h=100, m=0, s=10, d=10))
+    entities = EntityIndex([player])
+    for number in range(monster_count):
+        entities.append(Monster("Orc", rng.randint(1, map_width - 2), rng.randint(1, map_height - 2),
+                                colour=(255, 0, 0), game_map=game_map, sprite=sprites["orc"],
+                                stats=StatBlock(h=10, m=0, s=12, d=8)))
+
+    render_cache = MapRenderCache(game_map, sprites) if renderer == "cache" else None
+    batched = (render_functions.render_map, render_functions.render_entities)
+    if renderer == "legacy":
+        render_functions.render_map, render_functions.render_entities = legacy_render_map, legacy_render_entities
+    timings = list()
+
+    for frame in range(frames):
+        # Scroll the view every few frames, otherwise only some monsters move.
+        if frame % scroll_every == 0:
+            player.move(rng.choice((-1, 1)), 0)
+        for entity in entities:
+            if entity is not player and rng.random() < 0.2:
+                entity.move(rng.randint(-1, 1), rng.randint(-1, 1))
+
+        visible_map_chunk = get_visible_map_chunk(player, game_map, 800, 480)
+        start = time.perf_counter()
+        render_all(screen_surface, screen_width, screen_height, 800, 480, 0, 50, game_map, player, entities,
+                   visible_map_chunk, sprites, render_cache)
+        timings.append(time.perf_counter() - start)
+
+    render_functions.render_map, render_functions.render_entities = batched
+    return np.median(timings) * 1000, np.mean(timings) * 1000
+
+
+def main():
+    pygame.init()
+    screen_surface = pygame.display.set_mode([800, 640])
+    sprites = SpriteAtlas(os.path.join(ROOT, "sprites", "monochrome.png")).sprites()
+    renderers = ("legacy", "batched", "cache")
+
+    print("Frame time (ms), SDL video driver: {}".format(pygame.display.get_driver()))
+    print("{:>9}".format("monsters") + "".join("{:>13}{:>13}".format(renderer + " med", renderer + " mean") for renderer in renderers))
+    for monster_count in (10, 100, 1000):
+        row = "{:>9}".format(monster_count)
+        for renderer in renderers:
+            row += "{:13.2f}{:13.2f}".format(*time_frames(screen_surface, sprites, renderer, monster_count))
+        print(row)
+
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Records a headless game with random moves and a monster time budget to an action log, plays the log back with
+game_functions.replay and checks the game ends up the same. Reports the size of the log and how fast it plays back.
+
+Run from the repository root: python benchmarks/bench_replay.py
+"""
+
+import os
+import sys
+import time
+import random
+import hashlib
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from classes import set_message_handler  # noqa: E402
+from ai_functions import AIScheduler  # noqa: E402
+from game_functions import new_game, player_turn, replay  # noqa: E402
+from input_functions import ActionLog, ScriptedInput  # noqa: E402
+from map_functions import get_visible_map_chunk  # noqa: E402
+from simulation import ACTIONS  # noqa: E402
+
+
+def checksum(entities):
+    state = hashlib.sha1()
+    for entity in entities:
+        state.update("{},{},{};".format(entity.map_x, entity.map_y, entity.stats.h).encode())
+    return state.hexdigest()[:16]
+
+
+def record(turns, monster_count, seed=1):
+    # Play a game the way engine.main does, recording it. Returns the log and the entities at the end.
+    settings = {"seed": seed, "map_width": 100, "map_height": 80, "monster_count": monster_count, "generator": "noise",
+                "view_port_width": 800, "view_port_height": 480}
+    player, entities, game_map = new_game(100, 80, monster_count, random.Random(seed))
+    rng = random.Random(seed)
+    source = ScriptedInput([rng.choice(ACTIONS) for turn in range(turns)])
+    log = ActionLog(settings)
+
+    # The time budget makes how many monsters act depend on the clock, which the log has to capture.
+    with AIScheduler(workers=2, time_budget=0.001, seed=seed) as scheduler:
+        running = True
+        while running:
+            visible_map_chunk = get_visible_map_chunk(player, game_map, 800, 480)
+            action, running = source.get_action(running)
+            if action is None:
+                break
+            player_turn(action, player, entities, game_map)
+            scheduler.monster_turn(player, entities, game_map, visible_map_chunk)
+            log.append(action, scheduler.last_turn["acted"])
+
+    return log, entities
+
+
+def main():
+    set_message_handler(None)
+    path = os.path.join(tempfile.gettempdir(), "bench_replay.log")
+
+    print("{:>9} {:>7} {:>11} {:>12} {:>14}  {}".format("monsters", "turns", "log bytes", "record ms", "replay turns/s", "same game"))
+    for monster_count in (10, 100, 1000):
+        turns = 500
+        start = time.perf_counter()
+        log, entities = record(turns, monster_count)
+        recorded = time.perf_counter() - start
+        log.save(path)
+
+        start = time.perf_counter()
+        player, replayed, game_map = replay(ActionLog.load(path))
+        replay_seconds = time.perf_counter() - start
+
+        same = checksum(entities) == checksum(replayed)
+        print("{:>9} {:>7} {:>11} {:>12.0f} {:>14.0f}  {}".format(monster_count, len(log), os.path.getsize(path),
+                                                                   recorded * 1000, len(log) / replay_seconds, same))
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Throughput of the multi-process RolloutRunner from one worker up to one per core, against a single Simulation stepped
+in this process. Use it to see how rollouts scale on a machine and pick the number of workers.
+
+Workers only run in parallel up to the number of cores. Rows with more workers than cores (e.g. every row on a one
+core machine) measure the overhead of the processes and shared memory, not scaling, and are marked as such.
+
+Run from the repository root: python benchmarks/bench_rollout.py [max workers]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from simulation import Simulation  # noqa: E402
+from rollout import RolloutRunner  # noqa: E402
+
+
+def simulation_steps_per_second(steps=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    simulation = Simulation()
+    simulation.reset(seed)
+
+    start = time.perf_counter()
+    for step in range(steps):
+        observation, reward, done, info = simulation.step(int(rng.integers(0, 9)))
+        if done:
+            simulation.reset()
+    return steps / (time.perf_counter() - start)
+
+
+def runner_steps_per_second(num_workers, envs_per_worker=4, steps=250, seed=0):
+    rng = np.random.default_rng(seed)
+
+    with RolloutRunner(num_workers, envs_per_worker, seed=seed) as runner:
+        runner.reset()
+
+        start = time.perf_counter()
+        for step in range(steps):
+            runner.step(rng.integers(0, 9, size=runner.num_envs))
+        return runner.num_envs * steps / (time.perf_counter() - start)
+
+
+def main():
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    cores = os.cpu_count()
+    baseline = simulation_steps_per_second()
+    print("Simulation: {:10.0f} steps/sec, {} cores".format(baseline, cores))
+    print()
+
+    print("{:>9} {:>12} {:>15}".format("workers", "steps/sec", "vs Simulation"))
+    num_workers = 1
+    while num_workers <= max_workers:
+        steps_per_second = runner_steps_per_second(num_workers)
+        note = ""
+        if cores == 1:
+            note = "  (one core: overhead only, not scaling)"
+        elif num_workers > cores:
+            note = "  (more workers than cores: overhead only)"
+        print("{:>9} {:12.0f} {:14.2f}x{}".format(num_workers, steps_per_second, steps_per_second / baseline, note))
+        num_workers = num_workers * 2 if num_workers * 2 <= max_workers or num_workers == max_workers else max_workers
+
+
+if __name__ == "__main__":
+    main()
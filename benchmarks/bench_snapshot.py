@@ -0,0 +1,75 @@
+"""
+Snapshot size and save and load times against map size and monster count, and how many copies of a game
+Simulation.clone makes per second, compared with the time a step takes. Also checks that a loaded game and a
+cloned game carry on exactly as the original does.
+
+Run from the repository root: python benchmarks/bench_snapshot.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ai_functions import AIScheduler  # noqa: E402
+from simulation import Simulation  # noqa: E402
+
+
+def game_state(simulation):
+    return [(entity.map_x, entity.map_y, entity.stats.h) for entity in simulation.entities]
+
+
+def played(map_size, monster_count, steps=20, seed=1):
+    # A game a few steps in, so there are pathfinding maps and monsters on the move.
+    simulation = Simulation(map_size[0], map_size[1], monster_count, max_steps=10 ** 9, scheduler=AIScheduler(seed=seed))
+    simulation.reset(seed)
+    for action in np.random.default_rng(seed).integers(0, 9, size=steps).tolist():
+        simulation.step(action)
+    return simulation
+
+
+def mean_seconds(function, repeats):
+    start = time.perf_counter()
+    for repeat in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    path = os.path.join(tempfile.gettempdir(), "bench_snapshot.snap")
+
+    print("{:>11} {:>9} {:>11} {:>9} {:>9}".format("map", "monsters", "bytes", "save ms", "load ms"))
+    for map_size in ((100, 80), (500, 400), (1000, 1000)):
+        for monster_count in (10, 1000):
+            simulation = played(map_size, monster_count)
+            save = mean_seconds(lambda: simulation.save(path), 5)
+            load = mean_seconds(lambda: simulation.load(path), 5)
+            print("{:>11} {:>9} {:>11} {:>9.2f} {:>9.2f}".format("{}x{}".format(*map_size), monster_count,
+                                                                os.path.getsize(path), save * 1000, load * 1000))
+    os.remove(path)
+
+    print("\n{:>9} {:>10} {:>10} {:>9}".format("monsters", "clones/s", "step ms", "same game"))
+    for monster_count in (10, 100, 1000):
+        simulation = played((100, 80), monster_count)
+        clone = mean_seconds(simulation.clone, 200)
+        step = mean_seconds(lambda: simulation.clone().step(8), 20)
+
+        # A clone and a loaded copy play the same moves as the original.
+        copy = simulation.clone()
+        simulation.save(path)
+        loaded = Simulation(100, 80, monster_count, max_steps=10 ** 9, scheduler=AIScheduler())
+        loaded.load(path)
+        os.remove(path)
+        for action in np.random.default_rng(2).integers(0, 9, size=50).tolist():
+            for game in (simulation, copy, loaded):
+                game.step(action)
+        same = game_state(simulation) == game_state(copy) == game_state(loaded)
+
+        print("{:>9} {:>10.0f} {:>10.3f} {:>9}".format(monster_count, 1 / clone, (step - clone) * 1000, str(same)))
+
+
+if __name__ == "__main__":
+    main()
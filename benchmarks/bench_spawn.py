@@ -0,0 +1,83 @@
+"""
+Time and memory taken to spawn monsters, for monsters sharing pathfinding maps against monsters which each allocate
+a map sized dijkstra array as they originally did. Each case runs in a fresh process so its memory can be measured.
+
+Run from the repository root: python benchmarks/bench_spawn.py
+"""
+
+import os
+import sys
+import time
+import resource
+import tracemalloc
+import multiprocessing
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from classes import Player, Monster, StatBlock, EntityIndex  # noqa: E402
+from map_functions import GameMap  # noqa: E402
+
+
+class BufferedMonster(Monster):
+    """
+    Monster with its own map sized pathfinding array, built the way Monster used to build it.
+    """
+    def __init__(self, name, map_x, map_y, colour, game_map, sprite=None, target=None, stats=None):
+        super().__init__(name, map_x, map_y, colour, game_map, sprite, target, stats)
+        self.dijkstra = np.array([[None for y in range(game_map.height + 1)] for x in range(game_map.width + 1)], dtype=float)
+
+
+def peak_rss():
+    # Peak resident set size of this process in bytes. Linux reports kilobytes, macOS bytes.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def spawn_monsters(monster_class, game_map, monster_count):
+    player = Player("Player", 1, 1, colour=(0, 255, 0), stats=StatBlock(h=100, m=0, s=10, d=10))
+    entities = EntityIndex([player])
+    width = game_map.width - 2
+    for number in range(monster_count):
+        entities.append(monster_class("Orc " + str(number), 1 + number % width, 1 + number // width % width, colour=(255, 0, 0),
+                                      game_map=game_map, target=player, stats=StatBlock(h=10, m=0, s=12, d=8)))
+    return entities
+
+
+def measure(monster_class, map_size, monster_count):
+    # Runs in a child process. Returns seconds taken, growth in peak RSS and bytes allocated.
+    game_map = GameMap(map_size, map_size)
+
+    rss_before = peak_rss()
+    start = time.perf_counter()
+    spawned = spawn_monsters(monster_class, game_map, monster_count)
+    seconds = time.perf_counter() - start
+    rss = peak_rss() - rss_before
+    del spawned  # Kept alive until it was measured.
+
+    # Tracing slows allocation down, so count bytes on a second population rather than the timed one.
+    tracemalloc.start()
+    traced = spawn_monsters(monster_class, game_map, monster_count)
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del traced
+
+    return seconds, rss, allocated
+
+
+def main():
+    context = multiprocessing.get_context("spawn")
+    cases = [(Monster, 100, 1000), (Monster, 100, 10000), (Monster, 1000, 10000),
+             (BufferedMonster, 100, 1000), (BufferedMonster, 400, 100)]
+
+    print("{:>16} {:>6} {:>9} {:>12} {:>14} {:>12}".format("monster", "map", "monsters", "us each", "bytes each", "rss MB"))
+    for monster_class, map_size, monster_count in cases:
+        with context.Pool(1) as pool:
+            seconds, rss, allocated = pool.apply(measure, (monster_class, map_size, monster_count))
+        print("{:>16} {:>6} {:>9} {:12.1f} {:14.0f} {:12.1f}".format(monster_class.__name__, map_size, monster_count,
+                                                                       seconds / monster_count * 10 ** 6,
+                                                                       allocated / monster_count, rss / 2 ** 20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Time taken by the monster turn on large maps with most monsters off screen, for game_functions.monster_turn (checks
+every entity in the visible map chunk each turn) and for turn_functions.TurnScheduler (takes the monsters which are
+due off a priority queue). Reports the whole turn, and the cost of picking which monsters act alone, with
+Monster.take_turn swapped for a function which does nothing. Also shows monsters at different speeds.
+
+Choosing who acts costs more with the queue, at a few microseconds of Python per monster in view against one numpy
+test for monster_turn, but both are small next to the turns themselves.
+
+Run from the repository root: python benchmarks/bench_turns.py
+"""
+
+import os
+import sys
+import time
+import random
+import numpy as np
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from classes import Monster, NORMAL_SPEED, set_message_handler  # noqa: E402
+from game_functions import new_game, player_turn, monster_turn  # noqa: E402
+from map_functions import get_visible_map_chunk  # noqa: E402
+from turn_functions import TurnScheduler  # noqa: E402
+
+
+def time_turns(map_size, monster_count, scheduler=None, moving=False, turns=40, seed=1):
+    # Mean ms per monster turn, with the player standing still or walking back and forth.
+    player, entities, game_map = new_game(map_size[0], map_size[1], monster_count, random.Random(seed))
+    player.stats.h = 10 ** 9  # Keep the player alive.
+    timings = list()
+
+    for turn in range(turns):
+        visible_map_chunk = get_visible_map_chunk(player, game_map, 800, 480)
+        action = {"move": (1 if turn // 10 % 2 else -1, 0)} if moving else {}
+        player_turn(action, player, entities, game_map)
+
+        start = time.perf_counter()
+        if scheduler is None:
+            monster_turn(player, entities, game_map, visible_map_chunk)
+        else:
+            scheduler.monster_turn(player, entities, game_map, visible_map_chunk)
+        timings.append(time.perf_counter() - start)
+
+    return np.mean(timings[1:]) * 1000
+
+
+def actions_by_speed(turns=50, seed=1):
+    # How often monsters of each speed act, per player turn.
+    player, entities, game_map = new_game(100, 80, 400, random.Random(seed))
+    player.stats.h = 10 ** 9
+    speeds = (NORMAL_SPEED // 2, NORMAL_SPEED, NORMAL_SPEED * 2)
+    monsters = [entity for entity in entities if isinstance(entity, Monster)]
+    for number, monster in enumerate(monsters):
+        monster.stats.speed = speeds[number % len(speeds)]
+
+    scheduler = TurnScheduler()
+    take_turn = Monster.take_turn
+    acted = Counter()
+    awake = Counter()
+
+    def counted_take_turn(monster, game_map, entities):
+        acted[monster.stats.speed] += 1
+        take_turn(monster, game_map, entities)
+
+    Monster.take_turn = counted_take_turn
+    try:
+        for turn in range(turns):
+            visible_map_chunk = get_visible_map_chunk(player, game_map, 800, 480)
+            player_turn({}, player, entities, game_map)
+            scheduler.monster_turn(player, entities, game_map, visible_map_chunk)
+            for monster in scheduler.entries:
+                awake[monster.stats.speed] += 1
+    finally:
+        Monster.take_turn = take_turn
+
+    return {speed: acted[speed] / max(awake[speed], 1) for speed in speeds}
+
+
+def main():
+    set_message_handler(None)
+    take_turn = Monster.take_turn
+
+    for title, replacement in (("Whole monster turn", take_turn), ("Choosing who acts only", lambda monster, game_map, entities: None)):
+        Monster.take_turn = replacement
+        print("{}, mean ms per turn".format(title))
+        print("{:>11} {:>9} {:>14} {:>14} {:>14} {:>14}".format("map", "monsters", "still", "still queue", "moving",
+                                                              "moving queue"))
+        for map_size, monster_count in (((200, 160), 1000), ((400, 320), 4000), ((1000, 1000), 20000)):
+            times = [time_turns(map_size, monster_count, scheduler, moving)
+                     for moving in (False, True) for scheduler in (None, TurnScheduler())]
+            print("{:>11} {:>9} {:>14.3f} {:>14.3f} {:>14.3f} {:>14.3f}".format("{}x{}".format(*map_size), monster_count, *times))
+        print()
+    Monster.take_turn = take_turn
+
+    print("Actions per player turn, by monster speed")
+    for speed, rate in actions_by_speed().items():
+        print("{:>6} {:>6.2f}".format(speed, rate))
+
+
+if __name__ == "__main__":
+    main()
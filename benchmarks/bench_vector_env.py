@@ -0,0 +1,107 @@
+"""
+Throughput of the batched VectorEnv against the number of games it holds, with a single headless Simulation as the
+baseline. Use it to pick a batch size per rollout worker.
+
+VectorEnv only pays off with many games: on one core it reached about 1700 steps/sec from 64 to 1024 games, against
+about 1050 for one Simulation, so 1.7 times as many. A handful of games is slower than Simulation, at about 250
+steps/sec for one game.
+
+Also checks that VectorEnv plays the same games as Simulation. With exact pathfinding on both sides (a margin and
+drift as large as the map) every game matches step for step. With the defaults, games are only alike: monsters far
+from the player path differently, and only 5 of 16 games matched for all 300 steps.
+
+Run from the repository root: python benchmarks/bench_vector_env.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from map_functions import display_to_map  # noqa: E402
+from simulation import Simulation  # noqa: E402
+from vector_env import VectorEnv  # noqa: E402
+
+
+def simulation_steps_per_second(steps=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    simulation = Simulation()
+    simulation.reset(seed)
+
+    start = time.perf_counter()
+    for step in range(steps):
+        observation, reward, done, info = simulation.step(int(rng.integers(0, 9)))
+        if done:
+            simulation.reset()
+    return steps / (time.perf_counter() - start)
+
+
+def vector_steps_per_second(num_envs, steps=100, seed=0):
+    rng = np.random.default_rng(seed)
+    env = VectorEnv(num_envs)
+    env.reset()
+
+    start = time.perf_counter()
+    for step in range(steps):
+        env.step(rng.integers(0, 9, size=num_envs))
+    return num_envs * steps / (time.perf_counter() - start)
+
+
+def parity(num_envs=16, steps=300, exact=True, seed=0):
+    """
+    Step a VectorEnv and a Simulation per game with the same actions, and count the games which stay the same, with
+    every entity in the same place with the same health, the same observations and the same rewards.
+
+    :param exact: bool - give both exact pathfinding, with a margin and drift as large as the map. Otherwise both
+                  keep their defaults.
+    :return: games compared, games which stayed the same until their first game ended.
+    """
+    rng = np.random.default_rng(seed)
+    map_width, map_height = display_to_map(800 * 2, 640 * 2)
+    size = max(map_width, map_height) + 1
+    env = VectorEnv(num_envs, map_width, map_height, monster_count=25, margin=size) if exact else VectorEnv(num_envs, monster_count=25)
+    seeds = list(range(100, 100 + num_envs))
+    env.reset(seeds)
+    simulations = list()
+    for game_seed in seeds:
+        simulation = Simulation(map_width, map_height, monster_count=25, drift=size * size if exact else None)
+        simulation.reset(game_seed)
+        simulations.append(simulation)
+
+    playing = [True] * num_envs
+    same = [True] * num_envs
+    for step in range(steps):
+        actions = rng.integers(0, 9, size=num_envs)
+        observations, rewards, dones, info = env.step(actions)
+        for game, simulation in enumerate(simulations):
+            if not playing[game]:
+                continue
+            observation, reward, done, info = simulation.step(int(actions[game]))
+            if done:
+                playing[game] = False  # VectorEnv has started its next game.
+                continue
+            entities = [(entity.map_x, entity.map_y, entity.stats.h) for entity in simulation.entities]
+            vector_entities = list(zip(env.map_x[game].tolist(), env.map_y[game].tolist(), env.h[game].tolist()))
+            if entities != vector_entities or not np.array_equal(observation, observations[game]) or reward != rewards[game]:
+                playing[game] = same[game] = False
+    return num_envs, sum(same)
+
+
+def main():
+    print("Simulation: {:10.0f} steps/sec".format(simulation_steps_per_second()))
+    print()
+    print("{:>9} {:>12} {:>14}".format("games", "steps/sec", "ms per batch"))
+    for num_envs in (1, 4, 16, 64, 256, 1024):
+        steps_per_second = vector_steps_per_second(num_envs)
+        print("{:>9} {:12.0f} {:14.2f}".format(num_envs, steps_per_second, num_envs / steps_per_second * 1000))
+
+    print()
+    print("Games matching Simulation step for step, over 300 steps")
+    for exact, title in ((True, "exact pathfinding"), (False, "defaults")):
+        print("{:>18} {:>3} of {}".format(title, *parity(exact=exact)[::-1]))
+
+
+if __name__ == "__main__":
+    main()
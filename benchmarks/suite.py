@@ -0,0 +1,263 @@
+"""
+Benchmark suite. Plays the game headlessly, the way engine.main does (render a frame, read input, player turn,
+monster turn), with input replayed from scripted key sequences instead of the keyboard. Covers a matrix of map
+sizes, monster counts and the fraction of monsters fleeing, and reports for each case:
+
+    turn latency   milliseconds for the player and monster turns, p50/p95/p99 and mean
+    frame time     milliseconds for render_all, p50/p95/p99 and mean
+    allocations    memory blocks and bytes still allocated per turn, and peak traced memory, from a second
+                   replay under tracemalloc (so the timings aren't slowed by it)
+    checksum       hash of where every entity ended up and its health, which only changes if game behaviour does
+
+Results are written as JSON, with the commit and library versions, so runs can be compared across commits:
+
+    python benchmarks/suite.py --output before.json
+    python benchmarks/suite.py --output after.json
+    python benchmarks/suite.py --compare before.json after.json
+
+Runs headless using the SDL dummy video driver. The player can't die, so every case plays the same number of turns.
+
+Run from the repository root: python benchmarks/suite.py [--quick] [--output file] [--compare old new]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import platform
+import itertools
+import subprocess
+import tracemalloc
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import pygame  # noqa: E402
+import input_functions  # noqa: E402
+from input_functions import handle_keys, ScriptedInput  # noqa: E402
+from classes import FLEE_THRESHOLD, Monster, set_message_handler  # noqa: E402
+from ai_functions import AIScheduler  # noqa: E402
+from game_functions import new_game, player_turn  # noqa: E402
+from map_functions import get_visible_map_chunk  # noqa: E402
+from profile_functions import Metric  # noqa: E402
+from render_functions import render_all, MapRenderCache, SpriteAtlas  # noqa: E402
+
+SCREEN_WIDTH, SCREEN_HEIGHT = 800, 640
+VIEW_PORT_WIDTH, VIEW_PORT_HEIGHT = 800, 480
+VIEW_PORT_X_OFFSET, VIEW_PORT_Y_OFFSET = 0, 50
+
+# Keys handle_keys turns into moves.
+MOVE_KEYS = (input_functions.K_UP, input_functions.K_DOWN, input_functions.K_LEFT, input_functions.K_RIGHT,
+             input_functions.K_Q, input_functions.K_W, input_functions.K_A, input_functions.K_S)
+
+# Matrices of cases: map sizes in tiles, monster counts and fractions of monsters which start out fleeing.
+MATRIX = {"map_sizes": ((100, 80), (200, 160), (400, 320)), "monster_counts": (10, 100, 1000), "flee_ratios": (0.0, 0.5)}
+QUICK_MATRIX = {"map_sizes": ((100, 80),), "monster_counts": (10, 1000), "flee_ratios": (0.0, 0.5)}
+
+
+def patrol_keys(turns, rng):
+    # Walk right and back again, which keeps the view port scrolling.
+    return [input_functions.K_RIGHT if turn % 20 < 10 else input_functions.K_LEFT for turn in range(turns)]
+
+
+def wander_keys(turns, rng):
+    # A random walk, with a key that isn't a move (so the player waits) now and then.
+    return [rng.choice(MOVE_KEYS + (pygame.K_SPACE,)) for turn in range(turns)]
+
+
+def wait_keys(turns, rng):
+    # Stand still and let the monsters come.
+    return [pygame.K_SPACE] * turns
+
+
+SCENARIOS = {"patrol": patrol_keys, "wander": wander_keys, "wait": wait_keys}
+
+
+def key_actions(keys):
+    # The actions handle_keys makes of a sequence of key presses.
+    return [handle_keys(pygame.event.Event(pygame.KEYDOWN, key=key)) for key in keys]
+
+
+def set_up_game(map_size, monster_count, flee_ratio, seed, sprites):
+    # A new game with a fraction of the monsters hurt badly enough to flee.
+    rng = random.Random(seed)
+    player, entities, game_map = new_game(map_size[0], map_size[1], monster_count, rng, sprites)
+    player.stats.h = player.stats.max_h = 10 ** 9  # Keep the player alive so every case plays every turn.
+
+    monsters = [entity for entity in entities if isinstance(entity, Monster)]
+    for monster in rng.sample(monsters, int(len(monsters) * flee_ratio)):
+        monster.stats.h = int(monster.stats.max_h * FLEE_THRESHOLD)
+        monster.check_state(player)
+    return player, entities, game_map
+
+
+def checksum(entities):
+    state = hashlib.sha1()
+    for entity in entities:
+        state.update("{},{},{};".format(entity.map_x, entity.map_y, entity.stats.h).encode())
+    return state.hexdigest()[:16]
+
+
+def play(screen_surface, sprites, case, trace_memory=False):
+    """
+    Play one case through to the end of its input.
+
+    :return: dict - frame and turn Metrics, the checksum and, with trace_memory, allocation numbers.
+    """
+    player, entities, game_map = set_up_game(case["map_size"], case["monsters"], case["flee_ratio"], case["seed"], sprites)
+    keys = SCENARIOS[case["scenario"]](case["turns"], random.Random(case["seed"]))
+    source = ScriptedInput(key_actions(keys))
+    render_cache = MapRenderCache(game_map, sprites)
+    scheduler = AIScheduler(seed=case["seed"])  # No time budget, so every run of a case plays out the same.
+    frames, turns = Metric("timer", case["turns"]), Metric("timer", case["turns"])
+
+    if trace_memory:
+        tracemalloc.start()
+        start_blocks, start_bytes = sys.getallocatedblocks(), tracemalloc.get_traced_memory()[0]
+
+    running = True
+    while running:
+        visible_map_chunk = get_visible_map_chunk(player, game_map, VIEW_PORT_WIDTH, VIEW_PORT_HEIGHT)
+
+        start = time.perf_counter()
+        render_all(screen_surface, SCREEN_WIDTH, SCREEN_HEIGHT, VIEW_PORT_WIDTH, VIEW_PORT_HEIGHT, VIEW_PORT_X_OFFSET,
+                   VIEW_PORT_Y_OFFSET, game_map, player, entities, visible_map_chunk, sprites, render_cache)
+        frames.add(time.perf_counter() - start)
+
+        action, running = source.get_action(running)
+        if action is None:
+            break
+
+        start = time.perf_counter()
+        player_turn(action, player, entities, game_map)
+        scheduler.monster_turn(player, entities, game_map, visible_map_chunk)
+        turns.add(time.perf_counter() - start)
+
+    result = {"frames": frames, "turns": turns, "checksum": checksum(entities)}
+    if trace_memory:
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["allocations"] = {"blocks_per_turn": (sys.getallocatedblocks() - start_blocks) / max(turns.count, 1),
+                                 "kb_per_turn": (current_bytes - start_bytes) / 1024 / max(turns.count, 1),
+                                 "peak_kb": peak_bytes / 1024}
+    scheduler.close()
+    return result
+
+
+def summarise(metric):
+    summary = metric.summary()
+    return {name: round(summary[name], 4) for name in ("p50", "p95", "p99", "mean", "max")}
+
+
+def environment():
+    # Where the results came from.
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit or None, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "numpy": np.__version__, "pygame": pygame.version.ver, "machine": platform.machine(), "cpus": os.cpu_count()}
+
+
+def cases(matrix, scenarios, turns, seed):
+    for scenario, map_size, monsters, flee_ratio in itertools.product(scenarios, matrix["map_sizes"], matrix["monster_counts"], matrix["flee_ratios"]):
+        yield {"name": "{} {}x{} monsters={} flee={}".format(scenario, map_size[0], map_size[1], monsters, flee_ratio),
+               "scenario": scenario, "map_size": list(map_size), "monsters": monsters, "flee_ratio": flee_ratio,
+               "turns": turns, "seed": seed}
+
+
+def run(matrix, scenarios, turns, seed, trace_memory=True):
+    pygame.init()
+    screen_surface = pygame.display.set_mode([SCREEN_WIDTH, SCREEN_HEIGHT])
+    sprites = SpriteAtlas(os.path.join(ROOT, "sprites", "monochrome.png")).sprites()
+    set_message_handler(None)
+
+    results = {"environment": environment(), "cases": list()}
+    print("{:45} {:>9} {:>9} {:>9} {:>9} {:>10} {:>10}".format("case", "turn p50", "turn p95", "frame p50", "frame p95", "KB/turn", "peak KB"))
+    for case in cases(matrix, scenarios, turns, seed):
+        played = play(screen_surface, sprites, case)
+        result = dict(case, turn_ms=summarise(played["turns"]), frame_ms=summarise(played["frames"]), checksum=played["checksum"])
+
+        if trace_memory:
+            traced = play(screen_surface, sprites, case, trace_memory=True)
+            if traced["checksum"] != played["checksum"]:
+                raise RuntimeError("{} played out differently the second time".format(case["name"]))
+            result["allocations"] = {name: round(value, 2) for name, value in traced["allocations"].items()}
+
+        results["cases"].append(result)
+        allocations = result.get("allocations", {})
+        print("{:45} {:9.2f} {:9.2f} {:9.2f} {:9.2f} {:>10} {:>10}".format(
+            case["name"], result["turn_ms"]["p50"], result["turn_ms"]["p95"], result["frame_ms"]["p50"], result["frame_ms"]["p95"],
+            allocations.get("kb_per_turn", "-"), allocations.get("peak_kb", "-")))
+
+    pygame.quit()
+    return results
+
+
+def compare(old_path, new_path, threshold=0.1):
+    """
+    Print how each case changed between two result files. Slowdowns beyond threshold and changed checksums are flagged.
+
+    :return: int - number of flagged cases.
+    """
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+    old_cases = {case["name"]: case for case in old["cases"]}
+
+    print("{} ({}) -> {} ({})".format(old_path, old["environment"]["commit"], new_path, new["environment"]["commit"]))
+    print("{:45} {:>12} {:>12} {:>12}  {}".format("case", "turn p50", "frame p50", "KB/turn", "notes"))
+    flagged = 0
+    for case in new["cases"]:
+        before = old_cases.get(case["name"])
+        if before is None:
+            continue
+
+        notes = list()
+        changes = list()
+        for key, name in (("turn_ms", "turn"), ("frame_ms", "frame")):
+            change = case[key]["p50"] / before[key]["p50"] - 1 if before[key]["p50"] else 0.0
+            changes.append("{:+.1%}".format(change))
+            if change > threshold:
+                notes.append("{} slower".format(name))
+        if "allocations" in case and "allocations" in before:
+            changes.append("{:+.1f}".format(case["allocations"]["kb_per_turn"] - before["allocations"]["kb_per_turn"]))
+        else:
+            changes.append("-")
+        if case["checksum"] != before["checksum"]:
+            notes.append("behaviour changed")
+
+        flagged += bool(notes)
+        print("{:45} {:>12} {:>12} {:>12}  {}".format(case["name"], *changes, ", ".join(notes)))
+    return flagged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmark suite with scripted input.")
+    parser.add_argument("--quick", action="store_true", help="a small matrix, for a fast check")
+    parser.add_argument("--scenarios", nargs="+", default=["patrol"], choices=sorted(SCENARIOS))
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc replay")
+    parser.add_argument("--output", default="benchmark_results.json", help="file to write results to")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files instead of running")
+    arguments = parser.parse_args()
+
+    if arguments.compare:
+        sys.exit(1 if compare(*arguments.compare) else 0)
+
+    results = run(QUICK_MATRIX if arguments.quick else MATRIX, arguments.scenarios, arguments.turns, arguments.seed,
+                  trace_memory=not arguments.no_memory)
+    with open(arguments.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print("Results written to {}".format(arguments.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,127 @@
-import pygame
+from contextlib import contextmanager
 from copy import copy
 import numpy as np
 import math
+from pathfinding import NEIGHBOURS
+from profile_functions import timed
+
+
+# Monsters flee when their health drops to this fraction of their maximum.
+FLEE_THRESHOLD = 0.25
+
+# Speed of the player and of most monsters. Entities with twice this speed act twice as often, see turn_functions.
+NORMAL_SPEED = 100
+
+# Combat messages are passed to this function. Set it to None (e.g. for headless simulations) to silence them.
+message_handler = print
+
+
+def set_message_handler(handler):
+    global message_handler
+    message_handler = handler
+
+
+@contextmanager
+def messages_to(handler):
+    # Send combat messages to handler inside a with block, then put the previous handler back.
+    global message_handler
+    previous = message_handler
+    message_handler = handler
+    try:
+        yield
+    finally:
+        message_handler = previous
+
+
+# Surfaces shared by every entity drawn with the same sprite (or colour, if there is no sprite).
+shared_surfaces = dict()
+
+
+def get_shared_surface(sprite, colour):
+    key = sprite if sprite else tuple(colour)
+    surface = shared_surfaces.get(key)
+
+    if surface is None:
+        import pygame  # Only needed for drawing.
+        surface = pygame.Surface((16, 16))
+
+        # If there is a sprite, blit it to the surface. If not, just fill with a block of colour.
+        if sprite:
+            surface.blit(sprite, (0, 0))
+        else:
+            surface.fill(colour)
+        shared_surfaces[key] = surface
+
+    return surface
 
 
 # Get the entity currently occupying the destination tile. Or return None.
 def get_blocking_entities(entities, destination_map_x, destination_map_y):
+    if isinstance(entities, EntityIndex):
+        return entities.blocking_at(destination_map_x, destination_map_y)
+
     for entity in entities:
         if entity.blocks and entity.map_x == destination_map_x and entity.map_y == destination_map_y:
             return entity
     return None
 
 
-class Entity(pygame.sprite.Sprite):
+# Get the entities inside a rect of the map (inclusive, like MapChunk), in the order they were added.
+def get_entities_in_rect(entities, x1, x2, y1, y2):
+    if isinstance(entities, EntityIndex):
+        return entities.in_rect(x1, x2, y1, y2)
+
+    return [entity for entity in entities if x1 <= entity.map_x <= x2 and y1 <= entity.map_y <= y2]
+
+
+# Get the entities inside a map chunk, e.g. the ones visible in the view port.
+def get_entities_in_chunk(entities, map_chunk):
+    if isinstance(entities, EntityIndex):
+        return entities.in_chunk(map_chunk)
+
+    return [entity for entity in entities if entity in map_chunk]
+
+
+class Column:
+    """
+    An attribute kept in a column of an EntityStore while its owner is in a store, and on the owner itself until then.
+    Owners need store and slot attributes.
+    """
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.detached_name = "_" + name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        store = instance.store
+        if store is None:
+            return instance.__dict__[self.detached_name]
+        return store.__dict__[self.name].item(instance.slot)
+
+    def __set__(self, instance, value):
+        store = instance.store
+        if store is None:
+            instance.__dict__[self.detached_name] = value
+        else:
+            store.__dict__[self.name][instance.slot] = value
+
+
+class Entity:
     """
     This is the root class for all game entities.
     All entities have a name, a map location, and eventually a sprite which will be stored here too.
+    Graphics are only created when something draws the entity, so the game rules can run without pygame.
+    Once the entity is added to an EntityStore (which EntityIndex does), its map position and stats live in the store.
     """
+    map_x = Column()
+    map_y = Column()
+    blocks = Column()  # Does it block movement?
+
     def __init__(self, name, map_x, map_y, colour, sprite=None, stats=None):
-        super().__init__()
+        self.store = None  # The EntityStore holding this entity's data, if any.
+        self.slot = None  # Row of the store.
+
         # Set up flavour stuff.
         self.name = name
         self.colour = colour
@@ -27,21 +130,20 @@ class Entity(pygame.sprite.Sprite):
         # Set up map and game objects.
         self.map_x = map_x
         self.map_y = map_y
-        self.blocks = True  # Does it block movement?
-
-        # Set up graphics.
-        self.surf = pygame.Surface((16, 16))
+        self.blocks = True
+        self.index = None  # The EntityIndex tracking this entity's position, if any.
 
         # Stats n stuff
         self.stats = stats
 
-        # If there is a sprite, blit it to the instance's surface. If not, just fill with a block of colour.
-        if self.sprite:
-            self.surf.blit(self.sprite, (0, 0))
-        else:
-            self.surf.fill(self.colour)
+    @property
+    def surf(self):
+        # Entities with the same sprite share one surface, created on first use.
+        return get_shared_surface(self.sprite, self.colour)
 
-        self.rect = self.surf.get_rect()
+    @property
+    def rect(self):
+        return self.surf.get_rect()
 
     def get_map_position(self):
         # Simply returns the current map coordinates as integers.
@@ -49,12 +151,17 @@ class Entity(pygame.sprite.Sprite):
 
     def move(self, dx, dy):
         # Alter position on map by the amount in the parameters.
+        old_map_x, old_map_y = self.map_x, self.map_y
         self.map_x += dx
         self.map_y += dy
 
+        if self.index is not None:
+            self.index.moved(self, old_map_x, old_map_y)  # Keep the spatial index in sync.
+
     def attack(self, attack_target):
         damage = self.stats.s - attack_target.stats.d
-        print("{} attacks {} for {} damage.".format(self.name, attack_target.name, damage))
+        if message_handler:
+            message_handler("{} attacks {} for {} damage.".format(self.name, attack_target.name, damage))
         attack_target.take_damage(damage)
 
     def distance_to(self, other):
@@ -78,26 +185,46 @@ class Monster(Entity):
     """
     Monster class contains routines for AI and other things.
     """
+    flee = Column()  # Is the monster currently fleeing?
+
     def __init__(self, name, map_x, map_y, colour, game_map, sprite=None, target=None, stats=None):
         super().__init__(name, map_x, map_y, colour, sprite, stats)
-        self.flee = False  # Is the monster currently fleeing?
+        self.flee = False
         self.target = target  # The monster's target (usually the player) chase and attack.
-        self.dijkstra = np.array([[None for y in range(game_map.height + 1)] for x in range(game_map.width + 1)], dtype=float)
+        self.dijkstra = None  # Pathfinding map shared through game_map.flow_fields, fetched each turn.
+        self.avoid = set()  # Tiles occupied by other entities this turn.
+
+    @property
+    def target(self):
+        return self._target
+
+    @target.setter
+    def target(self, target):
+        self._target = target
+        if self.store is not None:
+            self.store.set_target(self.slot, target)  # Keep the store's target column in step.
 
     def check_state(self, target):
-        # TODO make the 0.25 flee threshold a creature stat.
+        # TODO make the flee threshold a creature stat. See also EntityStore.check_flee.
 
-        if self.stats.h <= int(self.stats.max_h * 0.25) and not self.flee:
+        if self.stats.h <= int(self.stats.max_h * FLEE_THRESHOLD) and not self.flee:
             self.flee = True
 
-        if self.flee and self.stats.h > int(self.stats.max_h * 0.25):
+        if self.flee and self.stats.h > int(self.stats.max_h * FLEE_THRESHOLD):
             self.flee = False
 
     # Main Monster AI routine.
+    @timed("take_turn")
     def take_turn(self, game_map, entities):
         self.update_dijkstra_map(game_map, self.target, entities)  # Update pathfinding map.
         dx, dy = self.calculate_path()  # Calculate the most appropriate tile to move into, return relative values.
+        self.act(dx, dy, game_map, entities)
 
+    def act(self, dx, dy, game_map, entities):
+        """
+        Carry out a chosen move: step by dx, dy if the way is clear, otherwise attack the target if it's in reach.
+        Ends the monster's turn.
+        """
         # Calculate destination coordinates.
         destination_x = self.map_x + dx
         destination_y = self.map_y + dy
@@ -113,66 +240,465 @@ class Monster(Entity):
         self.check_state(self.target)  # Check state - fleeing, death, etc
 
     # Update the pathfinding map.
+    @timed("update_dijkstra_map")
     def update_dijkstra_map(self, game_map, target, entities):
-        # Initialise a NoneType array for the game map.
-        self.dijkstra[target.map_x, target.map_y] = 0  # Set target's location to value of 0.
-
-        # Iterate through all map tiles and set the value of the tile to the distance (in tiles) away from the target.
-        for x, y in game_map:
-            if not game_map.blocked[x, y]:
-                x_distance = x - target.map_x
-                y_distance = y - target.map_y
-
-                if x_distance < 0:
-                    x_distance = x_distance * -1
-
-                if y_distance < 0:
-                    y_distance = y_distance * -1
-
-                self.dijkstra[x, y] = x_distance + y_distance
-
-        # Blank out other monsters so AI doesn't try to move there
-        for entity in entities:
-            if entity is not target:
-                self.dijkstra[entity.map_x, entity.map_y] = None
-
+        # Pathfinding maps are shared by every monster with the same target, so fetch rather than build one.
         if self.flee:
-            self.dijkstra = self.dijkstra * -1.2
+            self.dijkstra = game_map.flow_fields.flee_map(target)
+        else:
+            self.dijkstra = game_map.flow_fields.chase_map(target)
+
+        # Note other entities next to the monster so the AI doesn't try to move there.
+        # The shared map itself can't be blanked out.
+        neighbours = get_entities_in_rect(entities, self.map_x - 1, self.map_x + 1, self.map_y - 1, self.map_y + 1)
+        self.avoid = {(entity.map_x, entity.map_y) for entity in neighbours if entity is not target}
 
+    @timed("calculate_path")
     def calculate_path(self):
         """
-        Calculate the best path towards the player based on the passed Dijkstra array of steps (integers).
+        Calculate the best path towards the player based on the Dijkstra map of steps.
 
         :return: dx and dy (integers) which dictate modifications to monsters x and y map coordinates.
         """
+        best_value = np.inf
+        best_move = (0, 0)  # Stay put if there is nowhere to go.
 
-        # Create a dictionary -
-        # Keys are the Dijkstra value (no. steps that tile is away from player).
-        # Values are the position of the tile relative to the monster (dx and dy values)
-        cell = dict()
-        cell[self.dijkstra[(self.map_x - 1, self.map_y - 1)]] = (-1, -1)
-        cell[self.dijkstra[(self.map_x, self.map_y - 1)]] = (0, -1)
-        cell[self.dijkstra[(self.map_x + 1, self.map_y - 1)]] = (1, -1)
-        cell[self.dijkstra[(self.map_x - 1, self.map_y)]] = (-1, 0)
-        cell[self.dijkstra[(self.map_x, self.map_y)]] = (0, 0)
-        cell[self.dijkstra[(self.map_x, self.map_y + 1)]] = (0, 1)
-        cell[self.dijkstra[(self.map_x - 1, self.map_y + 1)]] = (-1, 1)
-        cell[self.dijkstra[(self.map_x + 1, self.map_y)]] = (1, 0)
-        cell[self.dijkstra[(self.map_x + 1, self.map_y + 1)]] = (1, 1)
+        # Only the 3x3 neighbourhood of the shared map is needed.
+        map_x, map_y = self.map_x, self.map_y
+        window = self.dijkstra.neighbourhood(map_x, map_y)
 
-        viable_tiles = [key for key in cell.keys() if str(key) != "nan"]  # Remove walls which are NoneType not int
+        # Pick the neighbouring tile with the lowest value aka the shortest path to the player (or away from them).
+        for dx, dy in NEIGHBOURS:
+            if (map_x + dx, map_y + dy) in self.avoid:
+                continue
 
-        dx, dy = cell[min(viable_tiles)]  # Return the lowest key value aka the shortest path to player.
+            value = window[dx + 1][dy + 1]  # Walls and unreachable tiles are inf so will never be chosen.
+            if value < best_value:
+                best_value = value
+                best_move = (dx, dy)
 
-        return dx, dy
+        return best_move
 
 
 class StatBlock:
-    def __init__(self, h, m, s, d):
+    h = Column()
+    m = Column()
+    s = Column()
+    d = Column()
+    max_h = Column()
+    max_m = Column()
+    speed = Column()
+
+    def __init__(self, h, m, s, d, speed=NORMAL_SPEED):
+        self.store = None  # Stats live in the same row of an EntityStore as their entity, once it is in one.
+        self.slot = None
+
         self.h = h
         self.m = m
         self.s = s
         self.d = d
+        self.speed = speed  # How often the entity acts, with NORMAL_SPEED acting once a turn.
 
         self.max_h = h
         self.max_m = m
+
+
+class EntityStore:
+    """
+    Entity data held as numpy columns, one row (slot) per entity, so data for a whole population can be read and
+    changed at once. Entity, Monster and StatBlock objects in the store are views of their row.
+    Rows of removed entities are reused.
+    """
+    # Column name -> (dtype, value for a new row).
+    COLUMNS = {"map_x": (np.int32, 0), "map_y": (np.int32, 0), "blocks": (bool, False),
+               "h": (np.int32, 0), "m": (np.int32, 0), "s": (np.int32, 0), "d": (np.int32, 0),
+               "max_h": (np.int32, 0), "max_m": (np.int32, 0), "speed": (np.int32, 0),
+               "flee": (bool, False), "target": (np.int32, -1), "sprite": (np.int16, -1),
+               "used": (bool, False)}
+
+    # Columns copied from and to each kind of object when it is added or removed.
+    ENTITY_COLUMNS = ("map_x", "map_y", "blocks")
+    MONSTER_COLUMNS = ("flee",)
+    STAT_COLUMNS = ("h", "m", "s", "d", "max_h", "max_m", "speed")
+
+    def __init__(self, capacity=64):
+        self.capacity = 0
+        self.entities = list()  # Slot -> entity, or None for a free slot.
+        self.free_slots = list()
+        self.sprites = list()  # Sprite id -> (sprite, colour).
+        self.sprite_ids = dict()
+        self.waiting = dict()  # Entity outside the store -> slots of monsters targeting it.
+
+        for name, (dtype, default) in self.COLUMNS.items():
+            setattr(self, name, np.zeros(0, dtype=dtype))
+        self.grow(capacity)
+
+    def __len__(self):
+        return len(self.entities) - len(self.free_slots)
+
+    def grow(self, capacity):
+        # Make room for at least capacity entities.
+        if capacity <= self.capacity:
+            return
+
+        for name, (dtype, default) in self.COLUMNS.items():
+            column = np.full(capacity, default, dtype=dtype)
+            column[:self.capacity] = getattr(self, name)
+            setattr(self, name, column)
+        self.capacity = capacity
+
+    def add(self, entity):
+        """
+        Move an entity's data into the store. The entity and its stats become views of their new row.
+
+        :param entity: Entity not in any store.
+        :return: int - the entity's slot.
+        """
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.entities[slot] = entity
+        else:
+            slot = len(self.entities)
+            if slot >= self.capacity:
+                self.grow(max(slot + 1, self.capacity * 2))
+            self.entities.append(entity)
+
+        self.used[slot] = True
+        self.sprite[slot] = self.sprite_id(entity.sprite, entity.colour)
+        # Attach the entity's columns in one go: once attached, the entity reads its columns from the store.
+        if isinstance(entity, Monster):
+            self.attach(entity, slot, self.ENTITY_COLUMNS + self.MONSTER_COLUMNS)
+            self.set_target(slot, entity.target)
+        else:
+            self.attach(entity, slot, self.ENTITY_COLUMNS)
+        if entity.stats is not None:
+            self.attach(entity.stats, slot, self.STAT_COLUMNS)
+
+        # Monsters which were already after this entity can now point at its row.
+        for other in self.waiting.pop(entity, ()):
+            if self.entities[other] is not None and self.entities[other].target is entity:
+                self.target[other] = slot
+
+        return slot
+
+    def remove(self, entity):
+        # Copy an entity's data back to the entity, and free its row.
+        slot = entity.slot
+        if entity.stats is not None:
+            self.detach(entity.stats, self.STAT_COLUMNS)
+        if isinstance(entity, Monster):
+            self.detach(entity, self.ENTITY_COLUMNS + self.MONSTER_COLUMNS)
+        else:
+            self.detach(entity, self.ENTITY_COLUMNS)
+
+        # Monsters after the entity wait for it to come back.
+        targeting = np.flatnonzero(self.target[:len(self.entities)] == slot)
+        if len(targeting):
+            self.target[targeting] = -1
+            self.waiting.setdefault(entity, list()).extend(targeting.tolist())
+
+        for name, (dtype, default) in self.COLUMNS.items():
+            getattr(self, name)[slot] = default
+        self.entities[slot] = None
+        self.free_slots.append(slot)
+
+    @classmethod
+    def from_columns(cls, kinds, names, colours, sprites, has_stats, columns):
+        """
+        A store of new entities made from whole columns of their data, e.g. when loading a game. Much quicker than
+        adding thousands of entities one at a time, as the columns are copied in one go and the entities are made as
+        views of their rows without going through __init__.
+
+        :param kinds: list of the class of each entity: Entity, Player or Monster.
+        :param names: list of each entity's name.
+        :param colours: list of each entity's colour, as a tuple.
+        :param sprites: list of each entity's sprite, or None.
+        :param has_stats: list of bool - which entities have a StatBlock.
+        :param columns: dict of column name -> array of a value per entity. Columns left out keep their defaults.
+                        Targets are rows of the new store.
+        :return: the store, with entity n in row n.
+        """
+        count = len(kinds)
+        store = cls(count)
+        for name, values in columns.items():
+            getattr(store, name)[:count] = values
+        store.used[:count] = True
+
+        # Rows without stats, or of entities which aren't monsters, hold the defaults, as they would after add.
+        no_stats = ~np.array(has_stats, dtype=bool)
+        for name in cls.STAT_COLUMNS:
+            getattr(store, name)[:count][no_stats] = cls.COLUMNS[name][1]
+        monsters = np.array([issubclass(kind, Monster) for kind in kinds], dtype=bool)
+        for name in cls.MONSTER_COLUMNS + ("target",):
+            getattr(store, name)[:count][~monsters] = cls.COLUMNS[name][1]
+
+        new = object.__new__
+        entities = store.entities
+        for slot, (kind, name, colour, sprite, stats, monster) in enumerate(zip(kinds, names, colours, sprites,
+                                                                                has_stats, monsters.tolist())):
+            entity = new(kind)
+            if stats:
+                stats = new(StatBlock)
+                stats.__dict__ = {"store": store, "slot": slot}
+            else:
+                stats = None
+            if monster:
+                entity.__dict__ = {"store": store, "slot": slot, "name": name, "colour": colour, "sprite": sprite,
+                                   "index": None, "stats": stats, "_target": None, "dijkstra": None, "avoid": set()}
+            else:
+                entity.__dict__ = {"store": store, "slot": slot, "name": name, "colour": colour, "sprite": sprite,
+                                   "index": None, "stats": stats}
+            entities.append(entity)
+        store.sprite[:count] = [store.sprite_id(sprite, colour) for sprite, colour in zip(sprites, colours)]
+
+        # Targets are set once every entity exists, without the setter as the target column already has them.
+        targets = store.target[:count]
+        for slot, target in zip(np.flatnonzero(targets >= 0).tolist(), targets[targets >= 0].tolist()):
+            entities[slot].__dict__["_target"] = entities[target]
+        return store
+
+    def set_target(self, slot, target):
+        # Targets outside the store are -1 in the target column until they are added.
+        self.target[slot] = self.slot_of(target)
+        if target is not None and target.store is not self:
+            self.waiting.setdefault(target, list()).append(slot)
+
+    def attach(self, owner, slot, columns):
+        attributes = owner.__dict__
+        for name in columns:
+            getattr(self, name)[slot] = attributes.pop("_" + name)  # Column.detached_name, no longer needed.
+        owner.store = self
+        owner.slot = slot
+
+    def detach(self, owner, columns):
+        values = [getattr(owner, name) for name in columns]
+        owner.store = None
+        owner.slot = None
+        for name, value in zip(columns, values):
+            setattr(owner, name, value)
+
+    def entity(self, slot):
+        return self.entities[slot] if slot >= 0 else None
+
+    def slot_of(self, entity):
+        # Row of an entity, or -1 for None or entities in other stores.
+        if entity is not None and entity.store is self:
+            return entity.slot
+        return -1
+
+    def sprite_id(self, sprite, colour):
+        # Number for each distinct look, shared by the entities which have it.
+        key = sprite if sprite else tuple(colour)
+        sprite_id = self.sprite_ids.get(key)
+        if sprite_id is None:
+            sprite_id = self.sprite_ids[key] = len(self.sprites)
+            self.sprites.append((sprite, colour))
+        return sprite_id
+
+    def slots(self):
+        # Rows in use.
+        return np.flatnonzero(self.used[:len(self.entities)])
+
+    def in_rect(self, x1, x2, y1, y2):
+        # Rows of entities inside a rect of the map, including the edges.
+        count = len(self.entities)
+        map_x, map_y = self.map_x[:count], self.map_y[:count]
+        return np.flatnonzero(self.used[:count] & (map_x >= x1) & (map_x <= x2) & (map_y >= y1) & (map_y <= y2))
+
+    def clone(self):
+        """
+        A copy of the store, with a copy of every entity in it (and its stats) as a view of the new store's rows.
+        Monsters' targets are moved over to the copies.
+
+        :return: the new store, and a dict of entity -> its copy.
+        """
+        store = copy(self)
+        for name in self.COLUMNS:
+            setattr(store, name, getattr(self, name).copy())
+        store.free_slots = list(self.free_slots)
+        store.sprites = list(self.sprites)
+        store.sprite_ids = dict(self.sprite_ids)
+
+        # Copies are made by copying each object's attributes, which is much quicker than copy.copy for thousands of
+        # entities.
+        new = object.__new__
+        entity_map = dict()
+        store.entities = copies = list()
+        for entity in self.entities:
+            if entity is None:
+                copies.append(None)
+                continue
+            entity_copy = entity_map[entity] = new(type(entity))
+            entity_copy.__dict__.update(entity.__dict__)
+            entity_copy.store = store
+            stats = entity.stats
+            if stats is not None:
+                entity_copy.stats = stats_copy = new(type(stats))
+                stats_copy.__dict__.update(stats.__dict__)
+                stats_copy.store = store
+            copies.append(entity_copy)
+
+        # Targets in the store are held in the target column as well, which the copy already has, so set them without
+        # the setter. Targets outside the store stay as they are. Monsters' dijkstra and avoid are shared: they are
+        # replaced, never changed, at the start of each turn.
+        targets = self.target[:len(copies)]
+        targeting = np.flatnonzero(targets >= 0)
+        for slot, target in zip(targeting.tolist(), targets[targeting].tolist()):
+            copies[slot].__dict__["_target"] = copies[target]
+        store.waiting = {entity_map.get(target, target): list(slots) for target, slots in self.waiting.items()}
+        return store, entity_map
+
+    def monsters(self):
+        # Bool array of which rows hold monsters, one per row in use or freed.
+        return np.array([isinstance(entity, Monster) for entity in self.entities], dtype=bool)
+
+    def check_flee(self, slots=None):
+        """
+        Monster.check_state for many monsters at once.
+
+        :param slots: array of rows of monsters to update, or None for every monster in the store.
+        """
+        if slots is None:
+            slots = np.flatnonzero(self.monsters())
+        self.flee[slots] = self.h[slots] <= (self.max_h[slots] * FLEE_THRESHOLD).astype(np.int32)
+
+
+class EntityIndex:
+    """
+    Keeps the game's entities in a list, along with a spatial hash of where they are on the map, so entities can be
+    found by tile or by area without checking every entity. Entities in the index keep it up to date when they move.
+    Can be used anywhere a plain list of entities is expected. Entity data is kept in an EntityStore, see store.
+    """
+    def __init__(self, entities=(), bucket_size=16, store=None):
+        self.store = store if store is not None else EntityStore()  # Columns of entity data.
+        self.bucket_size = bucket_size  # Width and height in tiles of each spatial hash bucket.
+        self.entities = list()
+        self.tiles = dict()  # (x, y) -> list of entities on that tile.
+        self.buckets = dict()  # (x // bucket_size, y // bucket_size) -> set of entities in that block of tiles.
+        self.order = dict()  # Entity -> number, so area queries return entities in the order they were added.
+        self.next_order = 0
+
+        for entity in entities:
+            self.append(entity)
+
+    def __iter__(self):
+        return iter(self.entities)
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __getitem__(self, item):
+        return self.entities[item]
+
+    def __contains__(self, entity):
+        return entity in self.order
+
+    def clone(self):
+        """
+        A copy of the index and of every entity in it, for branching a game, e.g. to look ahead in a search.
+
+        :return: the new index, and a dict of entity -> its copy.
+        """
+        store, entity_map = self.store.clone()
+        index = copy(self)
+        index.store = store
+        copy_of = entity_map.__getitem__
+        index.entities = list(map(copy_of, self.entities))
+        index.tiles = {tile: list(map(copy_of, entities)) for tile, entities in self.tiles.items()}
+        index.buckets = {bucket: set(map(copy_of, entities)) for bucket, entities in self.buckets.items()}
+        index.order = dict(zip(index.entities, map(self.order.__getitem__, self.entities)))
+        for entity in index.entities:
+            entity.index = index
+        return index, entity_map
+
+    def append(self, entity):
+        # Spawn an entity.
+        self.entities.append(entity)
+        self.order[entity] = self.next_order
+        self.next_order += 1
+        self.store.add(entity)
+        self.add_position(entity, entity.map_x, entity.map_y)
+        entity.index = self
+
+    def add_stored(self):
+        # Track the entities already in the store, in the order of their rows, e.g. after EntityStore.from_columns.
+        entities = [entity for entity in self.store.entities if entity is not None and entity.index is None]
+        slots = [entity.slot for entity in entities]
+        map_x, map_y = self.store.map_x[slots], self.store.map_y[slots]
+        tiles, buckets = self.tiles, self.buckets
+        for entity, tile, bucket in zip(entities, zip(map_x.tolist(), map_y.tolist()),
+                                        zip((map_x // self.bucket_size).tolist(), (map_y // self.bucket_size).tolist())):
+            tiles.setdefault(tile, list()).append(entity)
+            buckets.setdefault(bucket, set()).add(entity)
+            entity.index = self
+
+        self.entities.extend(entities)
+        self.order.update(zip(entities, range(self.next_order, self.next_order + len(entities))))
+        self.next_order += len(entities)
+
+    def remove(self, entity):
+        # Despawn an entity.
+        self.remove_position(entity, entity.map_x, entity.map_y)
+        self.entities.remove(entity)
+        del self.order[entity]
+        self.store.remove(entity)
+        entity.index = None
+
+    def moved(self, entity, old_map_x, old_map_y):
+        # Called by Entity.move.
+        self.remove_position(entity, old_map_x, old_map_y)
+        self.add_position(entity, entity.map_x, entity.map_y)
+
+    def add_position(self, entity, map_x, map_y):
+        self.tiles.setdefault((map_x, map_y), list()).append(entity)
+        bucket = (map_x // self.bucket_size, map_y // self.bucket_size)
+        self.buckets.setdefault(bucket, set()).add(entity)
+
+    def remove_position(self, entity, map_x, map_y):
+        tile = self.tiles[(map_x, map_y)]
+        tile.remove(entity)
+        if not tile:
+            del self.tiles[(map_x, map_y)]
+
+        bucket_key = (map_x // self.bucket_size, map_y // self.bucket_size)
+        bucket = self.buckets[bucket_key]
+        bucket.discard(entity)
+        if not bucket:
+            del self.buckets[bucket_key]
+
+    def at(self, map_x, map_y):
+        # All the entities on a tile.
+        return list(self.tiles.get((map_x, map_y), ()))
+
+    def blocking_at(self, map_x, map_y):
+        # The entity blocking a tile, or None.
+        for entity in self.tiles.get((map_x, map_y), ()):
+            if entity.blocks:
+                return entity
+        return None
+
+    def in_rect(self, x1, x2, y1, y2):
+        # Entities inside a rect of the map, including the edges. Quickest for small rects, e.g. a monster's neighbours.
+        found = list()
+        for bucket_x in range(x1 // self.bucket_size, x2 // self.bucket_size + 1):
+            for bucket_y in range(y1 // self.bucket_size, y2 // self.bucket_size + 1):
+                for entity in self.buckets.get((bucket_x, bucket_y), ()):
+                    if x1 <= entity.map_x <= x2 and y1 <= entity.map_y <= y2:
+                        found.append(entity)
+
+        found.sort(key=self.order.__getitem__)
+        return found
+
+    def in_chunk(self, map_chunk):
+        # Entities inside a MapChunk. Tests every entity's position at once, which beats the buckets for view port
+        # sized chunks with many entities.
+        entities = self.store.entities
+        found = [entities[slot] for slot in self.store.in_rect(map_chunk.x1, map_chunk.x2, map_chunk.y1, map_chunk.y2).tolist()]
+        found.sort(key=self.order.__getitem__)
+        return found
+
+    def within_radius(self, map_x, map_y, radius):
+        # Entities within a straight line distance of a tile, as measured by Entity.distance_to.
+        reach = int(radius)
+        return [entity for entity in self.in_rect(map_x - reach, map_x + reach, map_y - reach, map_y + reach)
+                if (entity.map_x - map_x) ** 2 + (entity.map_y - map_y) ** 2 <= radius ** 2]
@@ -2,16 +2,39 @@
 A simple game.
 """
 
+import random
 import pygame
-from input_functions import handle_keys, get_inputs
-from render_functions import render_all
-from classes import Player, Monster, get_blocking_entities, StatBlock
-from map_functions import GameMap, display_to_map, get_visible_map_chunk
-from random import randint
+from input_functions import ActionLog, LiveInput, RecordedInput
+from render_functions import render_all, MapRenderCache, SpriteAtlas, SPRITE_TILES
+from map_functions import display_to_map, get_visible_map_chunk
+from game_functions import new_game, player_turn
 from game_states import Turn
-
-
-def main():
+from ai_functions import AIScheduler
+from fov_functions import sight_radius
+from profile_functions import profiler
+
+
+def main(event_driven=True, max_fps=None, idle_timeout=None, monster_time_budget=0.01, profile=False, seed=None,
+         record=None, replay=None, fast_forward=True):
+    """
+    Run the game.
+
+    :param event_driven: bool - sleep until input arrives and only render when something has changed.
+                         If False, poll for input and render as fast as possible.
+    :param max_fps: int - optional cap on the number of frames rendered per second.
+    :param idle_timeout: int - when event driven, wake up at least this often (milliseconds) even without input.
+    :param monster_time_budget: float - seconds the monster turn may take before the next frame. Monsters which don't
+                                get to act go first next turn. None lets every monster act every turn.
+    :param profile: bool - start with the profiler on and its readout in the top HUD. F1 switches it at any time.
+    :param seed: int - seed for the map, monsters and the order monsters act in. Random if None.
+    :param record: str - path to save an ActionLog of the game to when it ends.
+    :param replay: str - path of an ActionLog to play back before taking input from the keyboard. The game is made
+                   with the log's settings.
+    :param fast_forward: bool - don't render the game while playing back a log.
+    """
+
+    if profile:
+        profiler.enable()
 
     # Initialise pygame.
     pygame.init()
@@ -21,12 +44,9 @@ def main():
     screen_height = 640
     screen_surface = pygame.display.set_mode([screen_width, screen_height])
 
-    # Set up sprites:
-    SPR_TREE = pygame.image.load('Sprites\\tree.png').convert_alpha()
-    SPR_PLAYER = pygame.image.load('Sprites\\player.png').convert_alpha()
-    SPR_ORC = pygame.image.load('Sprites\\orc.png').convert_alpha()
-
-    sprites = {"player": SPR_PLAYER, "tree": SPR_TREE, "orc": SPR_ORC}
+    # Set up sprites, cut from one tileset.
+    sprite_atlas = SpriteAtlas('Sprites\\monochrome.png')
+    sprites = sprite_atlas.sprites(SPRITE_TILES)
 
     # Set up view port constants for the area which will display the game map. HUD dimensions are derived from this.
     view_port_width = 800
@@ -34,101 +54,121 @@ def main():
     view_port_x_offset = 0
     view_port_y_offset = 50
 
-    # Calculate a simple map which is double the screen size to test scrolling.
-    map_width, map_height = display_to_map(screen_width * 2, screen_height * 2)  # Map size in 16px by 16px tiles
-
-    # Create player and map objects.
-    player_stats = StatBlock(h=100, m=0, s=10, d=10)
-    player = Player("Player", map_x=randint(1, map_width - 1), map_y=randint(1, map_height - 1), colour=(0, 255, 0), sprite=SPR_PLAYER, stats=player_stats)
-    game_map = GameMap(map_width, map_height)  # Create a game map.
-
-    # Create some random noise in the map.
-    for x, y in game_map:
-        if randint(1, 10) == 1:
-            game_map.blocked[x, y] = True
-
-    # List to store all the game entities. Populate with player.
-    entities = list()
-    entities.append(player)
-
-    # Add some basic monsters.
-    for mon in range(10):
-        name = "Orc " + str(mon + 1)
-        mon_stats = StatBlock(h=10, m=0, s=12, d=8)
-        mon = Monster(name, map_x=randint(1, map_width - 1), map_y=randint(1, map_height - 1), colour=(255, 0, 0), game_map=game_map, sprite=SPR_ORC, stats=mon_stats)
-        entities.append(mon)
+    # Input from the keyboard, after playing back a log if there is one.
+    live_input = LiveInput(wait=event_driven, timeout=idle_timeout)
+    if replay:
+        log = ActionLog.load(replay)
+        settings = log.settings
+        input_source = RecordedInput(log)
+    else:
+        # Calculate a simple map which is double the screen size to test scrolling.
+        map_width, map_height = display_to_map(screen_width * 2, screen_height * 2)  # Map size in 16px by 16px tiles
+        # With line of sight, only monsters the player can see act, so walls hide them. The sight radius reaches
+        # across the whole view port, so monsters in view don't need to be any closer to act than before.
+        settings = {"seed": random.randrange(2 ** 32) if seed is None else seed, "map_width": map_width,
+                    "map_height": map_height, "monster_count": 10, "generator": "noise",
+                    "view_port_width": view_port_width, "view_port_height": view_port_height, "line_of_sight": True,
+                    "sight_radius": sight_radius(*display_to_map(view_port_width, view_port_height))}
+        input_source = live_input
+    replaying = input_source is not live_input
+
+    # Record of the game, with what it takes to play it back.
+    recording = ActionLog(settings) if record else None
+
+    # Create player, map and monster objects.
+    player, entities, game_map = new_game(settings["map_width"], settings["map_height"], settings["monster_count"],
+                                          random.Random(settings["seed"]), sprites, settings["generator"])
+    game_map.visibility.radius = settings.get("sight_radius", game_map.visibility.radius)
+
+    # Pre-render the map so frames only need to blit the visible part of it.
+    render_cache = MapRenderCache(game_map, sprites)
+
+    # Plans and carries out monster turns within the time budget, for the monsters the player can see.
+    # While replaying, as many monsters act each turn as did in the log instead.
+    ai_scheduler = AIScheduler(workers=2, time_budget=None if replaying else monster_time_budget, seed=settings["seed"],
+                               line_of_sight=settings.get("line_of_sight", False))
 
     # Set the first turn as the player.
     current_turn = Turn.player
 
+    # Clock used to cap the frame rate.
+    clock = pygame.time.Clock()
+
     # Main game loop.
     running = True
+    redraw = True  # Has the game state changed since the last render?
     while running:
 
         # Create a map chunk for iteration based on the rect boundaries.
         visible_map_chunk = get_visible_map_chunk(player, game_map, view_port_width, view_port_height)
 
         # Render the various screen elements. The placement of this determines whether player or enemies movement lag..
-        render_all(screen_surface, screen_width, screen_height, view_port_width, view_port_height, view_port_x_offset,
-                   view_port_y_offset, game_map, player, entities, visible_map_chunk, sprites)
+        if (redraw or not event_driven) and not (replaying and fast_forward):
+            render_all(screen_surface, screen_width, screen_height, view_port_width, view_port_height, view_port_x_offset,
+                       view_port_y_offset, game_map, player, entities, visible_map_chunk, sprites, render_cache)
+            redraw = False
+
+            if max_fps:
+                clock.tick(max_fps)
 
         # Start Player Turn
         if current_turn == Turn.player:
 
-            # Get inputs and terminate loop if necessary.
-            user_input, running = get_inputs(running)
+            # Get inputs and terminate loop if necessary. When event driven, this sleeps until there is an event.
+            action, running = input_source.get_action(running)
+
+            if replaying and input_source.finished:
+                # The log has been played back, so carry on from the keyboard.
+                input_source = live_input
+                replaying = False
+                running = True
+                ai_scheduler.time_budget = monster_time_budget
+                ai_scheduler.max_monsters = None
+                redraw = True
+                continue
 
-            if not user_input:
+            if action is None:
                 continue  # If no input continue with game loop.
 
             # Process actions
             else:
-                # Process user input and get actions.
-                action = handle_keys(user_input)
+                # Profiling commands don't use up the player's turn.
+                if action.get("profile"):
+                    profiler.command(action["profile"])
+                    redraw = True
+                    continue
 
                 # Action categories.
-                move = action.get("move")
                 quit_game = action.get("quit")
 
-                if quit_game:  # Triggered when ESC key is pressed.
+                if quit_game:  # Triggered when ESC key is pressed. Quitting isn't a turn, so it isn't recorded.
                     running = False
+                    continue
 
-                if move:  # If movement keys are pressed move player.
-                    player_map_x, player_map_y = player.get_map_position()
-                    dx, dy = move  # Pull relative values from action.
-
-                    # Calculate potential new coordinates
-                    destination_x = player_map_x + dx
-                    destination_y = player_map_y + dy
-
-                    if not game_map.blocked[destination_x, destination_y]:  # Check if the tiles are walkable.
-                        attack_target = get_blocking_entities(entities, destination_x, destination_y)  # Is there a monster at the destination?
-
-                        # if there is an entity at the location...
-                        if attack_target:
-                            if isinstance(attack_target, Monster):  # ... and it's a monster
-                                player.attack(attack_target)  # Attack it.
-                        else:
-                            player.move(dx, dy)  # If the cell is empty, move player into it.
+                # Move or attack.
+                player_turn(action, player, entities, game_map)
 
             current_turn = Turn.monster  # Set turn state to monster.
+            redraw = True
 
         # Start Monster Turn
         if current_turn == Turn.monster:
-            # Iterate through all entities.
-            for entity in entities:
-                if isinstance(entity, Monster):  # If the entity is a Monster
-                    # Can the monster see the player (and vice versa).
-                    if (entity.map_x, entity.map_y) in visible_map_chunk:
-                        if not entity.target:  # If the monster doesn't have a target, set it to the player.
-                            entity.target = player
+            # Monsters which can see the player (and vice versa) take their turns.
+            if replaying:
+                ai_scheduler.max_monsters = input_source.acted
+            ai_scheduler.monster_turn(player, entities, game_map, visible_map_chunk)
 
-                        # Process monster turn ai
-                        entity.take_turn(game_map, entities)
+            if recording is not None:
+                recording.append(action, ai_scheduler.last_turn["acted"])
 
             current_turn = Turn.player  # Set to player's turn again.
+            redraw = True
 
     # If the main game loop is broken, quit the game.
+    if recording is not None:
+        recording.save(record)
+    ai_scheduler.close()
+    profiler.stop_sampling()
     pygame.quit()
 
 
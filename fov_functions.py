@@ -0,0 +1,201 @@
+"""
+Field of view. What each viewer can see is found with recursive shadowcasting over the map's opaque tiles, and kept
+until the viewer moves or a tile it might see changes, so "can A see B" is a lookup.
+"""
+
+from copy import copy
+import numpy as np
+
+
+# Multipliers (xx, xy, yx, yy) taking row and column offsets into map offsets for each of the eight octants.
+OCTANTS = ((1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+           (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1))
+
+
+def sight_radius(visible_width, visible_height):
+    # The smallest radius which sees every tile of a visible map chunk this many tiles across, from anywhere in it.
+    return int(np.ceil(np.hypot(visible_width, visible_height)))
+
+
+def cast_light(opaque, visible, centre, radius, row, start_slope, end_slope, xx, xy, yx, yy):
+    """
+    Light one octant, from row outwards, between two slopes. Recurses when an opaque tile splits the light.
+
+    :param opaque: list of lists of bools, indexed [x][y], with the viewer at [centre][centre].
+    :param visible: list of lists of bools the same size, set True for every tile lit.
+    """
+    if start_slope < end_slope:
+        return
+
+    radius_squared = radius * radius
+    new_start = start_slope
+    for distance in range(row, radius + 1):
+        dy = -distance
+        blocked = False
+
+        for dx in range(-distance, 1):
+            # Slopes of the tile's two far corners.
+            left_slope = (dx - 0.5) / (dy + 0.5)
+            right_slope = (dx + 0.5) / (dy - 0.5)
+            if start_slope < right_slope:
+                continue
+            if end_slope > left_slope:
+                break
+
+            x = centre + dx * xx + dy * xy
+            y = centre + dx * yx + dy * yy
+            if dx * dx + dy * dy <= radius_squared:
+                visible[x][y] = True
+
+            if blocked:
+                # Scanning along a wall. Keep going until light gets past it.
+                if opaque[x][y]:
+                    new_start = right_slope
+                else:
+                    blocked = False
+                    start_slope = new_start
+            elif opaque[x][y] and distance < radius:
+                # The start of a wall. Light the part of the next row before it, then carry on past it.
+                blocked = True
+                cast_light(opaque, visible, centre, radius, distance + 1, start_slope, left_slope, xx, xy, yx, yy)
+                new_start = right_slope
+
+        if blocked:
+            break
+
+
+class FieldOfView:
+    """
+    The tiles one viewer can see from one spot, as a bool array covering the square within radius of the viewer.
+    Walls are visible, the tiles behind them aren't.
+    """
+    def __init__(self, opaque, origin, radius, revision):
+        """
+        :param opaque: bool grid of tiles which block sight, indexed [x, y], e.g. GameMap.tiles.opaque.
+        :param origin: (x, y) tile the viewer is on.
+        :param radius: int - how far the viewer can see, in tiles.
+        :param revision: GameMap revision the opaque tiles are from.
+        """
+        self.origin = origin
+        self.radius = radius
+        self.revision = revision
+
+        x, y = origin
+        size = radius * 2 + 1
+        self.x1, self.y1 = x - radius, y - radius  # Map position of visible[0, 0].
+
+        # Copy out the square around the viewer. Off the map counts as opaque.
+        width, height = opaque.shape
+        clip_x1, clip_x2 = max(self.x1, 0), min(self.x1 + size, width)
+        clip_y1, clip_y2 = max(self.y1, 0), min(self.y1 + size, height)
+        window = np.ones((size, size), dtype=bool)
+        window[clip_x1 - self.x1:clip_x2 - self.x1, clip_y1 - self.y1:clip_y2 - self.y1] = opaque[clip_x1:clip_x2, clip_y1:clip_y2]
+
+        # Lists are much quicker than arrays to read one tile at a time.
+        window_list = window.tolist()
+        visible = [[False] * size for _ in range(size)]
+        visible[radius][radius] = True
+        for xx, xy, yx, yy in OCTANTS:
+            cast_light(window_list, visible, radius, radius, 1, 1.0, 0.0, xx, xy, yx, yy)
+
+        self.visible = np.array(visible, dtype=bool)
+        self.visible[:clip_x1 - self.x1, :] = False  # Nothing off the map can be seen.
+        self.visible[clip_x2 - self.x1:, :] = False
+        self.visible[:, :clip_y1 - self.y1] = False
+        self.visible[:, clip_y2 - self.y1:] = False
+
+    def can_see(self, x, y):
+        x -= self.x1
+        y -= self.y1
+        size = self.visible.shape[0]
+        return 0 <= x < size and 0 <= y < size and self.visible.item(x, y)
+
+    def bounds(self):
+        # The square of map tiles covered, as x1, x2, y1, y2 including the edges.
+        size = self.visible.shape[0]
+        return self.x1, self.x1 + size - 1, self.y1, self.y1 + size - 1
+
+
+class VisibilityCache:
+    """
+    Fields of view for entities on a map, recomputed only when a viewer moves or a tile within its sight changes.
+    """
+    def __init__(self, game_map, radius=10):
+        self.game_map = game_map
+        self.radius = radius  # How far entities can see, in tiles.
+        self.fields = dict()  # Viewer entity -> FieldOfView
+        self.revealed = None  # Rect (x1, x2, y1, y2) of the map's visible layer set by the last reveal.
+
+    def field_of_view(self, viewer):
+        game_map = self.game_map
+        origin = (viewer.map_x, viewer.map_y)
+        field = self.fields.get(viewer)
+
+        if field is None or field.origin != origin or not self.still_valid(field):
+            field = FieldOfView(game_map.tiles.opaque, origin, self.radius, game_map.revision)
+            self.fields[viewer] = field
+
+        return field
+
+    def still_valid(self, field):
+        # Has anything the viewer might see changed since the field of view was computed?
+        game_map = self.game_map
+        if field.revision == game_map.revision:
+            return True
+
+        changed_tiles = game_map.changes_since(field.revision)
+        if changed_tiles is None:
+            return False
+
+        x1, x2, y1, y2 = field.bounds()
+        if any(x1 <= x <= x2 and y1 <= y <= y2 for x, y in changed_tiles):
+            return False
+
+        field.revision = game_map.revision  # Changes elsewhere don't matter.
+        return True
+
+    def can_see(self, viewer, target):
+        """
+        Can the viewer see the target?
+
+        :param viewer: entity.
+        :param target: entity, or (x, y) tile.
+        :return: bool
+        """
+        if isinstance(target, tuple):
+            x, y = target
+        else:
+            x, y = target.map_x, target.map_y
+        return self.field_of_view(viewer).can_see(x, y)
+
+    def reveal(self, viewer):
+        # Make the map's visible layer what the viewer can see, and mark those tiles explored. Only the tiles the
+        # last reveal set are cleared, so maps stored on disk don't have to write the whole layer.
+        tiles = self.game_map.tiles
+        field = self.field_of_view(viewer)
+
+        x1, x2, y1, y2 = field.bounds()
+        width, height = tiles.shape
+        clip_x1, clip_x2, clip_y1, clip_y2 = max(x1, 0), min(x2 + 1, width), max(y1, 0), min(y2 + 1, height)
+        visible = field.visible[clip_x1 - x1:clip_x2 - x1, clip_y1 - y1:clip_y2 - y1]
+
+        if self.revealed is None:
+            tiles.visible.clear()
+        else:
+            old_x1, old_x2, old_y1, old_y2 = self.revealed
+            tiles.visible[old_x1:old_x2, old_y1:old_y2] = False
+        tiles.visible[clip_x1:clip_x2, clip_y1:clip_y2] = visible
+        self.revealed = (clip_x1, clip_x2, clip_y1, clip_y2)
+        tiles.explored[clip_x1:clip_x2, clip_y1:clip_y2] = tiles.explored[clip_x1:clip_x2, clip_y1:clip_y2] | visible
+
+    def forget(self, viewer):
+        # Drop a viewer's field of view, e.g. when it dies.
+        self.fields.pop(viewer, None)
+
+    def clone(self, game_map, entity_map):
+        # A copy of the cache for a GameMap.clone. Fields of view are never changed after they are made, apart from
+        # their revision, so only that is copied.
+        cache = copy(self)
+        cache.game_map = game_map
+        cache.fields = {entity_map[viewer]: copy(field) for viewer, field in self.fields.items() if viewer in entity_map}
+        return cache
@@ -0,0 +1,127 @@
+"""
+Game rules shared by the pygame engine and the headless simulation.
+"""
+
+import random
+import numpy as np
+from classes import Player, Monster, StatBlock, EntityIndex, get_blocking_entities, get_entities_in_chunk
+from ai_functions import AIScheduler
+from map_functions import get_visible_map_chunk
+from mapgen_functions import generate_map
+from profile_functions import profiler, timed
+
+
+def new_game(map_width, map_height, monster_count=10, rng=random, sprites=None, generator="noise"):
+    """
+    Create a map (by default with some random noise in it), the player, and some monsters.
+
+    :param map_width: int - map width in tiles.
+    :param map_height: int - map height in tiles.
+    :param monster_count: int - number of orcs to add.
+    :param rng: random.Random (or the random module) used for all random choices.
+    :param sprites: dict of pygame surfaces, or None for a headless game.
+    :param generator: map generator, see mapgen_functions.generate_map.
+    :return: player, entities (EntityIndex) and game map.
+    """
+    sprites = sprites or dict()
+
+    # Create player and map objects.
+    player_stats = StatBlock(h=100, m=0, s=10, d=10)
+    player = Player("Player", map_x=rng.randint(1, map_width - 1), map_y=rng.randint(1, map_height - 1), colour=(0, 255, 0), sprite=sprites.get("player"), stats=player_stats)
+    game_map = generate_map(map_width, map_height, generator, np.random.default_rng(rng.getrandbits(64)))  # Create a game map.
+
+    # List to store all the game entities, indexed by map position. Populate with player.
+    entities = EntityIndex()
+    entities.append(player)
+
+    # Add some basic monsters.
+    for mon in range(monster_count):
+        name = "Orc " + str(mon + 1)
+        mon_stats = StatBlock(h=10, m=0, s=12, d=8)
+        mon = Monster(name, map_x=rng.randint(1, map_width - 1), map_y=rng.randint(1, map_height - 1), colour=(255, 0, 0), game_map=game_map, sprite=sprites.get("orc"), stats=mon_stats)
+        entities.append(mon)
+
+    return player, entities, game_map
+
+
+@timed("player_turn")
+def player_turn(action, player, entities, game_map):
+    """
+    Carry out the player's action: move, or attack a monster in the way.
+
+    :param action: dict from handle_keys.
+    :param player: player object
+    :param entities: list - tracking all entities in game.
+    :param game_map: game map object
+    """
+    move = action.get("move")
+
+    if move:  # If movement keys are pressed move player.
+        player_map_x, player_map_y = player.get_map_position()
+        dx, dy = move  # Pull relative values from action.
+
+        # Calculate potential new coordinates
+        destination_x = player_map_x + dx
+        destination_y = player_map_y + dy
+
+        if not game_map.blocked[destination_x, destination_y]:  # Check if the tiles are walkable.
+            attack_target = get_blocking_entities(entities, destination_x, destination_y)  # Is there a monster at the destination?
+
+            # if there is an entity at the location...
+            if attack_target:
+                if isinstance(attack_target, Monster):  # ... and it's a monster
+                    player.attack(attack_target)  # Attack it.
+            else:
+                player.move(dx, dy)  # If the cell is empty, move player into it.
+
+
+@timed("monster_turn")
+def monster_turn(player, entities, game_map, visible_map_chunk, line_of_sight=False):
+    """
+    Let every monster which can see the player (and vice versa) take its turn.
+
+    :param player: player object
+    :param entities: list - tracking all entities in game.
+    :param game_map: game map object
+    :param visible_map_chunk: MapChunk - the area of the map the player can see.
+    :param line_of_sight: bool - only monsters in the player's field of view act, rather than every monster in the
+                          visible map chunk. Walls then hide monsters.
+    """
+    acted = 0
+    for entity in get_entities_in_chunk(entities, visible_map_chunk):
+        if isinstance(entity, Monster):  # If the entity is a Monster
+            if line_of_sight and not game_map.visibility.can_see(player, entity):
+                continue
+
+            if not entity.target:  # If the monster doesn't have a target, set it to the player.
+                entity.target = player
+
+            # Process monster turn ai
+            entity.take_turn(game_map, entities)
+            acted += 1
+
+    profiler.count("monsters_acted", acted)
+
+
+def replay(log):
+    """
+    Play back an ActionLog as fast as possible, without rendering, e.g. to check AI behaviour hasn't changed or to
+    get a game to the turn where a bug happened.
+
+    :param log: input_functions.ActionLog
+    :return: player, entities and game map as they were after the last turn.
+    """
+    settings = log.settings
+    player, entities, game_map = new_game(settings["map_width"], settings["map_height"], settings["monster_count"],
+                                          random.Random(settings["seed"]), generator=settings.get("generator", "noise"))
+    game_map.visibility.radius = settings.get("sight_radius", game_map.visibility.radius)
+
+    # Monsters act in the recorded order, and as many as did when the game was played.
+    with AIScheduler(seed=settings["seed"], line_of_sight=settings.get("line_of_sight", False)) as scheduler:
+        for action, acted in log.turns():
+            visible_map_chunk = get_visible_map_chunk(player, game_map, settings["view_port_width"], settings["view_port_height"])
+            player_turn(action, player, entities, game_map)
+            scheduler.max_monsters = acted
+            scheduler.monster_turn(player, entities, game_map, visible_map_chunk)
+
+    return player, entities, game_map
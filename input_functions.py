@@ -1,5 +1,10 @@
+import json
+import struct
+from collections import deque
+import numpy as np
 import pygame
 import pygame.locals as pygame_locals
+from profile_functions import timed
 
 # # Set keys.
 # Key constants.
@@ -12,35 +17,29 @@ K_Q = pygame.locals.K_q
 K_W = pygame.locals.K_w
 K_A = pygame.locals.K_a
 K_S = pygame.locals.K_s
+K_F1 = pygame_locals.K_F1
+K_F2 = pygame_locals.K_F2
+K_F3 = pygame_locals.K_F3
 # Event types.
 KEYDOWN = pygame_locals.KEYDOWN
 QUIT = pygame_locals.QUIT
+NOEVENT = pygame_locals.NOEVENT
 
+# Player actions as stored in an ActionLog: the code of an action is its position here.
+LOGGED_ACTIONS = ({}, {"move": (0, -1)}, {"move": (0, 1)}, {"move": (-1, 0)}, {"move": (1, 0)},
+                  {"move": (-1, -1)}, {"move": (1, -1)}, {"move": (-1, 1)}, {"move": (1, 1)})
 
-def get_inputs(running):
-    game_running = running
-
-    # Iterate through event queue and handle game events.
-    for event in pygame.event.get():
-
-        # If the event type is KEYDOWN, the user has pressed a key.
-        if event.type == KEYDOWN:
-            user_input = event  # Assign event to input variable and break the loop.
-            break
-
-        elif event.type == QUIT:
-            game_running = False  # Quit game.
-
-    else:
-        user_input = None  # If event queue completes with no user_input, set to None.
-
-    return user_input, game_running
+# Action log file layout: a header of magic, version and settings length, the settings as JSON, then one record per turn.
+LOG_MAGIC = b"RLOG"
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct("<4sHI")
+LOG_TURN = np.dtype([("action", "u1"), ("acted", "<u4")])
 
 
 def handle_keys(event):
     """
     Take the pygame event, check for user key presses and return a dictionary with the
-    movement direction (tuple), or a quit flag as a bool.
+    movement direction (tuple), a quit flag as a bool, or a profiling command.
 
     :param event: pygame event object.
     :return: a dict with results.
@@ -66,4 +65,156 @@ def handle_keys(event):
     if event.key == K_ESCAPE:
         return {"quit": True}
 
+    # Profiling: F1 switches the profiler and its HUD readout on and off, F2 the sampling profiler, F3 exports.
+    if event.key == K_F1:
+        return {"profile": "toggle"}
+    elif event.key == K_F2:
+        return {"profile": "sample"}
+    elif event.key == K_F3:
+        return {"profile": "export"}
+
     return {}
+
+
+def encode_action(action):
+    # Code of an action dict for an ActionLog. Anything which isn't a move is a turn spent waiting.
+    move = action.get("move")
+    if move:
+        return LOGGED_ACTIONS.index({"move": tuple(move)})
+    return 0
+
+
+def decode_action(code):
+    return dict(LOGGED_ACTIONS[code])
+
+
+class ActionLog:
+    """
+    The player's actions, turn by turn, with what it takes to play them back exactly: the settings and seeds the game
+    was made with, and how many monsters acted each turn (with a time budget that depends on the clock).
+
+    Saved as a small binary file: a header with the settings as JSON, then 5 bytes per turn.
+    """
+    def __init__(self, settings=None):
+        """
+        :param settings: dict - what the game was made with, e.g. seed, map_width, map_height and monster_count.
+        """
+        self.settings = dict(settings or {})
+        self.actions = list()  # Action codes, see encode_action.
+        self.acted = list()  # Monsters which acted after each action.
+
+    def __len__(self):
+        return len(self.actions)
+
+    def append(self, action, acted):
+        """
+        Add a turn.
+
+        :param action: dict from handle_keys.
+        :param acted: int - number of monsters which acted in the monster turn after it.
+        """
+        self.actions.append(encode_action(action))
+        self.acted.append(acted)
+
+    def turns(self):
+        # Yields the action dict and monsters acting of each turn.
+        for code, acted in zip(self.actions, self.acted):
+            yield decode_action(code), acted
+
+    def save(self, path):
+        settings = json.dumps(self.settings, sort_keys=True).encode()
+        turns = np.empty(len(self.actions), dtype=LOG_TURN)
+        turns["action"] = self.actions
+        turns["acted"] = self.acted
+        with open(path, "wb") as file:
+            file.write(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, len(settings)))
+            file.write(settings)
+            file.write(turns.tobytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            data = file.read()
+
+        magic, version, settings_length = LOG_HEADER.unpack_from(data)
+        if magic != LOG_MAGIC or version != LOG_VERSION:
+            raise ValueError("{} is not a version {} action log".format(path, LOG_VERSION))
+
+        start = LOG_HEADER.size + settings_length
+        log = cls(json.loads(data[LOG_HEADER.size:start].decode()))
+        turns = np.frombuffer(data, dtype=LOG_TURN, offset=start)
+        log.actions = turns["action"].tolist()
+        log.acted = turns["acted"].tolist()
+        return log
+
+
+class LiveInput:
+    """
+    Input from the keyboard. Every key pressed is kept until the game asks for it, so keys pressed while a frame or
+    turn is slow to finish aren't lost.
+    """
+    def __init__(self, wait=True, timeout=None):
+        """
+        :param wait: bool - sleep until an event arrives when no keys are waiting, so the game uses no CPU while idle.
+        :param timeout: int - when waiting, give up after this many milliseconds. None waits forever.
+        """
+        self.wait = wait
+        self.timeout = timeout
+        self.events = deque()  # KEYDOWN events not handled yet.
+
+    @timed("get_inputs")
+    def get_action(self, running):
+        """
+        :param running: bool - whether the game is running.
+        :return: the action dict for the next key pressed or None, and whether the game is still running.
+        """
+        if not self.events:
+            running = self.read_events(running)
+
+        if self.events:
+            return handle_keys(self.events.popleft()), running
+        return None, running
+
+    def read_events(self, running):
+        events = pygame.event.get()
+        if not events and self.wait:
+            events = [pygame.event.wait(self.timeout) if self.timeout else pygame.event.wait()] + pygame.event.get()
+
+        for event in events:
+            if event.type == KEYDOWN:
+                self.events.append(event)
+            elif event.type == QUIT:
+                running = False  # Quit game.
+        return running
+
+
+class ScriptedInput:
+    """
+    Input from a sequence of action dicts, e.g. for tests and benchmarks. The game ends when it runs out.
+    """
+    def __init__(self, actions):
+        self.actions = iter(actions)
+        self.finished = False
+
+    def get_action(self, running):
+        action = next(self.actions, None)
+        if action is None:
+            self.finished = True
+            return None, False
+        return action, running
+
+
+class RecordedInput(ScriptedInput):
+    """
+    Input played back from an ActionLog. After each action, acted holds how many monsters acted in that turn when
+    it was recorded, for the monster turn to match.
+    """
+    def __init__(self, log):
+        self.log = log
+        self.acted = None
+        super().__init__(self.log_actions())
+
+    def log_actions(self):
+        for action, acted in self.log.turns():
+            self.acted = acted
+            yield action
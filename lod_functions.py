@@ -0,0 +1,244 @@
+"""
+Level of detail for monster turns, so the world beyond the view port carries on without full pathfinding for every
+monster in it. Monsters are split into tiers each turn by where they are:
+
+    full    inside the visible map chunk (plus a margin). They take their turns in full, as they always have.
+    coarse  within coarse_radius tiles of the player. Every few turns they step one tile along a CoarseGrid of the
+            map towards their target, or away from it while fleeing, all worked out with a few numpy operations.
+            Monsters which have no target yet stay where they are.
+    frozen  further away. They stay as they are until they come back within range.
+
+Monsters move between tiers as they cross the boundaries: a coarse monster walking into view takes its turns in full
+from then on, and one left behind by the player drops back to coarse, then frozen. The cost of a turn is bounded by
+the size of the view and of the coarse area, however big the map. For the same reason the full tier's pathfinding
+maps only reach field_radius steps from their target.
+"""
+
+import time
+import numpy as np
+from game_functions import monster_turn
+from map_functions import MapChunk
+from pathfinding import NEIGHBOURS, CoarseGrid
+from profile_functions import profiler, timed
+
+
+# Tiers, lowest detail first.
+FROZEN = 0
+COARSE = 1
+FULL = 2
+
+NEIGHBOUR_DX = np.array([dx for dx, dy in NEIGHBOURS])
+NEIGHBOUR_DY = np.array([dy for dx, dy in NEIGHBOURS])
+
+
+class TieredScheduler:
+    """
+    Runs the monster turn at three levels of detail, as a replacement for game_functions.monster_turn. Monsters in
+    the full tier are handed on to another scheduler, e.g. an AIScheduler or TurnScheduler, or to monster_turn.
+
+    Coarse moves don't use random numbers, so games still play out the same way for the same seed.
+    """
+    def __init__(self, scheduler=None, full_margin=0, coarse_radius=96, coarse_interval=2, cell_size=16, field_radius=None):
+        """
+        :param scheduler: scheduler for the full tier, with a monster_turn method like AIScheduler's. None uses
+                          game_functions.monster_turn.
+        :param full_margin: int - tiles around the visible map chunk which are in the full tier too.
+        :param coarse_radius: int - monsters this many tiles or fewer from the player (in x and in y) are in the
+                              coarse tier, unless they are in the full tier.
+        :param coarse_interval: int - coarse monsters move once every this many turns, taking turns about.
+        :param cell_size: int - width and height in tiles of the CoarseGrid's cells.
+        :param field_radius: int - steps from their target the full tier's pathfinding maps reach, given to the game
+                             map's FlowFieldCache unless it has a radius already. None uses coarse_radius.
+        """
+        self.scheduler = scheduler
+        self.full_margin = full_margin
+        self.coarse_radius = coarse_radius
+        self.coarse_interval = coarse_interval
+        self.field_radius = coarse_radius if field_radius is None else field_radius
+        self.grid = CoarseGrid(cell_size)
+        self.turn = 0
+        self.index = None  # EntityIndex of the game being played.
+        self.monsters = None  # Bool array: which rows of the entity store hold monsters.
+        self.spawned = None  # EntityIndex.next_order and length when monsters was made, to notice changes.
+        self.tiers = np.zeros(0, dtype=np.int8)  # Tier of each row of the entity store last turn.
+        self.orders = np.zeros(0, dtype=np.int64)  # EntityIndex.order of the entity in each row, or -1 for free rows.
+        self.last_turn = dict()  # Numbers from the last turn, including the full tier scheduler's.
+
+    def clone(self, entity_map):
+        """
+        A copy of the scheduler for a copied game (see snapshot_functions.clone_game). The coarse grid is shared.
+
+        :param entity_map: dict of entity -> its copy.
+        """
+        scheduler = TieredScheduler(None if self.scheduler is None else self.scheduler.clone(entity_map), self.full_margin,
+                                    self.coarse_radius, self.coarse_interval, self.grid.cell_size, self.field_radius)
+        scheduler.grid = self.grid
+        scheduler.turn = self.turn
+        scheduler.tiers = self.tiers.copy()  # Copied stores keep the same rows, so monsters stay in their tiers.
+        scheduler.orders = self.orders
+        scheduler.last_turn = dict(self.last_turn)
+        return scheduler
+
+    def state(self, position):
+        # The scheduler's state for a snapshot. Tiers are worked out again from where monsters are.
+        return {"turn": self.turn, "scheduler": None if self.scheduler is None else self.scheduler.state(position)}
+
+    def restore(self, state, entities):
+        # Put back a state from the state method, for the entities loaded from the same snapshot.
+        self.turn = state["turn"]
+        self.index = None
+        self.tiers = np.zeros(0, dtype=np.int8)
+        self.orders = np.zeros(0, dtype=np.int64)
+        if self.scheduler is not None and state["scheduler"] is not None:
+            self.scheduler.restore(state["scheduler"], entities)
+
+    def monster_rows(self, entities):
+        # Which rows of the entity store hold monsters, worked out again when entities are added or removed.
+        spawned = (entities.next_order, len(entities))
+        if entities is not self.index or spawned != self.spawned:
+            rows = entities.store.entities
+            orders = np.array([entities.order.get(entity, -1) for entity in rows], dtype=np.int64)
+            if self.index is not None and entities is not self.index:
+                self.tiers = np.zeros(0, dtype=np.int8)  # A new game, e.g. after Simulation.reset.
+            else:
+                # Rows freed and given to another entity since start again from frozen.
+                count = min(len(orders), len(self.orders), len(self.tiers))
+                self.tiers[:count][orders[:count] != self.orders[:count]] = FROZEN
+            self.monsters = entities.store.monsters()
+            self.orders = orders
+            self.index = entities
+            self.spawned = spawned
+        return self.monsters
+
+    def sort_tiers(self, player, entities, full_chunk):
+        """
+        Put every monster in a tier by where it is.
+
+        :return: int8 arrays of the tier of each row of the entity store, this turn and last turn.
+        """
+        store = entities.store
+        monsters = self.monster_rows(entities)
+        count = len(monsters)
+        map_x, map_y = store.map_x[:count], store.map_y[:count]
+
+        near = (np.abs(map_x - player.map_x) <= self.coarse_radius) & (np.abs(map_y - player.map_y) <= self.coarse_radius)
+        tiers = np.where(full_chunk.contains(map_x, map_y), FULL, np.where(near, COARSE, FROZEN)).astype(np.int8)
+        tiers[~monsters] = FROZEN
+
+        # Monsters not seen before start out frozen.
+        previous = np.zeros(count, dtype=np.int8)
+        previous[:min(count, len(self.tiers))] = self.tiers[:count]
+        previous[~monsters] = FROZEN
+        self.tiers = tiers
+        return tiers, previous
+
+    def promote(self, player, entities, rows):
+        # Get monsters which have come into the full tier ready to take their turns in full.
+        wake = getattr(self.scheduler, "wake", None)
+        for row in rows.tolist():
+            monster = entities.store.entities[row]
+            if not monster.target:  # If the monster doesn't have a target, set it to the player.
+                monster.target = player
+            if wake is not None:
+                wake(entities, monster)  # TurnScheduler only looks for monsters in view when the view moves.
+
+    def coarse_moves(self, player, entities, game_map, rows):
+        """
+        Step coarse monsters one tile towards the next cell on the way to their target, or away from it if fleeing.
+        Monsters in their target's cell, or with no better cell to go to, step straight towards (or away from) it.
+        If the way is blocked, each tries the two directions either side. Monsters don't attack at this tier, and
+        monsters without a target stay put.
+
+        :return: number of monsters which moved.
+        """
+        if not len(rows):
+            return 0
+
+        store = entities.store
+        rows = rows[store.target[rows] >= 0]
+        if not len(rows):
+            return 0
+
+        self.grid.update(game_map)
+        map_x, map_y = store.map_x[rows], store.map_y[rows]
+        fleeing = store.flee[rows]
+        targets = store.target[rows]
+
+        step_x = np.zeros(len(rows), dtype=int)
+        step_y = np.zeros(len(rows), dtype=int)
+        for target in np.unique(targets).tolist():
+            chasing = targets == target
+            target_x, target_y = int(store.map_x[target]), int(store.map_y[target])
+            chase, flee = self.grid.directions(self.grid.cell(target_x, target_y))
+
+            cell_x, cell_y = self.grid.cell(map_x[chasing], map_y[chasing])
+            direction = np.where(fleeing[chasing], flee[cell_x, cell_y], chase[cell_x, cell_y])
+            away = np.where(fleeing[chasing], -1, 1)
+            step_x[chasing] = np.where(direction >= 0, NEIGHBOUR_DX[direction], np.sign(target_x - map_x[chasing]) * away)
+            step_y[chasing] = np.where(direction >= 0, NEIGHBOUR_DY[direction], np.sign(target_y - map_y[chasing]) * away)
+
+        # The step itself, then the directions 45 degrees either side of it.
+        options = ((step_x, step_y), (np.sign(step_x - step_y), np.sign(step_x + step_y)),
+                   (np.sign(step_x + step_y), np.sign(step_y - step_x)))
+        # Only the tiles around the coarse monsters are read, as one rect, since maps stored on disk (and bit packed
+        # maps) can't be indexed with arrays of tiles.
+        width, height = game_map.blocked.shape
+        x1, x2 = max(int(map_x.min()) - 1, 0), min(int(map_x.max()) + 2, width)
+        y1, y2 = max(int(map_y.min()) - 1, 0), min(int(map_y.max()) + 2, height)
+        blocked = np.asarray(game_map.blocked[x1:x2, y1:y2])
+        chosen_x, chosen_y = np.zeros(len(rows), dtype=int), np.zeros(len(rows), dtype=int)
+        undecided = (step_x != 0) | (step_y != 0)
+        for option_x, option_y in options:
+            free = undecided & ~blocked[np.clip(map_x + option_x, x1, x2 - 1) - x1, np.clip(map_y + option_y, y1, y2 - 1) - y1]
+            chosen_x[free], chosen_y[free] = option_x[free], option_y[free]
+            undecided &= ~free
+
+        # Moves are carried out one at a time, so two monsters can't step into the same tile.
+        moving = (chosen_x != 0) | (chosen_y != 0)
+        moved = 0
+        for row, dx, dy in zip(rows[moving].tolist(), chosen_x[moving].tolist(), chosen_y[moving].tolist()):
+            monster = store.entities[row]
+            if not entities.blocking_at(monster.map_x + dx, monster.map_y + dy):
+                monster.move(dx, dy)
+                moved += 1
+        return moved
+
+    @timed("tiered_turn")
+    def monster_turn(self, player, entities, game_map, visible_map_chunk):
+        """
+        Sort monsters into tiers, then run the full tier's turns and the coarse tier's moves.
+
+        :param player: player object
+        :param entities: EntityIndex - tracking all entities in game.
+        :param game_map: game map object
+        :param visible_map_chunk: MapChunk - the area of the map the player can see.
+        """
+        start = time.perf_counter()
+        margin = self.full_margin
+        full_chunk = MapChunk(visible_map_chunk.x1 - margin, visible_map_chunk.x2 + margin,
+                              visible_map_chunk.y1 - margin, visible_map_chunk.y2 + margin)
+
+        flow_fields = game_map.flow_fields
+        if flow_fields.radius is None:
+            flow_fields.radius = self.field_radius  # Maps built before keep the radius they were built with.
+
+        tiers, previous = self.sort_tiers(player, entities, full_chunk)
+        self.promote(player, entities, np.flatnonzero((tiers == FULL) & (previous != FULL)))
+
+        # Full tier.
+        if self.scheduler is not None:
+            self.scheduler.monster_turn(player, entities, game_map, full_chunk)
+        else:
+            monster_turn(player, entities, game_map, full_chunk)
+
+        # Coarse tier, taking turns about so only some move each turn.
+        coarse = np.flatnonzero(tiers == COARSE)
+        coarse = coarse[(coarse + self.turn) % self.coarse_interval == 0]
+        moved = self.coarse_moves(player, entities, game_map, coarse)
+        self.turn += 1
+
+        counts = np.bincount(tiers[self.monsters], minlength=3).tolist()
+        self.last_turn = dict(getattr(self.scheduler, "last_turn", dict()), full=counts[FULL], coarse=counts[COARSE],
+                              frozen=counts[FROZEN], coarse_moves=moved, promoted=int((tiers > previous).sum()),
+                              demoted=int((tiers < previous).sum()), seconds=time.perf_counter() - start)
+        profiler.count("coarse_moves", moved)
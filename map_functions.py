@@ -1,5 +1,14 @@
 import numpy as np
 from itertools import product
+from bisect import bisect_right
+from pathfinding import FlowFieldCache
+from fov_functions import VisibilityCache
+from world_functions import ChunkedGrid, read_only, writable
+from tile_functions import TileLayers, TERRAIN, TERRAIN_FLOOR, TERRAIN_TREE
+
+
+# Number of single tile changes GameMap remembers for repairing pathfinding maps.
+MAX_LOGGED_CHANGES = 256
 
 
 def display_to_map(screen_x, screen_y):
@@ -10,10 +19,23 @@ class GameMap:
     """
     Game Map object to store map data, annotations (blocked tiles etc), and pathfinding information.
     """
-    def __init__(self, width, height, block_borders=True):
+    def __init__(self, width, height, block_borders=True, blocked=None):
+        """
+        :param width: int - map width in tiles.
+        :param height: int - map height in tiles.
+        :param block_borders: bool - make the outermost tiles impassable.
+        :param blocked: storage for the blocked tiles, shaped (width + 1, height + 1), e.g. a ChunkedGrid for maps too
+                        big to keep in memory. By default a numpy array.
+        """
         self.width = width  # Map width in tiles.
         self.height = height  # Map height in tiles
-        self.blocked = np.array([[False for y in range(height + 1)] for x in range(width + 1)], dtype=bool)  # Non-walkable tiles.
+        self.blocked = np.zeros((width + 1, height + 1), dtype=bool) if blocked is None else blocked  # Non-walkable tiles.
+        self.tiles = TileLayers(self.blocked.shape, self.blocked)  # Terrain and other tile attributes, including blocked.
+        self.revision = 0  # Incremented whenever blocked tiles change, so cached pathfinding maps can be rebuilt.
+        self.change_log = list()  # (revision, x, y) of recent single tile changes, so pathfinding maps can be repaired.
+        self.bulk_revision = 0  # Revision of the last change too big to be repaired tile by tile.
+        self.flow_fields = FlowFieldCache(self)  # Pathfinding maps shared between monsters.
+        self.visibility = VisibilityCache(self)  # What each entity can see.
 
         if block_borders:
             self.block_borders()  # By default, make an impassable border on the ultimate boundaries of the map.
@@ -24,16 +46,104 @@ class GameMap:
         for xy in product(range(self.width), range(self.height)):
             yield xy
 
+    def set_blocked(self, x, y, blocked=True):
+        # Change whether a tile is walkable, by making it a tree or floor.
+        self.set_terrain(x, y, TERRAIN_TREE if blocked else TERRAIN_FLOOR)
+
+    def set_terrain(self, x, y, terrain):
+        # Change a tile's terrain, and with it whether the tile is walkable. Use this rather than writing to the
+        # blocked or terrain arrays directly.
+        properties = TERRAIN[terrain]
+        if self.tiles.terrain[x, y] != terrain or self.blocked[x, y] != properties["blocked"]:
+            self.make_writable()
+            self.tiles.terrain[x, y] = terrain
+            self.tiles.opaque[x, y] = properties["opaque"]
+            self.blocked[x, y] = properties["blocked"]
+            self.revision += 1
+
+            # Keep the log short. Anything older than the log has to be treated as a bulk change.
+            if len(self.change_log) >= MAX_LOGGED_CHANGES:
+                self.change_log.clear()
+                self.bulk_revision = self.revision - 1
+            self.change_log.append((self.revision, x, y))
+
+    def mark_changed(self):
+        # Call after writing to self.blocked or self.tiles directly, e.g. when generating a whole map at once.
+        self.revision += 1
+        self.bulk_revision = self.revision
+        self.change_log.clear()
+
+    def changes_since(self, revision):
+        """
+        List the tiles which have been changed since the given revision.
+
+        :param revision: int - a previous value of self.revision.
+        :return: list of (x, y) tuples, or None if there has been a bulk change and the tiles aren't known.
+        """
+        if revision < self.bulk_revision:
+            return None
+
+        first = bisect_right(self.change_log, (revision, self.width + 1, self.height + 1))
+        return [(x, y) for _, x, y in self.change_log[first:]]
+
     def block_borders(self):
-        for x, y in product(range(self.width), range(self.height)):
-                if y == 0 or x == 0:
-                    self.blocked[x, y] = True
+        # Line the outermost tiles of the map with trees.
+        self.make_writable()
+        self.tiles.fill_rect(TERRAIN_TREE, 0, 0, 0, self.height)
+        self.tiles.fill_rect(TERRAIN_TREE, self.width - 1, self.width - 1, 0, self.height)
+        self.tiles.fill_rect(TERRAIN_TREE, 0, self.width, 0, 0)
+        self.tiles.fill_rect(TERRAIN_TREE, 0, self.width, self.height - 1, self.height - 1)
 
-                if y == self.height - 1 or x == self.width - 1:
-                    self.blocked[x, y] = True
+        # The arrays have a spare row and column past the border, which should never be walked on either.
+        self.tiles.fill_rect(TERRAIN_TREE, self.width, self.width, 0, self.height)
+        self.tiles.fill_rect(TERRAIN_TREE, 0, self.width, self.height, self.height)
+
+        self.mark_changed()
+
+    def make_writable(self):
+        # Take copies of the blocked and terrain arrays if they are shared with another map (see clone) or a snapshot
+        # file. Call before writing to them directly.
+        if isinstance(self.blocked, np.ndarray) and not self.blocked.flags.writeable:
+            self.blocked = self.tiles.blocked = self.blocked.copy()
+        if isinstance(self.tiles.terrain, np.ndarray):
+            self.tiles.terrain = writable(self.tiles.terrain)
+
+    def clone(self, entity_map=None):
+        """
+        A copy of the map which is cheap to make: tile layers are shared, read only, until either map changes them,
+        and cached pathfinding maps and fields of view are shared the same way.
+
+        :param entity_map: dict of entity -> its copy, so cached maps follow the entities they belong to. Caches for
+                           entities not in it are left behind.
+        :return: GameMap
+        """
+        if not isinstance(self.blocked, np.ndarray):
+            raise TypeError("maps stored on disk can't be cloned")
+
+        game_map = GameMap.__new__(GameMap)
+        game_map.width = self.width
+        game_map.height = self.height
+        self.blocked = self.tiles.blocked = read_only(self.blocked)
+        game_map.blocked = self.blocked
+        game_map.tiles = self.tiles.share(game_map.blocked)
+        game_map.revision = self.revision
+        game_map.change_log = list(self.change_log)
+        game_map.bulk_revision = self.bulk_revision
+        game_map.flow_fields = self.flow_fields.clone(game_map, entity_map or {})
+        game_map.visibility = self.visibility.clone(game_map, entity_map or {})
+        return game_map
+
+    def load_area(self, map_chunk, margin=0):
+        # Make sure the tiles in and around a map chunk are in memory, for maps stored on disk.
+        if isinstance(self.blocked, ChunkedGrid):
+            for layer in (self.blocked, self.tiles.terrain, self.tiles.opaque):
+                layer.prefetch(map_chunk.x1 - margin, map_chunk.x2 + margin, map_chunk.y1 - margin, map_chunk.y2 + margin)
 
 
 class MapChunk:
+    """
+    A rect of map tiles, from x1 to x2 and y1 to y2 including the edges.
+    """
     def __init__(self, x1, x2, y1, y2):
         self.x1 = x1
         self.x2 = x2
@@ -45,6 +155,94 @@ class MapChunk:
         for xy in product(range(self.x1, self.x2 + 1), range(self.y1, self.y2 + 1)):
             yield xy
 
+    def __contains__(self, item):
+        # Is a tile, given as (x, y) or an entity, inside the chunk?
+        if isinstance(item, tuple):
+            x, y = item
+        else:
+            x, y = item.map_x, item.map_y
+        return self.x1 <= x <= self.x2 and self.y1 <= y <= self.y2
+
+    def __eq__(self, other):
+        return isinstance(other, MapChunk) and self.bounds() == other.bounds()
+
+    def __hash__(self):
+        return hash(self.bounds())
+
+    def __repr__(self):
+        return "MapChunk({}, {}, {}, {})".format(self.x1, self.x2, self.y1, self.y2)
+
+    def __len__(self):
+        return self.width * self.height
+
+    @property
+    def width(self):
+        # Width in tiles.
+        return max(self.x2 - self.x1 + 1, 0)
+
+    @property
+    def height(self):
+        # Height in tiles.
+        return max(self.y2 - self.y1 + 1, 0)
+
+    def bounds(self):
+        return self.x1, self.x2, self.y1, self.y2
+
+    def contains(self, map_x, map_y):
+        """
+        Vectorised __contains__.
+
+        :param map_x: array of x coordinates, e.g. EntityStore.map_x.
+        :param map_y: array of y coordinates the same shape.
+        :return: bool array - which of the tiles are inside the chunk.
+        """
+        return (map_x >= self.x1) & (map_x <= self.x2) & (map_y >= self.y1) & (map_y <= self.y2)
+
+    def intersection(self, other):
+        # The tiles in both chunks, or None if they don't overlap.
+        x1, x2 = max(self.x1, other.x1), min(self.x2, other.x2)
+        y1, y2 = max(self.y1, other.y1), min(self.y2, other.y2)
+        if x1 > x2 or y1 > y2:
+            return None
+        return MapChunk(x1, x2, y1, y2)
+
+    def difference(self, other):
+        # The tiles in this chunk but not the other, as a list of up to four chunks which don't overlap.
+        overlap = self.intersection(other)
+        if overlap is None:
+            return [self]
+
+        parts = list()
+        if self.x1 < overlap.x1:
+            parts.append(MapChunk(self.x1, overlap.x1 - 1, self.y1, self.y2))
+        if self.x2 > overlap.x2:
+            parts.append(MapChunk(overlap.x2 + 1, self.x2, self.y1, self.y2))
+        if self.y1 < overlap.y1:
+            parts.append(MapChunk(overlap.x1, overlap.x2, self.y1, overlap.y1 - 1))
+        if self.y2 > overlap.y2:
+            parts.append(MapChunk(overlap.x1, overlap.x2, overlap.y2 + 1, self.y2))
+        return parts
+
+    def union(self, other):
+        # The smallest chunk covering both chunks.
+        return MapChunk(min(self.x1, other.x1), max(self.x2, other.x2), min(self.y1, other.y1), max(self.y2, other.y2))
+
+    def slices(self):
+        """
+        The chunk as an index into an array indexed [x, y], e.g. game_map.blocked[map_chunk.slices()].
+        Only the part of the chunk from 0 onwards is covered, so negative coordinates don't wrap around.
+        """
+        return slice(max(self.x1, 0), max(self.x2 + 1, 0)), slice(max(self.y1, 0), max(self.y2 + 1, 0))
+
+    def to_rect(self, tile_size=16):
+        """
+        The chunk as a pygame Rect, in pixels.
+
+        :param tile_size: int - pixels per tile. 1 gives a Rect in tiles.
+        """
+        import pygame  # Only needed for drawing.
+        return pygame.Rect(self.x1 * tile_size, self.y1 * tile_size, self.width * tile_size, self.height * tile_size)
+
 
 def get_visible_map_chunk(player, game_map, view_port_width, view_port_height):
     """
@@ -83,5 +281,7 @@ def get_visible_map_chunk(player, game_map, view_port_width, view_port_height):
         map_chunk_y2 += -map_chunk_y1
         map_chunk_y1 = 0
 
-    return MapChunk(map_chunk_x1, map_chunk_x2, map_chunk_y1, map_chunk_y2)
+    map_chunk = MapChunk(map_chunk_x1, map_chunk_x2, map_chunk_y1, map_chunk_y2)
+    game_map.load_area(map_chunk, margin=visible_width)  # Keep the surroundings loaded so scrolling doesn't wait on disk.
+    return map_chunk
 
@@ -0,0 +1,128 @@
+"""
+Map generators. Each generator takes a map size and a numpy random Generator and returns a bool array of blocked
+tiles, shaped (width, height) and indexed [x, y] like GameMap.blocked. They work on whole arrays at once, so even very
+large maps are quick to build.
+Use generate_map to build a GameMap with one of them.
+"""
+
+import numpy as np
+from map_functions import GameMap
+from tile_functions import TERRAIN_TREE
+
+
+def noise_map(width, height, rng, density=0.1):
+    """
+    Scatter blocked tiles at random, like the original map: one tile in ten by default.
+
+    :param density: float - chance of each tile being blocked.
+    """
+    return rng.random((width, height), dtype=np.float32) < density
+
+
+def box_count(mask):
+    # For every tile, count the blocked tiles in the 3x3 block centred on it. Tiles off the edge count as blocked.
+    padded = np.pad(mask, 1, constant_values=True).astype(np.uint8)
+
+    # Box sums are separable - sum along the x axis first, then sum the result along the y axis.
+    count_x = padded[:-2, :] + padded[1:-1, :] + padded[2:, :]
+    return count_x[:, :-2] + count_x[:, 1:-1] + count_x[:, 2:]
+
+
+def cave_map(width, height, rng, fill=0.45, iterations=4, threshold=5):
+    """
+    Cellular automata caves. Start from random noise, then repeatedly block every tile with at least threshold blocked
+    tiles in the 3x3 block around it and open the rest, which smooths the noise into caverns.
+
+    :param fill: float - chance of each tile starting blocked.
+    :param iterations: int - number of smoothing passes.
+    :param threshold: int - blocked tiles (out of 9) needed for a tile to become blocked.
+    """
+    blocked = rng.random((width, height), dtype=np.float32) < fill
+    for iteration in range(iterations):
+        blocked = box_count(blocked) >= threshold
+    return blocked
+
+
+def rect_tiles(x1, x2, y1, y2):
+    """
+    List every tile covered by a number of rects, without looping over the rects.
+
+    :param x1, x2, y1, y2: int arrays - rect bounds, including the edges.
+    :return: x and y int arrays of tile coordinates, for indexing a map.
+    """
+    heights = y2 - y1 + 1
+    areas = (x2 - x1 + 1) * heights
+
+    # Number the tiles of each rect from 0, then turn the numbers into coordinates within the rect.
+    rect = np.repeat(np.arange(len(areas)), areas)
+    tile = np.arange(areas.sum()) - np.repeat(np.cumsum(areas) - areas, areas)
+    return x1[rect] + tile // heights[rect], y1[rect] + tile % heights[rect]
+
+
+def rooms_map(width, height, rng, rooms=None, min_size=4, max_size=12):
+    """
+    Rectangular rooms joined in a chain by L shaped corridors, in otherwise solid rock.
+    Rooms may overlap, which makes for some less regular shapes.
+
+    :param rooms: int - number of rooms. By default roughly one per 400 tiles.
+    :param min_size: int - smallest room width or height, in tiles.
+    :param max_size: int - largest room width or height, in tiles.
+    """
+    if rooms is None:
+        rooms = max(2, width * height // 400)
+    max_size = max(1, min(max_size, width - 2, height - 2))
+    min_size = min(min_size, max_size)
+
+    # Rooms, kept clear of the map edge.
+    room_width = rng.integers(min_size, max_size + 1, size=rooms)
+    room_height = rng.integers(min_size, max_size + 1, size=rooms)
+    x1 = rng.integers(1, width - room_width)
+    y1 = rng.integers(1, height - room_height)
+    x2 = x1 + room_width - 1
+    y2 = y1 + room_height - 1
+
+    # Chain the rooms in a snaking order, down one band of the map and up the next, so corridors stay short.
+    centre_x = (x1 + x2) // 2
+    centre_y = (y1 + y2) // 2
+    band = centre_x // (max_size * 4)
+    order = np.lexsort((np.where(band % 2, -centre_y, centre_y), band))
+    centre_x, centre_y = centre_x[order], centre_y[order]
+
+    # Corridors from the centre of each room to the next: along x first, then along y.
+    from_x, to_x = centre_x[:-1], centre_x[1:]
+    from_y, to_y = centre_y[:-1], centre_y[1:]
+
+    blocked = np.ones((width, height), dtype=bool)
+    blocked[rect_tiles(np.concatenate((x1, np.minimum(from_x, to_x), to_x)),
+                       np.concatenate((x2, np.maximum(from_x, to_x), to_x)),
+                       np.concatenate((y1, from_y, np.minimum(from_y, to_y))),
+                       np.concatenate((y2, from_y, np.maximum(from_y, to_y))))] = False
+    return blocked
+
+
+# Generators by name, for generate_map. Add to this to make new generators available.
+GENERATORS = {"noise": noise_map, "caves": cave_map, "rooms": rooms_map}
+
+
+def generate_map(width, height, generator="noise", rng=None, blocked=None, **options):
+    """
+    Build a game map with a generator.
+
+    :param width: int - map width in tiles.
+    :param height: int - map height in tiles.
+    :param generator: str name from GENERATORS, or a function taking (width, height, rng, **options).
+    :param rng: np.random.Generator, or a seed for one. The same seed always gives the same map.
+    :param blocked: storage for the map's blocked tiles, see GameMap. The generator still builds the map in memory.
+    :param options: passed on to the generator.
+    :return: GameMap, with its borders blocked.
+    """
+    if not callable(generator):
+        generator = GENERATORS[generator]
+    rng = np.random.default_rng(rng)
+
+    game_map = GameMap(width, height, block_borders=False, blocked=blocked)
+    trees = np.zeros(game_map.tiles.shape, dtype=bool)
+    trees[:width, :height] = generator(width, height, rng, **options)
+    game_map.tiles.fill_mask(TERRAIN_TREE, trees)
+    game_map.block_borders()  # Also tells the map its tiles have changed.
+    return game_map
@@ -0,0 +1,183 @@
+"""
+Observations for agents, encoded straight from game state as stacked numpy channels covering the visible map chunk,
+so training doesn't have to render the game and read the pixels back.
+
+Channels, each indexed [x, y] from the top left of the visible map chunk:
+
+    walls     1 for blocked tiles, and for any part of the window past the edge of the map
+    player    1 on the player's tile
+    monsters  1 on the tiles of every other entity
+    health    h / max_h (clipped to 0..1) of the entity on each tile, player included
+    fleeing   1 on the tiles of fleeing monsters
+
+Many games can be encoded at once into one preallocated array, e.g. a shared memory buffer, and observations can be
+downsampled by averaging blocks of tiles.
+"""
+
+import numpy as np
+from classes import EntityIndex, Monster, get_entities_in_chunk
+from map_functions import display_to_map, get_visible_map_chunk
+
+
+CHANNELS = ("walls", "player", "monsters", "health", "fleeing")
+
+
+class ObservationEncoder:
+    """
+    Turns games into observation arrays shaped (channels, width, height), or (games, channels, width, height) for a
+    batch. Make one per observation layout and reuse it, as it keeps a scratch buffer for downsampling.
+    """
+    def __init__(self, view_port_width=800, view_port_height=480, channels=CHANNELS, downsample=1, dtype=np.float32):
+        """
+        :param view_port_width: int - width in pixels of the view port, which decides the size of the visible map chunk.
+        :param view_port_height: int - height in pixels of the view port.
+        :param channels: names from CHANNELS, in the order to stack them.
+        :param downsample: int - average blocks of this many tiles square into one value. The window is padded with
+                           zeros to a multiple of it.
+        :param dtype: numpy dtype of the observations. Use a float type when downsampling.
+        """
+        unknown = set(channels) - set(CHANNELS)
+        if unknown:
+            raise ValueError("unknown observation channels: {}".format(", ".join(sorted(unknown))))
+
+        self.view_port_width = view_port_width
+        self.view_port_height = view_port_height
+        self.channels = tuple(channels)
+        self.channel_index = {name: number for number, name in enumerate(self.channels)}
+        self.downsample = downsample
+        self.dtype = np.dtype(dtype)
+
+        # Size in tiles of the visible map chunk, and of the window padded for downsampling.
+        visible_width, visible_height = display_to_map(view_port_width, view_port_height)
+        self.window = (visible_width + 1, visible_height + 1)
+        self.padded_window = tuple(-(-size // downsample) * downsample for size in self.window)
+        self.scratch = None  # Full resolution observations, when downsampling.
+
+    @property
+    def shape(self):
+        # Shape of one game's observation.
+        return (len(self.channels),) + tuple(size // self.downsample for size in self.padded_window)
+
+    def buffer(self, count):
+        # A zeroed array for count observations, for encode_batch to write into.
+        return np.zeros((count,) + self.shape, dtype=self.dtype)
+
+    def encode(self, player, entities, game_map, map_chunk=None, out=None):
+        """
+        Encode one game.
+
+        :param player: player object
+        :param entities: list - tracking all entities in game.
+        :param game_map: game map object
+        :param map_chunk: MapChunk to observe. By default the one the player sees, from get_visible_map_chunk.
+        :param out: array shaped like self.shape to write into. Optional.
+        :return: the observation, out if it was given.
+        """
+        batch = self.encode_batch([(player, entities, game_map)], None if out is None else out[None],
+                                  None if map_chunk is None else [map_chunk])
+        return batch[0]
+
+    def encode_batch(self, games, out=None, map_chunks=None):
+        """
+        Encode many games at once.
+
+        :param games: list of (player, entities, game map), e.g. from Simulation objects.
+        :param out: array shaped (len(games),) + self.shape to write into, e.g. from buffer. Optional.
+        :param map_chunks: list of MapChunks to observe, one per game. By default the ones the players see.
+        :return: the observations, out if it was given.
+        """
+        out, full = self.prepare(len(games), out)
+        width, height = self.window
+        walls = self.channel_index.get("walls")
+        columns = list()  # Per game: game number, x, y, is player, h, max_h and fleeing arrays of the entities in view.
+
+        for game, (player, entities, game_map) in enumerate(games):
+            if map_chunks is not None:
+                map_chunk = map_chunks[game]
+            else:
+                map_chunk = get_visible_map_chunk(player, game_map, self.view_port_width, self.view_port_height)
+
+            if walls is not None:
+                chunk_walls = game_map.blocked[map_chunk.slices()][:width, :height]
+                if chunk_walls.shape != (width, height):
+                    full[game, walls] = 1  # Off the map counts as a wall.
+                # slices() stops at the top and left edges of the map, so the tiles start further in if the chunk is past them.
+                x, y = max(-map_chunk.x1, 0), max(-map_chunk.y1, 0)
+                full[game, walls, x:x + chunk_walls.shape[0], y:y + chunk_walls.shape[1]] = chunk_walls
+
+            # Entities are gathered from every game, then written all at once.
+            if isinstance(entities, EntityIndex):
+                store = entities.store
+                in_view = store.in_rect(map_chunk.x1, map_chunk.x2, map_chunk.y1, map_chunk.y2)
+                columns.append((np.full(len(in_view), game), store.map_x[in_view] - map_chunk.x1, store.map_y[in_view] - map_chunk.y1,
+                                in_view == store.slot_of(player), store.h[in_view], store.max_h[in_view], store.flee[in_view]))
+            else:
+                in_view = get_entities_in_chunk(entities, map_chunk)
+                columns.append((np.full(len(in_view), game), np.array([entity.map_x - map_chunk.x1 for entity in in_view], dtype=int),
+                                np.array([entity.map_y - map_chunk.y1 for entity in in_view], dtype=int),
+                                np.array([entity is player for entity in in_view], dtype=bool),
+                                np.array([entity.stats.h for entity in in_view], dtype=int),
+                                np.array([entity.stats.max_h for entity in in_view], dtype=int),
+                                np.array([isinstance(entity, Monster) and entity.flee for entity in in_view], dtype=bool)))
+
+        if columns:
+            self.add_entities(full, *(np.concatenate(column) for column in zip(*columns)))
+        return self.finish(full, out)
+
+    def prepare(self, count, out=None):
+        """
+        Get arrays ready for encoding count games: out for the observations, and the full resolution array to write
+        tiles into, which is out itself unless downsampling.
+        """
+        if out is None:
+            out = self.buffer(count)
+        if self.downsample == 1:
+            out[...] = 0
+            return out, out
+
+        shape = (count, len(self.channels)) + self.padded_window
+        if self.scratch is None or self.scratch.shape != shape:
+            self.scratch = np.zeros(shape, dtype=self.dtype)
+        else:
+            self.scratch[...] = 0
+        return out, self.scratch
+
+    def add_entities(self, full, games, x, y, is_player, h, max_h, fleeing):
+        """
+        Write entities into full resolution observations from prepare. Every argument after full is an array with one
+        item per entity: the game it is in, its position in the window, whether it is the player, its health and
+        maximum health, and whether it is fleeing.
+        """
+        inside = (x >= 0) & (x < self.window[0]) & (y >= 0) & (y < self.window[1])
+        games, x, y, is_player, h, max_h, fleeing = (column[inside] for column in (games, x, y, is_player, h, max_h, fleeing))
+
+        channel = self.channel_index.get("player")
+        if channel is not None:
+            full[games[is_player], channel, x[is_player], y[is_player]] = 1
+
+        channel = self.channel_index.get("monsters")
+        if channel is not None:
+            others = ~is_player
+            full[games[others], channel, x[others], y[others]] = 1
+
+        channel = self.channel_index.get("health")
+        if channel is not None:
+            health = np.clip(h / np.maximum(max_h, 1), 0, 1)
+            full[games, channel, x, y] = health
+
+        channel = self.channel_index.get("fleeing")
+        if channel is not None:
+            full[games[fleeing], channel, x[fleeing], y[fleeing]] = 1
+
+    def finish(self, full, out):
+        # Downsample full resolution observations into out, if need be.
+        if full is not out:
+            # Add up the tiles in each block with one strided slice per tile offset, which is much quicker than
+            # np.mean over a reshaped array.
+            step = self.downsample
+            out[...] = 0
+            for x in range(step):
+                for y in range(step):
+                    out += full[:, :, x::step, y::step]
+            out /= step * step
+        return out
@@ -0,0 +1,612 @@
+import heapq
+from copy import copy
+import numpy as np
+from world_functions import ChunkedGrid, read_only, writable
+
+
+# Relative positions of the eight tiles surrounding a tile. Monsters can move diagonally, so the maps do too.
+NEIGHBOURS = ((-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1))
+
+# Default radius of pathfinding maps on maps stored on disk, see FlowFieldCache.
+CHUNKED_FIELD_RADIUS = 128
+
+# Multiplier applied to a distance map to turn it into a flee map. Values below -1 make monsters prefer
+# running past the target towards open space, rather than cowering in the nearest corner.
+FLEE_COEFFICIENT = -1.2
+
+
+def dilate(mask):
+    """
+    Grow a boolean array by one tile in all eight directions.
+
+    :param mask: bool array. The last two axes are x and y, any before them are a batch of separate maps.
+    :return: new bool array.
+    """
+    # A 3x3 dilation is separable - grow along the x axis first, then grow the result along the y axis.
+    grown_x = mask.copy()
+    grown_x[..., 1:, :] |= mask[..., :-1, :]
+    grown_x[..., :-1, :] |= mask[..., 1:, :]
+
+    grown = grown_x.copy()
+    grown[..., :, 1:] |= grown_x[..., :, :-1]
+    grown[..., :, :-1] |= grown_x[..., :, 1:]
+    return grown
+
+
+def neighbour_minimum(values):
+    """
+    For every tile, find the lowest value in the 3x3 block centred on it. Tiles outside the array count as inf.
+
+    :param values: float array. The last two axes are x and y, any before them are a batch of separate maps.
+    :return: new float array.
+    """
+    lowest_x = values.copy()
+    np.minimum(lowest_x[..., 1:, :], values[..., :-1, :], out=lowest_x[..., 1:, :])
+    np.minimum(lowest_x[..., :-1, :], values[..., 1:, :], out=lowest_x[..., :-1, :])
+
+    lowest = lowest_x.copy()
+    np.minimum(lowest[..., :, 1:], lowest_x[..., :, :-1], out=lowest[..., :, 1:])
+    np.minimum(lowest[..., :, :-1], lowest_x[..., :, 1:], out=lowest[..., :, :-1])
+    return lowest
+
+
+def distance_map(blocked, sources, max_distance=None):
+    """
+    Breadth first search outwards from the source tiles, one whole wavefront per numpy operation.
+
+    :param blocked: 2d bool array of non-walkable tiles (GameMap.blocked).
+    :param sources: iterable of (x, y) map coordinates which will have a value of 0.
+    :param max_distance: int - stop searching this many steps from the sources. None searches the whole array.
+    :return: 2d float32 array of steps to the nearest source. Walls and unreachable tiles are inf.
+    """
+    walkable = ~blocked
+    distances = np.full(blocked.shape, np.inf, dtype=np.float32)
+
+    # Sources are always reached, even if something has been built on top of them.
+    frontier = np.zeros(blocked.shape, dtype=bool)
+    for x, y in sources:
+        frontier[x, y] = True
+    reached = frontier.copy()
+
+    step = 0
+    while frontier.any():
+        distances[frontier] = step
+        step += 1
+
+        if max_distance is not None and step > max_distance:
+            break
+
+        # The next wavefront is every walkable tile touching the current one that hasn't already been reached.
+        frontier = dilate(frontier)
+        frontier &= walkable
+        frontier &= ~reached
+        reached |= frontier
+
+    return distances
+
+
+def safety_map(distances, blocked, coefficient=FLEE_COEFFICIENT):
+    """
+    Turn a distance map into a flee map by inverting it and rescanning, so that the lowest values lead away from
+    the source by the safest route rather than simply into the nearest dead end.
+
+    :param distances: float array from distance_map. Can be a batch of maps, like neighbour_minimum.
+    :param blocked: bool array of non-walkable tiles, the same shape as distances.
+    :param coefficient: float - negative multiplier for the inverted map.
+    :return: 2d float32 array. Walls and unreachable tiles are inf.
+    """
+    reachable = np.isfinite(distances)
+    safety = np.where(reachable, distances * coefficient, np.inf).astype(np.float32)
+
+    # Walls and unreachable tiles are raised back up to inf after every pass, everything else is left alone.
+    barrier = np.where(blocked | ~reachable, np.inf, -np.inf).astype(np.float32)
+
+    # Relax every tile against its neighbours until nothing changes: a tile is never worth more than one step
+    # beyond the best tile next to it.
+    while True:
+        relaxed = neighbour_minimum(safety)
+        relaxed += 1
+        np.maximum(relaxed, barrier, out=relaxed)
+        if not (relaxed < safety).any():
+            break
+        np.minimum(safety, relaxed, out=safety)
+
+    return safety
+
+
+class RepairTooLarge(Exception):
+    """
+    Raised when repairing a distance map would touch more tiles than rebuilding it is worth.
+    """
+    pass
+
+
+class MapWindow:
+    """
+    The part of a pathfinding map around its source, as an array of values with the map position of its corner.
+    Tiles outside the window are inf, so maps cost memory for the area they cover rather than for the whole map.
+    """
+    def __init__(self, values, origin):
+        self.values = values  # Float array, values[0, 0] being map tile origin.
+        self.origin = origin  # (x, y) map position of values[0, 0].
+
+    def lookup(self, x, y):
+        """
+        Values of map tiles, inf outside the window.
+
+        :param x: int array of map x.
+        :param y: int array of map y, the same shape.
+        :return: float array.
+        """
+        width, height = self.values.shape
+        x, y = np.asarray(x) - self.origin[0], np.asarray(y) - self.origin[1]
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        return np.where(inside, self.values[x.clip(0, width - 1), y.clip(0, height - 1)], np.inf)
+
+    def neighbourhood(self, map_x, map_y):
+        # Values of the 3x3 tiles around a tile, as lists indexed [dx + 1][dy + 1].
+        x, y = map_x - self.origin[0], map_y - self.origin[1]
+        width, height = self.values.shape
+        if 1 <= x < width - 1 and 1 <= y < height - 1:
+            return self.values[x - 1:x + 2, y - 1:y + 2].tolist()
+        offsets = np.arange(-1, 2)
+        return self.lookup(map_x + offsets[:, None], map_y + offsets[None, :]).tolist()
+
+    def read_only(self):
+        # A read only copy of the window, sharing its values.
+        return MapWindow(read_only(self.values), self.origin)
+
+
+class FlowField(MapWindow):
+    """
+    A distance map to a single moving source, kept up to date incrementally.
+
+    The map is built once from an anchor tile. While the source wanders near the anchor, only a small patch around
+    the source is searched, and combined with the anchor map as min(anchor map, patch - steps from source to anchor).
+    Inside the patch this is the exact distance (less a constant), and further out it leads back to the anchor, which
+    is close to the source. So every downhill path still ends at the source. Once the source strays beyond the patch
+    radius the map is rebuilt from a new anchor. Tiles changing on the map are repaired tile by tile.
+
+    If a radius is given, tiles further than that many steps from the anchor are left at inf, so that the cost of
+    building the map doesn't depend on the size of the game map. The arrays then only cover the tiles within radius
+    of the anchor, plus room for the patch.
+    """
+    def __init__(self, blocked, source, revision, radius=None, drift=16):
+        self.radius = radius
+        self.drift = drift  # Radius of the exact patch, and so how far the source may stray before rebuilding.
+        self.revision = revision  # GameMap revision the field is correct for.
+        self.shape = blocked.shape  # Size of the game map.
+        self.anchor = self.source = source
+        self.bounds = None  # Rect (x1, x2, y1, y2) containing every finite anchor value.
+        self.patch_bounds = None  # Rect of the patch currently combined into self.values.
+        self.rebuilds = 0
+        self.repairs = 0
+        super().__init__(None, None)
+        self.rebuild(blocked, source)
+
+    def window(self, source, radius):
+        # The rect of tiles within radius of the source, clipped to the map.
+        width, height = self.shape
+        if radius is None:
+            return 0, width, 0, height
+
+        x, y = source
+        return max(x - radius, 0), min(x + radius + 1, width), max(y - radius, 0), min(y + radius + 1, height)
+
+    def local(self, rect):
+        # Slices of the arrays covering a rect of the map.
+        x1, x2, y1, y2 = rect
+        origin_x, origin_y = self.origin
+        return slice(x1 - origin_x, x2 - origin_x), slice(y1 - origin_y, y2 - origin_y)
+
+    def share(self):
+        # A copy of the field sharing its arrays, read only, until either field is updated.
+        self.anchor_values = read_only(self.anchor_values)
+        self.values = read_only(self.values)
+        return copy(self)
+
+    def make_writable(self):
+        self.anchor_values = writable(self.anchor_values)
+        self.values = writable(self.values)
+
+    def rebuild(self, blocked, source):
+        # Search the whole window around the new anchor, into new arrays covering it and any patch around it.
+        self.bounds = self.window(source, self.radius)
+        x1, x2, y1, y2 = self.window(source, None if self.radius is None else self.radius + self.drift * 2)
+        self.origin = (x1, y1)
+        self.anchor_values = np.full((x2 - x1, y2 - y1), np.inf, dtype=np.float32)
+
+        x1, x2, y1, y2 = self.bounds
+        self.anchor_values[self.local(self.bounds)] = distance_map(blocked[x1:x2, y1:y2], [(source[0] - x1, source[1] - y1)], self.radius)
+        self.values = self.anchor_values.copy()
+        self.patch_bounds = None
+        self.anchor = self.source = source
+        self.rebuilds += 1
+
+    def update(self, blocked, source, revision, changed_tiles, budget):
+        """
+        Bring the field up to date with a new source position and/or some changed tiles.
+
+        :param blocked: 2d bool array of non-walkable tiles.
+        :param source: (x, y) - current position of the source.
+        :param revision: int - current GameMap revision.
+        :param changed_tiles: list of (x, y) tiles changed since self.revision, or None if unknown.
+        :param budget: int - maximum number of tiles to repair before giving up and rebuilding instead.
+        """
+        self.revision = revision
+        self.make_writable()
+
+        if changed_tiles is None:
+            self.rebuild(blocked, source)
+            return
+
+        # Paths no longer than the radius never leave the anchor map's bounds, so changes outside them don't matter.
+        x1, x2, y1, y2 = self.bounds
+        changed_tiles = [(x - x1, y - y1) for x, y in changed_tiles if x1 <= x < x2 and y1 <= y < y2]
+        if changed_tiles:
+            area = self.local(self.bounds)
+            try:
+                touched = repair_distance_map(self.anchor_values[area], blocked[x1:x2, y1:y2],
+                                              (self.anchor[0] - x1, self.anchor[1] - y1), changed_tiles, budget, self.radius)
+            except RepairTooLarge:
+                self.rebuild(blocked, source)
+                return
+
+            offset_x, offset_y = x1 - self.origin[0], y1 - self.origin[1]
+            for x, y in touched:
+                self.values[x + offset_x, y + offset_y] = self.anchor_values[x + offset_x, y + offset_y]
+            self.repairs += 1
+
+        if not self.patch(blocked, source):
+            self.rebuild(blocked, source)
+
+    def patch(self, blocked, source):
+        # Combine an exact search around the source with the anchor map. Returns False if the anchor is out of reach.
+        if self.patch_bounds:
+            area = self.local(self.patch_bounds)
+            self.values[area] = self.anchor_values[area]
+            self.patch_bounds = None
+
+        self.source = source
+        if source == self.anchor:
+            return True  # The anchor map is already exact.
+
+        # The anchor must be inside the patch, which keeps the patch inside the arrays.
+        x1, x2, y1, y2 = self.window(source, self.drift)
+        anchor_x, anchor_y = self.anchor[0] - x1, self.anchor[1] - y1
+        if not (0 <= anchor_x < x2 - x1 and 0 <= anchor_y < y2 - y1):
+            return False
+
+        local = distance_map(blocked[x1:x2, y1:y2], [(source[0] - x1, source[1] - y1)], self.drift)
+        if local[anchor_x, anchor_y] == np.inf:
+            return False
+
+        # Shift the patch down by the distance to the anchor, so values everywhere else don't need changing.
+        area = self.local((x1, x2, y1, y2))
+        np.minimum(self.anchor_values[area], local - local[anchor_x, anchor_y], out=self.values[area])
+        self.patch_bounds = x1, x2, y1, y2
+        return True
+
+
+def repair_distance_map(values, blocked, source, changed_tiles, budget, radius=None):
+    """
+    Update a distance map in place after some tiles have changed, only visiting tiles whose distance changes.
+    First every tile which was counting down through a newly blocked tile is cleared, then distances are propagated
+    back into the cleared area from its edges and from any newly opened tiles.
+
+    :param values: 2d float array from distance_map, which will be modified.
+    :param blocked: 2d bool array of non-walkable tiles, after the changes.
+    :param source: (x, y) - the source tile of the map.
+    :param changed_tiles: list of (x, y) tiles which have been blocked or opened.
+    :param budget: int - maximum number of tiles to visit. RepairTooLarge is raised beyond this.
+    :param radius: int - maximum distance stored in the map, or None.
+    :return: set of (x, y) tiles whose values were changed.
+    """
+    width, height = values.shape
+    max_distance = np.inf if radius is None else radius
+    work = 0
+
+    def neighbours(x, y):
+        for dx, dy in NEIGHBOURS:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < width and 0 <= ny < height:
+                yield nx, ny
+
+    cleared = {(x, y) for x, y in changed_tiles if blocked[x, y] and values[x, y] != np.inf and (x, y) != source}
+    stack = list(cleared)
+    while stack:
+        x, y = stack.pop()
+        work += 1
+        if work > budget:
+            raise RepairTooLarge
+
+        child_value = values[x, y] + 1
+        for child in neighbours(x, y):
+            if child in cleared or values[child] != child_value:
+                continue
+
+            # The child is still fine if any other neighbour it could have counted down to is intact.
+            supported = False
+            for parent in neighbours(*child):
+                if values[parent] == child_value - 1 and parent not in cleared and (parent == source or not blocked[parent]):
+                    supported = True
+                    break
+
+            if not supported:
+                cleared.add(child)
+                stack.append(child)
+
+    for xy in cleared:
+        values[xy] = np.inf
+
+    # Now propagate distances back in, cheapest first.
+    touched = set(cleared)
+    queue = list()
+    for x, y in cleared.union(changed_tiles):
+        if not blocked[x, y]:
+            best = min(values[neighbour] for neighbour in neighbours(x, y)) + 1
+            if best < values[x, y] and best <= max_distance:
+                values[x, y] = best
+                queue.append((best, (x, y)))
+                touched.add((x, y))
+    heapq.heapify(queue)
+
+    while queue:
+        value, xy = heapq.heappop(queue)
+        if value > values[xy]:
+            continue  # Already improved since this entry was queued.
+
+        work += 1
+        if work > budget:
+            raise RepairTooLarge
+
+        value += 1
+        if value > max_distance:
+            continue
+
+        for neighbour in neighbours(*xy):
+            if value < values[neighbour] and not blocked[neighbour]:
+                values[neighbour] = value
+                heapq.heappush(queue, (value, neighbour))
+                touched.add(neighbour)
+
+    return touched
+
+
+class FlowFieldCache:
+    """
+    Stores pathfinding maps for the game map, shared between all the monsters chasing (or fleeing) the same target.
+    When the target moves or a few tiles change, the maps are updated incrementally rather than rebuilt.
+
+    Maps stored on disk (ChunkedGrid) get CHUNKED_FIELD_RADIUS as the default radius, so building a pathfinding map
+    reads the chunks around its target rather than the whole map.
+    """
+    def __init__(self, game_map, radius=None, drift=16, repair_budget=512):
+        if radius is None and isinstance(game_map.blocked, ChunkedGrid):
+            radius = CHUNKED_FIELD_RADIUS
+        self.game_map = game_map
+        self.radius = radius  # Maximum number of steps a pathfinding map extends from its target. None for no limit.
+        self.drift = drift  # How far a target may move before its pathfinding map is rebuilt.
+        self.repair_budget = repair_budget  # Tile repairs touching more than this many tiles are rebuilt instead.
+        self.chase_maps = dict()  # Target entity -> FlowField
+        self.flee_maps = dict()  # Target entity -> ((chase map revision, source), safety map as a MapWindow)
+
+    def chase_map(self, target):
+        # Distance map with the target at the lowest value. Monsters move downhill to reach it.
+        game_map = self.game_map
+        source = (target.map_x, target.map_y)
+        field = self.chase_maps.get(target)
+
+        if field is None:
+            field = FlowField(game_map.blocked, source, game_map.revision, self.radius, self.drift)
+            self.chase_maps[target] = field
+
+        elif field.source != source or field.revision != game_map.revision:
+            field.update(game_map.blocked, source, game_map.revision, game_map.changes_since(field.revision), self.repair_budget)
+
+        return field
+
+    def flee_map(self, target):
+        # Safety map built from the chase map. Monsters move downhill to escape the target.
+        field = self.chase_map(target)
+        key = (field.revision, field.source)
+        cached = self.flee_maps.get(target)
+
+        if cached is None or cached[0] != key:
+            x1, x2, y1, y2 = field.bounds
+            if field.patch_bounds:  # With a radius, the patch can poke out of the anchor map.
+                patch_x1, patch_x2, patch_y1, patch_y2 = field.patch_bounds
+                x1, x2, y1, y2 = min(x1, patch_x1), max(x2, patch_x2), min(y1, patch_y1), max(y2, patch_y2)
+
+            safety = safety_map(field.values[field.local((x1, x2, y1, y2))], self.game_map.blocked[x1:x2, y1:y2])
+            cached = (key, MapWindow(safety, (x1, y1)))
+            self.flee_maps[target] = cached
+
+        return cached[1]
+
+    def forget(self, target):
+        # Drop the maps for a target, e.g. when it dies.
+        self.chase_maps.pop(target, None)
+        self.flee_maps.pop(target, None)
+
+    def clone(self, game_map, entity_map):
+        # A copy of the cache for a GameMap.clone, sharing the maps of the targets in entity_map until they change.
+        cache = copy(self)
+        cache.game_map = game_map
+        cache.chase_maps = {entity_map[target]: field.share() for target, field in self.chase_maps.items() if target in entity_map}
+        cache.flee_maps = {entity_map[target]: cached for target, cached in self.flee_maps.items() if target in entity_map}
+        return cache
+
+
+def shift(array, dx, dy, fill):
+    # Move an array's values by dx, dy along its last two axes, so out[..., x + dx, y + dy] = array[..., x, y].
+    out = np.full(array.shape, fill, dtype=array.dtype)
+    width, height = array.shape[-2:]
+    out[..., max(dx, 0):width + min(dx, 0), max(dy, 0):height + min(dy, 0)] = \
+        array[..., max(-dx, 0):width + min(-dx, 0), max(-dy, 0):height + min(-dy, 0)]
+    return out
+
+
+def cell_links(tiles, size):
+    """
+    Links between square cells of walkable tiles, for CoarseGrid.
+
+    :param tiles: 2d bool array of walkable tiles, a whole number of cells wide and high.
+    :param size: int - width and height of each cell in tiles.
+    :return: bool arrays of whether cells are linked to the cell east of them, south of them and south east of them,
+             and whether the cell south of each is linked to the cell east of it, indexed by cell [x, y].
+    """
+    width, height = tiles.shape[0] // size, tiles.shape[1] // size
+
+    # Cells side by side are linked if a walkable tile on one's edge touches a walkable tile on the other's.
+    first, last = tiles[size::size], tiles[size - 1::size][:-1]
+    touching = first.copy()
+    touching[:, 1:] |= first[:, :-1]
+    touching[:, :-1] |= first[:, 1:]
+    east = (last & touching).reshape(width - 1, height, size).any(axis=2)
+
+    first, last = tiles[:, size::size], tiles[:, size - 1::size][:, :-1]
+    touching = first.copy()
+    touching[1:] |= first[:-1]
+    touching[:-1] |= first[1:]
+    south = (last & touching).reshape(width, size, height - 1).any(axis=1)
+
+    # Diagonal neighbours are linked through their corner tiles.
+    south_east = tiles[size - 1::size, size - 1::size][:-1, :-1] & tiles[size::size, size::size]
+    north_east = tiles[size - 1::size, ::size][:-1, 1:] & tiles[size::size, size - 1::size][:, :-1]
+    return east, south, south_east, north_east
+
+
+class CoarseGrid:
+    """
+    The map divided into square cells of cell_size tiles, with a link between neighbouring cells (diagonals included)
+    wherever a monster can step from one to the other. A graph hundreds of times smaller than the map's tiles, for
+    moving monsters far from the player cheaply.
+
+    Each cell counts as one place, so a cell split in two by a wall is treated as connected, and paths are only
+    approximate. Links are rebuilt when the map's revision changes, one block of the map at a time, so maps stored on
+    disk are read a chunk or so at a time rather than all at once.
+    """
+    def __init__(self, cell_size=16, cache_size=16):
+        """
+        :param cell_size: int - width and height of each cell in tiles.
+        :param cache_size: int - most targets to keep the cell by cell steps for.
+        """
+        self.cell_size = cell_size
+        self.cache_size = cache_size
+        self.revision = None  # GameMap.revision the links were built from.
+        self.shape = None  # Cells wide and high.
+        self.links = None  # bool array (8, cells wide, cells high). links[n, x, y] - can step NEIGHBOURS[n] from cell x, y?
+        self.steps = dict()  # Target cell -> (chase, flee) arrays of NEIGHBOURS numbers for each cell, -1 to stay.
+
+    def update(self, game_map):
+        # Rebuild the links if the map has changed.
+        if game_map.revision == self.revision:
+            return
+
+        size = self.cell_size
+        blocked = game_map.blocked
+        map_width, map_height = blocked.shape
+        width, height = -(-map_width // size), -(-map_height // size)
+
+        # Cells in blocks this many cells across are linked together, a ChunkedGrid's chunk at a time.
+        chunk_size = getattr(blocked, "chunk_size", None)
+        block = max(1, chunk_size // size) if chunk_size else max(width, height)
+
+        # Whether each cell is linked to the cell east of it, south of it and south east of it, and whether the cell
+        # south of it is linked to the cell east of it. Cells on the far edges of the map have nothing to link to.
+        east, south, south_east, north_east = (np.zeros((width, height), dtype=bool) for link in range(4))
+        for cell_x1 in range(0, width, block):
+            for cell_y1 in range(0, height, block):
+                cell_x2, cell_y2 = min(cell_x1 + block, width), min(cell_y1 + block, height)
+
+                # The block's tiles and the tiles around it, in an array with a cell of walls on every side.
+                origin_x, origin_y = (cell_x1 - 1) * size, (cell_y1 - 1) * size
+                x1, x2 = max(cell_x1 * size - 1, 0), min(cell_x2 * size + 1, map_width)
+                y1, y2 = max(cell_y1 * size - 1, 0), min(cell_y2 * size + 1, map_height)
+                tiles = np.zeros(((cell_x2 - cell_x1 + 2) * size, (cell_y2 - cell_y1 + 2) * size), dtype=bool)
+                tiles[x1 - origin_x:x2 - origin_x, y1 - origin_y:y2 - origin_y] = ~np.asarray(blocked[x1:x2, y1:y2])
+
+                for links, block_links in zip((east, south, south_east, north_east), cell_links(tiles, size)):
+                    links[cell_x1:cell_x2, cell_y1:cell_y2] = block_links[1:cell_x2 - cell_x1 + 1, 1:cell_y2 - cell_y1 + 1]
+        east, south, south_east, north_east = east[:-1], south[:, :-1], south_east[:-1, :-1], north_east[:-1, :-1]
+
+        links = np.zeros((len(NEIGHBOURS), width, height), dtype=bool)
+        for number, (dx, dy) in enumerate(NEIGHBOURS):
+            if (dx, dy) == (1, 0):
+                links[number, :-1, :] = east
+            elif (dx, dy) == (-1, 0):
+                links[number, 1:, :] = east
+            elif (dx, dy) == (0, 1):
+                links[number, :, :-1] = south
+            elif (dx, dy) == (0, -1):
+                links[number, :, 1:] = south
+            elif (dx, dy) == (1, 1):
+                links[number, :-1, :-1] = south_east
+            elif (dx, dy) == (-1, -1):
+                links[number, 1:, 1:] = south_east
+            elif (dx, dy) == (1, -1):
+                links[number, :-1, 1:] = north_east
+            else:
+                links[number, 1:, :-1] = north_east
+
+        self.links = links
+        self.shape = (width, height)
+        self.revision = game_map.revision
+        self.steps.clear()
+
+    def cell(self, map_x, map_y):
+        # Cell of a tile. Works on arrays of coordinates too.
+        return map_x // self.cell_size, map_y // self.cell_size
+
+    def distances(self, target_cell):
+        """
+        Breadth first search over the cells, one whole wavefront at a time, like distance_map.
+
+        :param target_cell: (x, y) of the cell to measure from.
+        :return: float32 array of cell steps to the target cell. Cells which can't reach it are inf.
+        """
+        distances = np.full(self.shape, np.inf, dtype=np.float32)
+        frontier = np.zeros(self.shape, dtype=bool)
+        frontier[target_cell] = True
+        reached = frontier.copy()
+
+        step = 0
+        while frontier.any():
+            distances[frontier] = step
+            step += 1
+
+            grown = np.zeros(self.shape, dtype=bool)
+            for number, (dx, dy) in enumerate(NEIGHBOURS):
+                grown |= shift(frontier & self.links[number], dx, dy, False)
+            frontier = grown & ~reached
+            reached |= frontier
+
+        return distances
+
+    def directions(self, target_cell):
+        """
+        Which way to step from every cell to get closer to (chase) or further from (flee) the target cell.
+
+        :param target_cell: (x, y) of the target's cell.
+        :return: chase and flee int8 arrays of numbers into NEIGHBOURS for each cell, -1 where no step is better.
+        """
+        target_cell = tuple(int(value) for value in target_cell)
+        cached = self.steps.get(target_cell)
+        if cached is not None:
+            return cached
+
+        distances = self.distances(target_cell)
+        neighbour_distances = np.stack([shift(distances, -dx, -dy, np.inf) for dx, dy in NEIGHBOURS])
+        closer = np.where(self.links, neighbour_distances, np.inf)
+        further = np.where(self.links & np.isfinite(neighbour_distances), neighbour_distances, -np.inf)
+
+        chase = np.argmin(closer, axis=0).astype(np.int8)
+        chase[np.min(closer, axis=0) >= distances] = -1
+        flee = np.argmax(further, axis=0).astype(np.int8)
+        flee[np.max(further, axis=0) <= np.where(np.isfinite(distances), distances, np.inf)] = -1
+
+        if len(self.steps) >= self.cache_size:
+            self.steps.clear()
+        self.steps[target_cell] = (chase, flee)
+        return chase, flee
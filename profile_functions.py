@@ -0,0 +1,295 @@
+"""
+Timers and counters for the game loop. Instrumented functions add how long each call took to a rolling window of
+samples per metric, which can be summarised as percentiles, drawn in the top HUD and exported as JSON or CSV.
+A sampling profiler, which records the game thread's call stack at intervals, can be switched on and off while the
+game runs.
+
+Nothing is recorded until profiler.enable() is called. Until then an instrumented call costs one flag check.
+"""
+
+import csv
+import sys
+import json
+import time
+import functools
+import threading
+import numpy as np
+from collections import deque, Counter
+
+
+PERCENTILES = (50, 95, 99)
+
+# Metrics shown in the top HUD, one line each.
+HUD_METRICS = (("render_all", "render_map", "render_entities", "get_inputs"),
+               ("player_turn", "monster_turn", "ai_scheduler", "monsters_acted"),
+               ("take_turn", "update_dijkstra_map", "calculate_path"))
+
+
+class Metric:
+    """
+    Rolling window of the latest samples of one timer (seconds) or counter, plus running totals since the last reset.
+    """
+    def __init__(self, kind, window):
+        self.kind = kind  # "timer" or "counter".
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+
+    def summary(self, percentiles=PERCENTILES):
+        # Totals and percentiles of the window. Timers are in milliseconds.
+        scale = 1000 if self.kind == "timer" else 1
+        summary = {"kind": self.kind, "count": self.count, "total": self.total * scale,
+                   "mean": self.total / self.count * scale if self.count else 0.0, "max": self.maximum * scale}
+        values = np.percentile(np.fromiter(self.samples, dtype=float), percentiles) * scale if self.samples else [0.0] * len(percentiles)
+        for percentile, value in zip(percentiles, values):
+            summary["p{}".format(percentile)] = float(value)
+        return summary
+
+
+class Timer:
+    # Context manager timing a block of code into a metric.
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+
+
+class NullTimer:
+    # Stands in for Timer when the profiler is off.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+
+NULL_TIMER = NullTimer()
+
+
+class StackSampler(threading.Thread):
+    """
+    Sampling profiler. Records the call stack of one thread every interval seconds, from a background thread, so
+    the game code isn't touched. Stacks are counted as strings of function names from the outermost call inwards,
+    separated by semicolons (the folded format flame graph tools read).
+    """
+    def __init__(self, thread_id, interval=0.001):
+        super().__init__(name="StackSampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            names = list()
+            while frame is not None:
+                code = frame.f_code
+                if code is not timed_code:  # Leave out the timed wrappers, which would be every other call.
+                    names.append("{}:{}".format(code.co_filename.replace("\\", "/").rsplit("/", 1)[-1], code.co_name))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
+
+    def folded(self):
+        # Lines of "stack count", most sampled first.
+        return ["{} {}".format(stack, count) for stack, count in self.stacks.most_common()]
+
+    def top(self, limit=10):
+        # The functions the sampled thread was most often inside (the innermost call), with their share of samples.
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return [(name, count / self.samples) for name, count in leaves.most_common(limit)]
+
+
+class Profiler:
+    """
+    Collects metrics for the game. Use the module's profiler rather than making another.
+    """
+    def __init__(self, window=600, hud_interval=0.25):
+        """
+        :param window: int - samples kept per metric for percentiles.
+        :param hud_interval: float - seconds between updates of the HUD readout. Working out percentiles every frame
+                             would take more time than some of the things being measured.
+        """
+        self.enabled = False
+        self.show_hud = False  # Draw the HUD_METRICS in the top HUD.
+        self.window = window
+        self.hud_interval = hud_interval
+        self.hud_cache = (0.0, None)  # When the HUD lines were last worked out, and the lines.
+        self.metrics = dict()  # Name -> Metric
+        self.sampler = None  # StackSampler while sampling.
+        self.last_sampler = None  # The sampler from the last time sampling ran, kept for exporting.
+
+    def enable(self, show_hud=True):
+        self.enabled = True
+        self.show_hud = show_hud
+
+    def disable(self):
+        self.enabled = False
+        self.show_hud = False
+
+    def reset(self):
+        self.metrics.clear()
+
+    def metric(self, name, kind):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = Metric(kind, self.window)
+        return metric
+
+    def record(self, name, seconds):
+        # Add a timing, in seconds.
+        if self.enabled:
+            self.metric(name, "timer").add(seconds)
+
+    def count(self, name, value=1):
+        # Add a counter sample, e.g. monsters moved this turn.
+        if self.enabled:
+            self.metric(name, "counter").add(value)
+
+    def timer(self, name):
+        # Context manager timing a block, e.g. with profiler.timer("frame"): ...
+        return Timer(self, name) if self.enabled else NULL_TIMER
+
+    def summary(self, percentiles=PERCENTILES):
+        # Name -> dict of count, total, mean, max and percentiles. Timers are in milliseconds.
+        return {name: metric.summary(percentiles) for name, metric in sorted(self.metrics.items())}
+
+    def hud_lines(self, metric_lines=HUD_METRICS):
+        # Short p50/p95 readouts for the top HUD, updated every hud_interval seconds.
+        now = time.perf_counter()
+        updated, lines = self.hud_cache
+        if lines is not None and now - updated < self.hud_interval:
+            return lines
+
+        lines = list()
+        for names in metric_lines:
+            parts = list()
+            for name in names:
+                metric = self.metrics.get(name)
+                if metric is not None:
+                    summary = metric.summary((50, 95))
+                    number = "{:.2f}/{:.2f}" if metric.kind == "timer" else "{:.0f}/{:.0f}"
+                    parts.append("{} ".format(name) + number.format(summary["p50"], summary["p95"]))
+            lines.append("  ".join(parts))
+
+        if self.sampler is not None:
+            lines[-1] += "  [sampling, {} stacks]".format(self.sampler.samples)
+
+        self.hud_cache = (now, lines)
+        return lines
+
+    def command(self, command, path_prefix="profile"):
+        """
+        Carry out a profiling command from handle_keys.
+
+        :param command: str - "toggle" the profiler and HUD readout, switch "sample"-ing on or off, or "export" the
+                        metrics to path_prefix.json and .csv and the sampled stacks to path_prefix_stacks.txt.
+        """
+        if command == "toggle":
+            if self.enabled:
+                self.disable()
+            else:
+                self.enable()
+        elif command == "sample":
+            self.toggle_sampling()
+        elif command == "export":
+            self.export_json(path_prefix + ".json")
+            self.export_csv(path_prefix + ".csv")
+            self.export_samples(path_prefix + "_stacks.txt")
+
+    def export_json(self, path):
+        with open(path, "w") as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def export_csv(self, path):
+        columns = ["kind", "count", "total", "mean", "max"] + ["p{}".format(percentile) for percentile in PERCENTILES]
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["name"] + columns)
+            for name, summary in self.summary().items():
+                writer.writerow([name] + [summary[column] for column in columns])
+
+    def start_sampling(self, interval=0.001, thread=None):
+        """
+        Start the sampling profiler.
+
+        :param interval: float - seconds between samples.
+        :param thread: threading.Thread to sample. The calling thread by default.
+        """
+        if self.sampler is None:
+            thread_id = (thread or threading.current_thread()).ident
+            self.sampler = StackSampler(thread_id, interval)
+            self.sampler.start()
+        return self.sampler
+
+    def stop_sampling(self):
+        # Stop the sampling profiler, returning the sampler with its results.
+        sampler = self.sampler
+        if sampler is not None:
+            sampler.stop()
+            self.sampler = None
+            self.last_sampler = sampler
+        return sampler
+
+    def toggle_sampling(self):
+        if self.sampler is None:
+            self.start_sampling()
+        else:
+            self.stop_sampling()
+
+    def export_samples(self, path):
+        # Write the stacks from the running (or last) sampler in folded format.
+        sampler = self.sampler or self.last_sampler
+        with open(path, "w") as file:
+            file.write("\n".join(sampler.folded() if sampler is not None else ()))
+
+
+profiler = Profiler()
+
+
+def timed(name):
+    """
+    Decorator timing every call of a function into the named metric while the profiler is enabled.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.record(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+timed_code = timed("")(None).__code__  # Code of the wrappers timed makes, for StackSampler to skip.
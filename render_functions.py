@@ -1,4 +1,8 @@
 import pygame
+import numpy as np
+from classes import get_entities_in_chunk, get_shared_surface
+from tile_functions import TERRAIN
+from profile_functions import profiler, timed
 
 # Set up colours.
 CLR_WHITE = (255, 255, 255)
@@ -8,6 +12,12 @@ CLR_RED = (255, 0, 0)
 CLR_GREEN = (0, 255, 0)
 CLR_YELLOW = (255, 255, 0)
 
+# Font for the profiler readout in the top HUD, loaded when first needed and dropped when pygame quits.
+hud_font = None
+
+# Sprites in the tileset: name -> (tile id in sprites/monochrome.png, colour its white pixels are drawn in).
+SPRITE_TILES = {"player": (27, CLR_WHITE), "tree": (32, (163, 206, 39)), "orc": (214, (164, 100, 34))}
+
 
 def map_coords_to_pixels(map_x, map_y):
     """
@@ -19,8 +29,9 @@ def map_coords_to_pixels(map_x, map_y):
     return int(map_x * 16), int(map_y * 16)
 
 
+@timed("render_all")
 def render_all(screen_surface, screen_width, screen_height, view_port_width, view_port_height, view_port_x_offset,
-               view_port_y_offset, game_map, player, entities, visible_map_chunk, sprites):
+               view_port_y_offset, game_map, player, entities, visible_map_chunk, sprites, render_cache=None):
     """
 
     :param screen_surface: obj - the main pygame drawing surface.
@@ -33,9 +44,16 @@ def render_all(screen_surface, screen_width, screen_height, view_port_width, vie
     :param game_map: game map object
     :param player: player object
     :param entities: list - tracking all entities in game.
+    :param render_cache: MapRenderCache - if given, draw from the pre-rendered map and only update changed rects.
     :return:
     """
 
+    if render_cache is not None:
+        dirty_rects = render_cache.render(screen_surface, screen_width, screen_height, view_port_width, view_port_height,
+                                          view_port_x_offset, view_port_y_offset, player, entities, visible_map_chunk)
+        pygame.display.update(dirty_rects)
+        return
+
     # Set the background colour of the window to black.
     screen_surface.fill(CLR_BLACK)
 
@@ -52,6 +70,7 @@ def render_all(screen_surface, screen_width, screen_height, view_port_width, vie
     clear_entities(screen_surface, view_port_x_offset, view_port_y_offset, entities, visible_map_chunk)
 
 
+@timed("render_top_hud")
 def render_top_hud(screen_surface, screen_width, screen_height, view_port_width, view_port_height, view_port_x_offset, view_port_y_offset, player):
     hud_screen_x1 = view_port_x_offset
     hud_screen_x2 = view_port_x_offset + view_port_width
@@ -63,7 +82,30 @@ def render_top_hud(screen_surface, screen_width, screen_height, view_port_width,
 
     draw_element(screen_surface, hud_screen_x1, hud_screen_y1, hud_width, hud_height, CLR_BLUE)
 
+    if profiler.show_hud:
+        render_profile(screen_surface, hud_screen_x1 + 4, hud_screen_y1 + 2, hud_height - 2)
+
+
+def forget_hud_font():
+    global hud_font
+    hud_font = None
+
+
+def render_profile(screen_surface, screen_x, screen_y, height):
+    # Write the profiler's p50/p95 readouts (milliseconds, or counts) one line under another.
+    global hud_font
+    if hud_font is None:
+        hud_font = pygame.font.Font(None, 16)
+        pygame.register_quit(forget_hud_font)  # A font can't be used once pygame quits, even after it starts again.
+
+    line_height = hud_font.get_linesize()
+    for number, line in enumerate(profiler.hud_lines()):
+        if (number + 1) * line_height > height:
+            break
+        screen_surface.blit(hud_font.render(line, True, CLR_WHITE), (screen_x, screen_y + number * line_height))
+
 
+@timed("render_bottom_hud")
 def render_bottom_hud(screen_surface, screen_width, screen_height, view_port_width, view_port_height, view_port_x_offset, view_port_y_offset, player):
     hud_screen_x1 = view_port_x_offset
     hud_screen_x2 = view_port_x_offset + view_port_width
@@ -76,63 +118,241 @@ def render_bottom_hud(screen_surface, screen_width, screen_height, view_port_wid
     draw_element(screen_surface, hud_screen_x1, hud_screen_y1, hud_width, hud_height, CLR_BLUE)
 
 
+@timed("render_map")
 def render_map(screen_surface, view_port_x_offset, view_port_y_offset, game_map, visible_map_chunk, sprites):
-    map_chunk_x1 = visible_map_chunk.x1
-    map_chunk_y1 = visible_map_chunk.y1
-
-    floor_colour = CLR_BLACK
-    wall_colour = CLR_WHITE
-
-    # Load sprites
-    SPR_TREE = sprites.get("tree")
+    # Draw each tile as its terrain, reading the terrain ids for the whole chunk with one slice.
+    terrain_ids = game_map.tiles.terrain[visible_map_chunk.slices()].tolist()
+    surfaces = terrain_surfaces(sprites)
 
-    # Draw walls (blocked tiles).
-    for x, y in visible_map_chunk:
-        if game_map.blocked[x, y]:  # If it's a wall, work out its screen position, create filled surface and blit.
-            tile_colour = wall_colour
-            tile_sprite = SPR_TREE
-        else:
-            tile_colour = floor_colour
-            tile_sprite = None
+    # Screen position of each column and row of tiles.
+    screen_xs = [view_port_x_offset + tile_screen_x for tile_screen_x in range(0, len(terrain_ids) * 16, 16)]
+    screen_ys = [view_port_y_offset + tile_screen_y for tile_screen_y in range(0, visible_map_chunk.height * 16, 16)]
 
-        # Calculate screen position for tile. Draw it!
-        tile_screen_x, tile_screen_y = map_coords_to_pixels(x - map_chunk_x1, y - map_chunk_y1)
-        draw_element(screen_surface, tile_screen_x + view_port_x_offset, tile_screen_y + view_port_y_offset, 16, 16, tile_colour, tile_sprite)
+    # Draw them all with one call.
+    screen_surface.blits([(surfaces[terrain_id], (screen_x, screen_y))
+                          for screen_x, column in zip(screen_xs, terrain_ids) for screen_y, terrain_id in zip(screen_ys, column)], doreturn=False)
 
 
+@timed("render_entities")
 def render_entities(screen_surface, view_port_x_offset, view_port_y_offset, entities, visible_map_chunk):
     map_chunk_x1 = visible_map_chunk.x1
     map_chunk_y1 = visible_map_chunk.y1
 
-    # Iterate through entities and blit it's surface to the screen.
-    for entity in entities:
-        entity_screen_x, entity_screen_y = map_coords_to_pixels(entity.map_x - map_chunk_x1, entity.map_y - map_chunk_y1)
-        screen_surface.blit(entity.surf, (entity_screen_x + view_port_x_offset, entity_screen_y + view_port_y_offset))
+    # Blit every visible entity's surface to the screen in one call.
+    screen_surface.blits([(entity.surf, ((entity.map_x - map_chunk_x1) * 16 + view_port_x_offset, (entity.map_y - map_chunk_y1) * 16 + view_port_y_offset))
+                          for entity in get_entities_in_chunk(entities, visible_map_chunk)], doreturn=False)
+
+
+def terrain_surfaces(sprites):
+    # Surface to draw each terrain id with, shared with anything else drawn with the same sprite or colour.
+    return {terrain_id: get_shared_surface(sprites.get(terrain["sprite"]), terrain["colour"]) for terrain_id, terrain in TERRAIN.items()}
 
 
 def draw_element(screen_surface, screen_x, screen_y, element_width, element_height, colour, sprite=None):
-    element_surface = pygame.Surface((element_width, element_height))
+    element_rect = pygame.Rect(screen_x, screen_y, element_width, element_height)
 
-    # If there is a sprite, blit it to the element's surface - if not just fill with block colour.
+    # If there is a sprite, draw it over a black background - if not just fill with block colour.
     if sprite:
-        element_surface.blit(sprite, (0, 0))
+        screen_surface.fill(CLR_BLACK, element_rect)
+        screen_surface.blit(sprite, element_rect, pygame.Rect(0, 0, element_width, element_height))
     else:
-        element_surface.fill(colour)
-
-    screen_surface.blit(element_surface, (screen_x, screen_y))
+        screen_surface.fill(colour, element_rect)
 
 
+@timed("clear_entities")
 def clear_entities(screen_surface, view_port_x_offset, view_port_y_offset, entities, visible_map_chunk):
     map_chunk_x1 = visible_map_chunk.x1
     map_chunk_y1 = visible_map_chunk.y1
 
-    # Iterate through entities and clear it.
-    for entity in entities:
+    # Iterate through visible entities and clear it.
+    for entity in get_entities_in_chunk(entities, visible_map_chunk):
         entity_screen_x, entity_screen_y = map_coords_to_pixels(entity.map_x - map_chunk_x1, entity.map_y - map_chunk_y1)
         clear_element(screen_surface, entity_screen_x, entity_screen_y, 16, 16)
 
 
 def clear_element(screen_surface, screen_x, screen_y, element_width, element_height, colour=CLR_BLACK):
-    element_surface = pygame.Surface((element_width, element_height))
-    element_surface.fill(colour)
-    screen_surface.blit(element_surface, (screen_x, screen_y))
+    screen_surface.fill(colour, pygame.Rect(screen_x, screen_y, element_width, element_height))
+
+
+class SpriteAtlas:
+    """
+    Sprites cut from one tileset image, drawn white on black. The image is converted to the display's pixel format
+    once, a tinted copy is made once per colour, and each sprite is a subsurface of a tinted copy, so sprites share
+    pixels rather than each being a Surface of their own.
+    Tile ids count across the tileset and then down, from 0 in the top left.
+    """
+    def __init__(self, path, cell_size=17, tile_size=16):
+        """
+        :param path: tileset image file, e.g. sprites/monochrome.png.
+        :param cell_size: int - distance in pixels from one tile to the next in the image.
+        :param tile_size: int - width and height in pixels of the part of each tile which is drawn.
+        """
+        image = pygame.image.load(path)
+
+        # A new Surface has the display's pixel format (if there is a display), so sprites blit without conversion.
+        self.sheet = pygame.Surface(image.get_size())
+        self.sheet.blit(image, (0, 0))
+
+        self.cell_size = cell_size
+        self.tile_size = tile_size
+        self.tiles_wide = image.get_width() // cell_size
+        self.tinted_sheets = dict()  # Colour -> copy of the sheet with white drawn in that colour.
+        self.tiles = dict()  # (tile id, colour) -> subsurface of a tinted sheet.
+
+    def tile(self, tile_id, colour=CLR_WHITE):
+        # The sprite for a tile id, with its white pixels drawn in colour.
+        colour = tuple(colour)
+        surface = self.tiles.get((tile_id, colour))
+
+        if surface is None:
+            sheet = self.tinted_sheets.get(colour)
+            if sheet is None:
+                sheet = self.sheet.copy()
+                sheet.fill(colour, special_flags=pygame.BLEND_RGB_MULT)
+                self.tinted_sheets[colour] = sheet
+
+            row, column = divmod(tile_id, self.tiles_wide)
+            surface = sheet.subsurface(pygame.Rect(column * self.cell_size, row * self.cell_size, self.tile_size, self.tile_size))
+            self.tiles[(tile_id, colour)] = surface
+
+        return surface
+
+    def sprites(self, sprite_tiles=None):
+        """
+        Sprites dict for the game, as used by new_game and the render functions.
+
+        :param sprite_tiles: dict - name -> (tile id, colour). SPRITE_TILES by default.
+        """
+        if sprite_tiles is None:
+            sprite_tiles = SPRITE_TILES
+        return {name: self.tile(tile_id, colour) for name, (tile_id, colour) in sprite_tiles.items()}
+
+
+class MapRenderCache:
+    """
+    Pre-rendered copy of the game map, split into large pages so each frame is a few blits rather than one per tile.
+    Pages are only re-drawn when tiles on them change. Also remembers what was drawn last frame, so that when the
+    view port hasn't scrolled only the tiles entities moved between need to be redrawn and sent to the display.
+    """
+    def __init__(self, game_map, sprites, page_size=64):
+        self.game_map = game_map
+        self.sprites = sprites
+        self.page_size = page_size  # Width and height of each page in map tiles.
+        self.pages = dict()  # (page_x, page_y) -> Surface
+        self.revision = game_map.revision  # GameMap revision the pages were drawn from.
+        self.last_chunk = None  # (x1, y1) of the map chunk drawn last frame.
+        self.entity_tiles = list()  # Map tiles entities were drawn on last frame.
+        self.showed_hud = False  # Whether the profiler readout was drawn last frame.
+
+    def sync(self):
+        """
+        Throw away pages with changed tiles on them.
+
+        :return: list of changed (x, y) tiles, or None if the whole map needs redrawing.
+        """
+        changed_tiles = self.game_map.changes_since(self.revision)
+        self.revision = self.game_map.revision
+
+        if changed_tiles is None:
+            self.pages.clear()
+        else:
+            for x, y in changed_tiles:
+                self.pages.pop((x // self.page_size, y // self.page_size), None)
+
+        return changed_tiles
+
+    def page(self, page_x, page_y):
+        # Get a page, drawing it if necessary.
+        surface = self.pages.get((page_x, page_y))
+
+        if surface is None:
+            surface = pygame.Surface(map_coords_to_pixels(self.page_size, self.page_size))
+            surface.fill(CLR_BLACK)
+
+            x1, y1 = page_x * self.page_size, page_y * self.page_size
+            terrain = self.game_map.tiles.terrain[max(x1, 0):x1 + self.page_size, max(y1, 0):y1 + self.page_size]
+            surfaces = terrain_surfaces(self.sprites)
+            for terrain_id in np.unique(terrain):
+                if not self.sprites.get(TERRAIN[terrain_id]["sprite"]) and TERRAIN[terrain_id]["colour"] == CLR_BLACK:
+                    continue  # Already filled in.
+
+                tile_surface = surfaces[terrain_id]
+                surface.blits([(tile_surface, (x * 16, y * 16)) for x, y in np.argwhere(terrain == terrain_id).tolist()], doreturn=False)
+
+            self.pages[(page_x, page_y)] = surface
+
+        return surface
+
+    def blit_map_area(self, screen_surface, x1, x2, y1, y2, screen_x, screen_y):
+        # Copy map tiles x1 to x2 and y1 to y2 (inclusive) to the screen, with the top left tile at screen_x, screen_y.
+        page_size = self.page_size
+        for page_x in range(x1 // page_size, x2 // page_size + 1):
+            for page_y in range(y1 // page_size, y2 // page_size + 1):
+                # Part of the area that falls on this page.
+                area_x1 = max(x1, page_x * page_size)
+                area_x2 = min(x2, page_x * page_size + page_size - 1)
+                area_y1 = max(y1, page_y * page_size)
+                area_y2 = min(y2, page_y * page_size + page_size - 1)
+
+                area = pygame.Rect(map_coords_to_pixels(area_x1 - page_x * page_size, area_y1 - page_y * page_size),
+                                   map_coords_to_pixels(area_x2 - area_x1 + 1, area_y2 - area_y1 + 1))
+                area_screen_x, area_screen_y = map_coords_to_pixels(area_x1 - x1, area_y1 - y1)
+                screen_surface.blit(self.page(page_x, page_y), (screen_x + area_screen_x, screen_y + area_screen_y), area)
+
+    @timed("render_cache")
+    def render(self, screen_surface, screen_width, screen_height, view_port_width, view_port_height, view_port_x_offset,
+               view_port_y_offset, player, entities, visible_map_chunk):
+        """
+        Draw a frame.
+
+        :return: list of pygame Rects which have changed on the screen.
+        """
+        changed_tiles = self.sync()
+        map_chunk_x1 = visible_map_chunk.x1
+        map_chunk_y1 = visible_map_chunk.y1
+        view_port_rect = pygame.Rect(view_port_x_offset, view_port_y_offset, view_port_width, view_port_height)
+
+        def tile_rect(x, y):
+            tile_screen_x, tile_screen_y = map_coords_to_pixels(x - map_chunk_x1, y - map_chunk_y1)
+            return pygame.Rect(tile_screen_x + view_port_x_offset, tile_screen_y + view_port_y_offset, 16, 16)
+
+        # Don't let the map or entities spill out of the view port over the HUD.
+        screen_surface.set_clip(view_port_rect)
+
+        full_redraw = changed_tiles is None or self.last_chunk != (map_chunk_x1, map_chunk_y1)
+        if full_redraw:
+            self.blit_map_area(screen_surface, visible_map_chunk.x1, visible_map_chunk.x2, visible_map_chunk.y1,
+                               visible_map_chunk.y2, view_port_x_offset, view_port_y_offset)
+            dirty_tiles = list()
+        else:
+            # Redraw changed tiles, and the background where entities were last frame.
+            dirty_tiles = [tile for tile in changed_tiles if tile in visible_map_chunk]
+            dirty_tiles.extend(self.entity_tiles)
+            for x, y in dirty_tiles:
+                self.blit_map_area(screen_surface, x, x, y, y, *tile_rect(x, y).topleft)
+
+        # Draw entities on top, in one call.
+        visible_entities = get_entities_in_chunk(entities, visible_map_chunk)
+        self.entity_tiles = [(entity.map_x, entity.map_y) for entity in visible_entities]
+        screen_surface.blits([(entity.surf, tile_rect(map_x, map_y)) for entity, (map_x, map_y) in zip(visible_entities, self.entity_tiles)], doreturn=False)
+
+        screen_surface.set_clip(None)
+        self.last_chunk = (map_chunk_x1, map_chunk_y1)
+
+        # The top HUD is drawn while the profiler readout shows, and once more when it is switched off to clear it.
+        redraw_top_hud = profiler.show_hud or self.showed_hud
+        self.showed_hud = profiler.show_hud
+
+        if full_redraw:
+            render_bottom_hud(screen_surface, screen_width, screen_height, view_port_width, view_port_height, view_port_x_offset, view_port_y_offset, player)
+            render_top_hud(screen_surface, screen_width, screen_height, view_port_width, view_port_height, view_port_x_offset, view_port_y_offset, player)
+            return [screen_surface.get_rect()]
+
+        dirty_tiles.extend(self.entity_tiles)
+        dirty_rects = [tile_rect(x, y).clip(view_port_rect) for x, y in set(dirty_tiles)]
+
+        if redraw_top_hud:
+            render_top_hud(screen_surface, screen_width, screen_height, view_port_width, view_port_height, view_port_x_offset, view_port_y_offset, player)
+            dirty_rects.append(pygame.Rect(view_port_x_offset, 0, view_port_width, view_port_y_offset))
+
+        return dirty_rects
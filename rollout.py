@@ -0,0 +1,203 @@
+"""
+Run headless games in worker processes for agent rollouts on every core.
+Actions, observations, rewards and dones are exchanged through multiprocessing.shared_memory buffers, so the only
+thing sent between processes each step is a one byte command.
+"""
+
+import random
+import traceback
+import multiprocessing
+import numpy as np
+from multiprocessing import shared_memory
+from simulation import Simulation, observation_shape
+
+# Commands sent to workers.
+RESET = b"r"
+STEP = b"s"
+CLOSE = b"c"
+
+# Prefix of a worker reply carrying an error.
+FAILED = b"!"
+
+
+def shared_layout(num_envs, observation_shape):
+    # Name, dtype and shape of each shared buffer.
+    return (("actions", np.int8, (num_envs,)),
+            ("observations", np.int8, (num_envs, 2) + tuple(observation_shape)),
+            ("rewards", np.float32, (num_envs,)),
+            ("dones", np.bool_, (num_envs,)))
+
+
+def attach_arrays(memory, layout):
+    # Lay numpy arrays over the shared memory blocks.
+    return {name: np.ndarray(shape, dtype=dtype, buffer=memory[name].buf) for name, dtype, shape in layout}
+
+
+def worker_main(connection, memory_names, layout, first, count, seed, simulation_kwargs):
+    """
+    Worker process loop. Runs count games, which own rows first to first + count of the shared arrays.
+
+    :param connection: multiprocessing Connection to the runner.
+    :param memory_names: dict of shared memory block names, by buffer name.
+    :param layout: buffer layout from shared_layout.
+    :param first: int - index of this worker's first game.
+    :param count: int - number of games run by this worker.
+    :param seed: int - seed for this worker. Every game it resets takes its seed from it.
+    :param simulation_kwargs: dict of keyword arguments for Simulation.
+    """
+    memory = {name: shared_memory.SharedMemory(name=memory_name) for name, memory_name in memory_names.items()}
+    arrays = attach_arrays(memory, layout)
+    actions = arrays["actions"][first:first + count]
+    observations = arrays["observations"][first:first + count]
+    rewards = arrays["rewards"][first:first + count]
+    dones = arrays["dones"][first:first + count]
+
+    seeds = random.Random(seed)  # Seeds for each new game, so a worker always plays the same sequence of games.
+    simulations = [Simulation(**simulation_kwargs) for _ in range(count)]
+
+    try:
+        while True:
+            command = connection.recv_bytes()
+
+            try:
+                if command == RESET:
+                    seeds.seed(seed)
+                    for i, simulation in enumerate(simulations):
+                        simulation.reset(seeds.getrandbits(32))
+                        simulation.observation_layers(out=observations[i])
+                    rewards[:] = 0
+                    dones[:] = False
+
+                elif command == STEP:
+                    for i, simulation in enumerate(simulations):
+                        observation, reward, done, info = simulation.step(int(actions[i]))
+                        if done:
+                            simulation.reset(seeds.getrandbits(32))  # Finished games restart straight away.
+                        simulation.observation_layers(out=observations[i])
+                        rewards[i] = reward
+                        dones[i] = done
+
+                elif command == CLOSE:
+                    break
+
+            except Exception:
+                connection.send_bytes(FAILED + traceback.format_exc().encode())
+            else:
+                connection.send_bytes(command)
+
+    finally:
+        # Arrays have to be let go of before the memory they view can be closed.
+        del actions, observations, rewards, dones, arrays
+        for block in memory.values():
+            block.close()
+        connection.close()
+
+
+class RolloutRunner:
+    """
+    A pool of worker processes, each running envs_per_worker Simulations.
+    Games are numbered worker by worker, so game i is run by worker i // envs_per_worker.
+
+    The arrays returned by reset and step are views of the shared buffers, and are overwritten by the next step.
+    Copy them to keep them.
+    """
+    def __init__(self, num_workers, envs_per_worker=1, seed=0, start_method=None, **simulation_kwargs):
+        self.num_workers = num_workers
+        self.envs_per_worker = envs_per_worker
+        self.num_envs = num_workers * envs_per_worker
+        self.seed = seed
+        # Worked out from the view port size, rather than by making a game just to ask it.
+        self.observation_shape = observation_shape(**{name: simulation_kwargs[name] for name in ("view_port_width", "view_port_height")
+                                                      if name in simulation_kwargs})
+
+        layout = shared_layout(self.num_envs, self.observation_shape)
+        self.memory = {name: shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+                       for name, dtype, shape in layout}
+        arrays = attach_arrays(self.memory, layout)
+        self.actions = arrays["actions"]
+        self.observations = arrays["observations"]
+        self.rewards = arrays["rewards"]
+        self.dones = arrays["dones"]
+
+        # Independent seeds for each worker, which stay the same for a given seed and number of workers.
+        worker_seeds = [int(sequence.generate_state(1)[0]) for sequence in np.random.SeedSequence(seed).spawn(num_workers)]
+
+        context = multiprocessing.get_context(start_method)
+        memory_names = {name: block.name for name, block in self.memory.items()}
+        self.connections = list()
+        self.workers = list()
+        for worker in range(num_workers):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target=worker_main, daemon=True,
+                                      args=(worker_connection, memory_names, layout, worker * envs_per_worker,
+                                            envs_per_worker, worker_seeds[worker], simulation_kwargs))
+            process.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.workers.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def command(self, command):
+        # Send a command to every worker, then wait for them all to finish it. Every reply is read before raising,
+        # so replies to this command can't be taken for replies to the next one.
+        for connection in self.connections:
+            connection.send_bytes(command)
+
+        errors = list()
+        for worker, connection in enumerate(self.connections):
+            try:
+                reply = connection.recv_bytes()
+            except (EOFError, OSError):
+                errors.append("Rollout worker {} exited unexpectedly.".format(worker))
+                continue
+            if reply.startswith(FAILED):
+                errors.append("Rollout worker {} failed:\n{}".format(worker, reply[len(FAILED):].decode()))
+
+        if errors:
+            raise RuntimeError("\n".join(errors))
+
+    def reset(self):
+        """
+        Start new games in every worker. Resetting replays the same games each time.
+
+        :return: observations, int8 array shaped (games, 2, width, height). See Simulation.observation_layers.
+        """
+        self.command(RESET)
+        return self.observations
+
+    def step(self, actions):
+        """
+        Run one turn in every game. Finished games are reset automatically, so their observation is the new game's.
+
+        :param actions: array of ints, one index into simulation.ACTIONS per game.
+        :return: observations, rewards, dones.
+        """
+        self.actions[:] = actions
+        self.command(STEP)
+        return self.observations, self.rewards, self.dones
+
+    def close(self):
+        if self.workers is None:
+            return
+
+        for connection, process in zip(self.connections, self.workers):
+            try:
+                connection.send_bytes(CLOSE)
+                connection.recv_bytes()
+            except (BrokenPipeError, EOFError, OSError):
+                pass  # The worker has already gone.
+            connection.close()
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.workers = None
+
+        del self.actions, self.observations, self.rewards, self.dones
+        for block in self.memory.values():
+            block.close()
+            block.unlink()
@@ -0,0 +1,191 @@
+"""
+Headless version of the game for running agents, e.g. reinforcement learning rollouts.
+Runs the same turn cycle and rules as engine.main without pygame, a display or any surfaces.
+"""
+
+import random
+from contextlib import nullcontext
+from copy import copy
+import numpy as np
+from classes import Player, Monster, get_entities_in_chunk, messages_to
+from map_functions import display_to_map, get_visible_map_chunk
+from game_functions import new_game, player_turn, monster_turn
+from game_states import Turn
+from snapshot_functions import clone_game, save_game, load_game
+
+
+# Actions an agent can choose by index. The same dicts handle_keys returns, plus waiting a turn.
+ACTIONS = ({"move": (0, -1)}, {"move": (0, 1)}, {"move": (-1, 0)}, {"move": (1, 0)},
+           {"move": (-1, -1)}, {"move": (1, -1)}, {"move": (-1, 1)}, {"move": (1, 1)}, {})
+
+# Tile values in observations.
+OBS_FLOOR = 0
+OBS_WALL = 1
+OBS_MONSTER = 2
+OBS_PLAYER = 3
+
+
+def observation_shape(view_port_width=800, view_port_height=480):
+    # Size in tiles of the grids Simulation.observation returns for a view port of this size in pixels.
+    visible_width, visible_height = display_to_map(view_port_width, view_port_height)
+    return visible_width + 1, visible_height + 1
+
+
+class Simulation:
+    """
+    A game without the window. Call reset to start a game, then step with actions.
+    The default sizes match engine.main.
+    """
+    def __init__(self, map_width=None, map_height=None, monster_count=10, view_port_width=800, view_port_height=480,
+                 max_steps=1000, quiet=True, scheduler=None, drift=None):
+        if map_width is None or map_height is None:
+            map_width, map_height = display_to_map(800 * 2, 640 * 2)
+
+        self.map_width = map_width
+        self.map_height = map_height
+        self.monster_count = monster_count
+        self.view_port_width = view_port_width  # Size in pixels of the view port the player sees the map through.
+        self.view_port_height = view_port_height
+        self.max_steps = max_steps  # Steps before an episode is cut short.
+        self.scheduler = scheduler  # AIScheduler, TurnScheduler or TieredScheduler to run monster turns with. By default they run as in monster_turn.
+        self.drift = drift  # Drift for the game map's FlowFieldCache, or None for its default. As large as the map makes pathfinding exact.
+
+        self.rng = random.Random()
+        self.player = None
+        self.entities = None
+        self.game_map = None
+        self.monster_slots = None  # Rows of the monsters in the entity store.
+        self.current_turn = Turn.player
+        self.steps = 0
+
+        self.quiet = quiet  # Silence combat messages while this simulation runs, as they are just overhead here.
+
+    def reset(self, seed=None):
+        """
+        Start a new game.
+
+        :param seed: int - seed for the map and monster placement. The same seed always gives the same game.
+        :return: the first observation.
+        """
+        self.rng.seed(seed)
+        self.player, self.entities, self.game_map = new_game(self.map_width, self.map_height, self.monster_count, self.rng)
+        if self.drift is not None:
+            self.game_map.flow_fields.drift = self.drift
+        self.monster_slots = np.array([entity.slot for entity in self.entities if isinstance(entity, Monster)], dtype=int)
+        self.current_turn = Turn.player
+        self.steps = 0
+        return self.observation()
+
+    def clone(self):
+        """
+        A copy of the simulation which can be stepped separately, e.g. to try out actions in a search. Cheap to make:
+        the map and pathfinding maps are shared until either copy changes them.
+        """
+        simulation = copy(self)
+        simulation.player, simulation.entities, simulation.game_map, entity_map = clone_game(self.player, self.entities, self.game_map)
+        simulation.rng = random.Random()
+        simulation.rng.setstate(self.rng.getstate())
+        if self.scheduler is not None:
+            simulation.scheduler = self.scheduler.clone(entity_map)
+        return simulation
+
+    def save(self, path):
+        # Save the game being played to a snapshot file. See snapshot_functions.save_game.
+        save_game(path, self.player, self.entities, self.game_map, self.current_turn, self.rng, self.scheduler)
+
+    def load(self, path):
+        """
+        Carry on from a game saved with save. The episode's step count starts again from 0.
+
+        :return: the observation.
+        """
+        self.player, self.entities, self.game_map, self.current_turn = load_game(path, self.rng, self.scheduler)
+        self.monster_slots = np.array([entity.slot for entity in self.entities if isinstance(entity, Monster)], dtype=int)
+        self.steps = 0
+        return self.observation()
+
+    def step(self, action):
+        """
+        Run one player turn and the monster turn after it.
+
+        :param action: int index into ACTIONS, or an action dict as returned by handle_keys.
+        :return: observation, reward, done, info. Reward is damage dealt to monsters less damage taken.
+        """
+        if isinstance(action, (int, np.integer)):
+            action = ACTIONS[action]
+
+        player_health = self.player.stats.h
+        monster_health = self.monster_health()
+
+        # The engine works out what can be seen once per loop, before the player moves.
+        visible_map_chunk = get_visible_map_chunk(self.player, self.game_map, self.view_port_width, self.view_port_height)
+
+        # Messages are only silenced for the turns, so other games in the process still get theirs.
+        with messages_to(None) if self.quiet else nullcontext():
+            # Player turn.
+            player_turn(action, self.player, self.entities, self.game_map)
+            self.current_turn = Turn.monster
+
+            # Monster turn.
+            if self.scheduler is not None:
+                self.scheduler.monster_turn(self.player, self.entities, self.game_map, visible_map_chunk)
+            else:
+                monster_turn(self.player, self.entities, self.game_map, visible_map_chunk)
+            self.current_turn = Turn.player
+        self.steps += 1
+
+        reward = (monster_health - self.monster_health()) - (player_health - self.player.stats.h)
+        done = self.player.stats.h <= 0 or self.steps >= self.max_steps
+        info = {"steps": self.steps, "player_health": self.player.stats.h}
+        return self.observation(), reward, done, info
+
+    def monster_health(self):
+        return int(self.entities.store.h[self.monster_slots].sum())
+
+    def observation(self):
+        """
+        The part of the map the player can see, as a 2d int8 array indexed [x, y] of OBS_ values.
+        """
+        visible_map_chunk = get_visible_map_chunk(self.player, self.game_map, self.view_port_width, self.view_port_height)
+        x1, y1 = visible_map_chunk.x1, visible_map_chunk.y1
+
+        grid = self.game_map.blocked[visible_map_chunk.slices()].astype(np.int8)
+        for entity in get_entities_in_chunk(self.entities, visible_map_chunk):
+            grid[entity.map_x - x1, entity.map_y - y1] = OBS_PLAYER if isinstance(entity, Player) else OBS_MONSTER
+
+        return grid
+
+    def observation_shape(self):
+        # Size in tiles of the grids observation returns.
+        return observation_shape(self.view_port_width, self.view_port_height)
+
+    def observation_layers(self, out=None):
+        """
+        The same view as observation, with the map and the entities on it split into layers.
+        Layer 0 holds OBS_WALL for blocked tiles and layer 1 holds OBS_MONSTER and OBS_PLAYER.
+
+        :param out: int8 array shaped (2, width, height) to write into, e.g. a shared memory buffer. Optional.
+        :return: the layers, out if it was given.
+        """
+        visible_map_chunk = get_visible_map_chunk(self.player, self.game_map, self.view_port_width, self.view_port_height)
+        x1, y1 = visible_map_chunk.x1, visible_map_chunk.y1
+
+        if out is None:
+            out = np.zeros((2,) + self.observation_shape(), dtype=np.int8)
+
+        out[0] = self.game_map.blocked[visible_map_chunk.slices()]
+        out[1] = OBS_FLOOR
+        for entity in get_entities_in_chunk(self.entities, visible_map_chunk):
+            out[1, entity.map_x - x1, entity.map_y - y1] = OBS_PLAYER if isinstance(entity, Player) else OBS_MONSTER
+
+        return out
+
+    def observation_channels(self, encoder, out=None):
+        """
+        The view the player has, as the stacked channels of an observation_functions.ObservationEncoder. For many
+        games at once, use encoder.encode_batch.
+
+        :param encoder: ObservationEncoder
+        :param out: array shaped encoder.shape to write into. Optional.
+        """
+        return encoder.encode(self.player, self.entities, self.game_map, out=out)
@@ -0,0 +1,236 @@
+"""
+Saving, loading and copying whole games: the map's tile layers, every entity's position, stats, flee flag and target,
+the pathfinding maps monsters are following, whose turn it is, and the state of the random number generators.
+
+Snapshots are a small binary format: a header, the game's settings and entity details as JSON, then the arrays, each
+starting on a 64 byte boundary so they can be used straight from the loaded bytes without copying. Arrays loaded that
+way are read only, and are copied the first time the game changes them.
+
+clone_game copies a game in memory the same way, sharing arrays between the two games until one of them changes,
+so a game can be branched many times, e.g. to search ahead over the outcomes of monster turns.
+"""
+
+import json
+import struct
+import numpy as np
+from classes import Entity, Player, Monster, EntityStore, EntityIndex
+from game_states import Turn
+from map_functions import GameMap
+from pathfinding import FlowField, FlowFieldCache
+from tile_functions import BitLayer
+
+
+SNAPSHOT_MAGIC = b"RSNP"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<4sHI")  # Magic, version and length of the JSON which follows.
+SECTION_ALIGNMENT = 64
+
+# Entity classes by the name stored in snapshots.
+ENTITY_KINDS = {"Entity": Entity, "Player": Player, "Monster": Monster}
+
+# EntityStore columns saved for each entity. Targets are saved separately, as positions in the entity list.
+ENTITY_COLUMNS = ("map_x", "map_y", "blocks", "h", "m", "s", "d", "max_h", "max_m", "speed", "flee")
+
+# FlowField attributes saved alongside its arrays.
+FLOW_FIELD_ATTRIBUTES = ("radius", "drift", "revision", "shape", "origin", "anchor", "source", "bounds", "patch_bounds",
+                         "rebuilds", "repairs")
+
+
+def clone_game(player, entities, game_map):
+    """
+    Copy a game. Tile layers and pathfinding maps are shared with the original until either game changes them, so
+    the cost is mostly in copying the entities.
+
+    :param player: player object
+    :param entities: EntityIndex - tracking all entities in game.
+    :param game_map: game map object
+    :return: the copied player, entities and game map, and a dict of entity -> its copy for carrying over anything
+             else which refers to entities.
+    """
+    entities, entity_map = entities.clone()
+    return entity_map[player], entities, game_map.clone(entity_map), entity_map
+
+
+def numbered(values):
+    # The distinct values in the order they first appear, and an int32 array of each value's position among them.
+    numbers = dict()
+    array = np.array([numbers.setdefault(value, len(numbers)) for value in values], dtype=np.int32)
+    return list(numbers), array
+
+
+def packed_layer(layer):
+    # A flag layer's bytes as a BitLayer keeps them. Maps stored on disk are read into memory to save them.
+    if isinstance(layer, BitLayer):
+        return layer.packed
+    return np.packbits(np.asarray(layer), axis=1, bitorder="little")
+
+
+def tuple_or_none(value):
+    # JSON turns tuples into lists, and fields compare positions as tuples.
+    return tuple(value) if value is not None else None
+
+
+def game_to_bytes(player, entities, game_map, turn=Turn.player, rng=None, scheduler=None, sprites=None):
+    """
+    Snapshot a game.
+
+    :param player: player object
+    :param entities: EntityIndex - tracking all entities in game.
+    :param game_map: game map object
+    :param turn: Turn - whose turn it is.
+    :param rng: random.Random the game uses, to save its state. Optional.
+    :param scheduler: AIScheduler, TurnScheduler or TieredScheduler running the monster turns, to save the order
+                      monsters act in. Optional.
+    :param sprites: dict of sprite name -> surface, so entities' sprites can be saved by name.
+    :return: bytes
+    """
+    sections = list()  # (name, array)
+    position = {entity: number for number, entity in enumerate(entities)}
+    sprite_names = {id(surface): name for name, surface in (sprites or {}).items()}
+
+    # Map.
+    tiles = game_map.tiles
+    sections += [("blocked", np.asarray(game_map.blocked)), ("terrain", np.asarray(tiles.terrain))]
+    sections += [(flag, packed_layer(getattr(tiles, flag))) for flag in tiles.FLAGS]
+    flow_fields = game_map.flow_fields
+    settings = {"width": game_map.width, "height": game_map.height, "revision": game_map.revision,
+                "bulk_revision": game_map.bulk_revision, "change_log": game_map.change_log,
+                "flow_fields": {"radius": flow_fields.radius, "drift": flow_fields.drift, "repair_budget": flow_fields.repair_budget},
+                "visibility_radius": game_map.visibility.radius}
+
+    # Entities, in the order they were added.
+    store = entities.store
+    slots = np.array([entity.slot for entity in entities], dtype=np.int64)
+    positions_by_slot = np.full(len(store.entities), -1, dtype=np.int32)
+    positions_by_slot[slots] = np.arange(len(slots), dtype=np.int32)
+    targets = store.target[slots]
+    sections += [("entities/" + name, getattr(store, name)[slots]) for name in ENTITY_COLUMNS]
+    sections.append(("entities/target", np.where(targets >= 0, positions_by_slot[targets], -1).astype(np.int32)))
+    # Kinds, names, colours and sprites are shared by many entities, so each is saved once, with an array of which
+    # one each entity has.
+    entity_details = dict()
+    for detail, values in (("kind", [type(entity).__name__ for entity in entities]), ("name", [entity.name for entity in entities]),
+                           ("colour", [tuple(entity.colour) for entity in entities]),
+                           ("sprite", [sprite_names.get(id(entity.sprite)) for entity in entities])):
+        entity_details[detail], numbers = numbered(values)
+        sections.append(("entities/" + detail, numbers))
+    sections.append(("entities/stats", np.array([entity.stats is not None for entity in entities], dtype=bool)))
+
+    # Pathfinding maps being followed, so monsters carry on exactly as they would have.
+    chase_maps = list()
+    for target, field in flow_fields.chase_maps.items():
+        if target in position:
+            chase_maps.append(dict({name: getattr(field, name) for name in FLOW_FIELD_ATTRIBUTES}, target=position[target]))
+            sections += [("chase/{}/anchor_values".format(len(chase_maps) - 1), field.anchor_values),
+                         ("chase/{}/values".format(len(chase_maps) - 1), field.values)]
+
+    scheduler_state = scheduler.state(position) if scheduler is not None else None
+
+    # Lay the arrays out after the JSON, each on an aligned offset.
+    metadata = {"map": settings, "entities": entity_details, "player": position[player], "chase_maps": chase_maps,
+                "turn": turn.value, "rng": rng.getstate() if rng is not None else None, "scheduler": scheduler_state,
+                "arrays": dict()}
+    offset = 0
+    for name, array in sections:
+        metadata["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += -(-array.nbytes // SECTION_ALIGNMENT) * SECTION_ALIGNMENT
+
+    text = json.dumps(metadata).encode()
+    start = -(-(SNAPSHOT_HEADER.size + len(text)) // SECTION_ALIGNMENT) * SECTION_ALIGNMENT
+    data = bytearray(start + offset)
+    SNAPSHOT_HEADER.pack_into(data, 0, SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(text))
+    data[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + len(text)] = text
+    for name, array in sections:
+        section_start = start + metadata["arrays"][name]["offset"]
+        data[section_start:section_start + array.nbytes] = np.ascontiguousarray(array).data.cast("B")
+    return bytes(data)
+
+
+def game_from_bytes(data, rng=None, scheduler=None, sprites=None):
+    """
+    Rebuild a game from game_to_bytes. The map's arrays are read only views of data until they are changed.
+
+    :param data: bytes
+    :param rng: random.Random to restore the saved state to, if one was saved.
+    :param scheduler: AIScheduler, TurnScheduler or TieredScheduler to restore the saved monster order to, if one
+                      was saved. Must be the same kind as the one saved.
+    :param sprites: dict of sprite name -> surface, to give entities their sprites back.
+    :return: player, entities (EntityIndex), game map and whose Turn it is.
+    """
+    magic, version, length = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("not a game snapshot")
+    if version != SNAPSHOT_VERSION:
+        raise ValueError("game snapshot is version {}, only version {} can be loaded".format(version, SNAPSHOT_VERSION))
+    metadata = json.loads(bytes(data[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + length]).decode())
+    start = -(-(SNAPSHOT_HEADER.size + length) // SECTION_ALIGNMENT) * SECTION_ALIGNMENT
+
+    def array(name):
+        section = metadata["arrays"][name]
+        shape = tuple(section["shape"])
+        if not np.prod(shape):
+            return np.empty(shape, dtype=section["dtype"])
+        return np.frombuffer(data, dtype=section["dtype"], count=int(np.prod(shape)), offset=start + section["offset"]).reshape(shape)
+
+    # Map.
+    settings = metadata["map"]
+    game_map = GameMap(settings["width"], settings["height"], block_borders=False, blocked=array("blocked"))
+    game_map.tiles.terrain = array("terrain")
+    for flag in game_map.tiles.FLAGS:
+        getattr(game_map.tiles, flag).packed = array(flag)
+    game_map.revision = settings["revision"]
+    game_map.bulk_revision = settings["bulk_revision"]
+    game_map.change_log = [tuple(change) for change in settings["change_log"]]
+    game_map.flow_fields = FlowFieldCache(game_map, **settings["flow_fields"])
+    game_map.visibility.radius = settings["visibility_radius"]
+
+    # Entities, made straight from the saved columns. Entity n goes in row n of the store.
+    sprites = sprites or dict()
+    details = metadata["entities"]
+    kinds = [ENTITY_KINDS[kind] for kind in details["kind"]]
+    colours = [tuple(colour) for colour in details["colour"]]
+    entity_sprites = [sprites.get(sprite) for sprite in details["sprite"]]
+    columns = {name: array("entities/" + name) for name in ENTITY_COLUMNS}
+    columns["target"] = array("entities/target")
+    store = EntityStore.from_columns([kinds[number] for number in array("entities/kind").tolist()],
+                                     [details["name"][number] for number in array("entities/name").tolist()],
+                                     [colours[number] for number in array("entities/colour").tolist()],
+                                     [entity_sprites[number] for number in array("entities/sprite").tolist()],
+                                     array("entities/stats").tolist(), columns)
+    entities = EntityIndex(store=store)
+    entities.add_stored()
+
+    # Pathfinding maps.
+    for number, state in enumerate(metadata["chase_maps"]):
+        field = FlowField.__new__(FlowField)
+        for name in FLOW_FIELD_ATTRIBUTES:
+            setattr(field, name, state[name])
+        field.shape, field.origin = tuple(field.shape), tuple(field.origin)
+        field.anchor, field.source = tuple(field.anchor), tuple(field.source)
+        field.bounds, field.patch_bounds = tuple(field.bounds), tuple_or_none(field.patch_bounds)
+        field.anchor_values = array("chase/{}/anchor_values".format(number))
+        field.values = array("chase/{}/values".format(number))
+        game_map.flow_fields.chase_maps[entities[state["target"]]] = field
+
+    # Random number generators.
+    if rng is not None and metadata["rng"] is not None:
+        version, internal_state, gauss = metadata["rng"]
+        rng.setstate((version, tuple(internal_state), gauss))
+    if scheduler is not None and metadata["scheduler"] is not None:
+        scheduler.restore(metadata["scheduler"], entities)
+
+    return entities[metadata["player"]], entities, game_map, Turn(metadata["turn"])
+
+
+def save_game(path, player, entities, game_map, turn=Turn.player, rng=None, scheduler=None, sprites=None):
+    # Write a snapshot of a game to a file. See game_to_bytes.
+    data = game_to_bytes(player, entities, game_map, turn, rng, scheduler, sprites)
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def load_game(path, rng=None, scheduler=None, sprites=None):
+    # Load a game saved by save_game. See game_from_bytes.
+    with open(path, "rb") as file:
+        data = file.read()
+    return game_from_bytes(data, rng, scheduler, sprites)
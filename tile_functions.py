@@ -0,0 +1,175 @@
+"""
+Compact per-tile data for game maps. True/false attributes are packed eight tiles to a byte, and terrain is a one
+byte id per tile which decides how the tile is drawn and whether it can be walked on or seen through.
+"""
+
+import numpy as np
+from world_functions import ChunkedGrid, grid_bounds, fit_value, read_only, writable
+
+
+# Terrain ids, and how each one looks and behaves. Sprites are names from the sprites dict, colours are used if the
+# sprite isn't loaded.
+TERRAIN_FLOOR = 0
+TERRAIN_TREE = 1
+
+TERRAIN = {TERRAIN_FLOOR: {"name": "floor", "sprite": None, "colour": (0, 0, 0), "blocked": False, "opaque": False},
+           TERRAIN_TREE: {"name": "tree", "sprite": "tree", "colour": (255, 255, 255), "blocked": True, "opaque": True}}
+
+
+class BitLayer:
+    """
+    A 2d bool grid indexed [x, y] like a numpy array, packed eight tiles to a byte along the y axis.
+    Supports indexing with ints and slices (without steps), so it can be used as GameMap.blocked. Slices return new
+    numpy arrays rather than views. Use set_mask and mask for whole map operations, which stay packed.
+    Layers made by share use the same bytes until one of them is written to.
+    """
+    def __init__(self, shape):
+        self.shape = tuple(shape)
+        self.packed = np.zeros((self.shape[0], -(-self.shape[1] // 8)), dtype=np.uint8)
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def nbytes(self):
+        return self.packed.nbytes
+
+    def __getitem__(self, key):
+        (x_start, x_stop, x_int), (y_start, y_stop, y_int) = grid_bounds(key, self.shape)
+
+        # Single tiles are the common case, so skip unpacking for them.
+        if x_int and y_int:
+            return bool(self.packed.item(x_start, y_start >> 3) >> (y_start & 7) & 1)
+
+        # Unpack the bytes covering the rect, then trim to the tiles asked for.
+        first_byte = y_start >> 3
+        bits = np.unpackbits(self.packed[x_start:x_stop, first_byte:-(-y_stop // 8)], axis=1, bitorder="little")
+        result = bits[:, y_start - first_byte * 8:y_stop - first_byte * 8].view(bool)
+
+        if x_int:
+            return result[0]
+        if y_int:
+            return result[:, 0]
+        return result
+
+    def __setitem__(self, key, value):
+        (x_start, x_stop, x_int), (y_start, y_stop, y_int) = grid_bounds(key, self.shape)
+        self.packed = writable(self.packed)
+
+        if x_int and y_int:
+            byte, bit = y_start >> 3, 1 << (y_start & 7)
+            current = self.packed.item(x_start, byte)
+            self.packed[x_start, byte] = current | bit if value else current & ~bit
+            return
+
+        value = fit_value(value, x_stop - x_start, y_stop - y_start, x_int, y_int)
+        if not value.size:
+            return
+
+        # Unpack whole bytes, so tiles sharing them outside the rect are written back unchanged.
+        first_byte, last_byte = y_start >> 3, -(-y_stop // 8)
+        bits = np.unpackbits(self.packed[x_start:x_stop, first_byte:last_byte], axis=1, bitorder="little").view(bool)
+        bits[:, y_start - first_byte * 8:y_stop - first_byte * 8] = value
+        self.packed[x_start:x_stop, first_byte:last_byte] = np.packbits(bits, axis=1, bitorder="little")
+
+    def __array__(self, dtype=None, copy=None):
+        grid = self.mask()
+        return grid if dtype is None else grid.astype(dtype)
+
+    def mask(self):
+        # The whole layer as a bool array.
+        return np.unpackbits(self.packed, axis=1, count=self.shape[1], bitorder="little").view(bool)
+
+    def set_mask(self, mask, value=True):
+        """
+        Set the tiles picked out by a mask, working on the packed bytes.
+
+        :param mask: bool array the same shape as the layer.
+        :param value: bool - what to set the tiles to.
+        """
+        packed_mask = np.packbits(mask, axis=1, bitorder="little")
+        self.packed = writable(self.packed)
+        if value:
+            self.packed |= packed_mask
+        else:
+            self.packed &= ~packed_mask
+
+    def clear(self):
+        self.packed = writable(self.packed)
+        self.packed[:] = 0
+
+    def share(self):
+        # A copy of the layer which shares its bytes, read only, until either layer is written to.
+        self.packed = read_only(self.packed)
+        layer = BitLayer.__new__(BitLayer)
+        layer.shape = self.shape
+        layer.packed = self.packed
+        return layer
+
+    def count(self):
+        # Number of tiles which are set.
+        return int(self.mask().sum())
+
+
+class TileLayers:
+    """
+    Everything known about each tile of a map: the blocked tiles (shared with GameMap.blocked), bit packed opaque,
+    explored and visible flags, and a terrain id.
+    Terrain, blocked and opaque are kept in step by fill_rect, fill_mask and GameMap.set_terrain.
+
+    When blocked is a ChunkedGrid, the other layers are ChunkedGrids made by its sibling method, so a map stored on
+    disk is stored on disk in full.
+    """
+    FLAGS = ("opaque", "explored", "visible")
+
+    def __init__(self, shape, blocked):
+        self.shape = tuple(shape)
+        self.blocked = blocked
+        if isinstance(blocked, ChunkedGrid):
+            self.opaque, self.explored, self.visible = (blocked.sibling(flag) for flag in self.FLAGS)
+            self.terrain = blocked.sibling("terrain", np.uint8)
+            return
+
+        self.opaque = BitLayer(self.shape)  # Blocks line of sight.
+        self.explored = BitLayer(self.shape)  # Has been seen by the player at some point.
+        self.visible = BitLayer(self.shape)  # Can be seen by the player right now.
+        self.terrain = np.zeros(self.shape, dtype=np.uint8)
+
+    @property
+    def nbytes(self):
+        # Memory used by the layers, not counting blocked.
+        return sum(getattr(self, flag).nbytes for flag in self.FLAGS) + self.terrain.nbytes
+
+    def share(self, blocked):
+        """
+        Copies of the layers which share memory with these ones until they are written to, for GameMap.clone.
+        Terrain (like blocked) is shared read only, so call GameMap.make_writable before changing it.
+
+        :param blocked: the blocked tiles of the new map.
+        """
+        self.terrain = read_only(self.terrain)
+        layers = TileLayers.__new__(TileLayers)
+        layers.shape = self.shape
+        layers.blocked = blocked
+        for flag in self.FLAGS:
+            setattr(layers, flag, getattr(self, flag).share())
+        layers.terrain = self.terrain
+        return layers
+
+    def fill_rect(self, terrain, x1, x2, y1, y2):
+        # Set a rect of tiles (including the edges) to a terrain.
+        properties = TERRAIN[terrain]
+        self.terrain[x1:x2 + 1, y1:y2 + 1] = terrain
+        self.blocked[x1:x2 + 1, y1:y2 + 1] = properties["blocked"]
+        self.opaque[x1:x2 + 1, y1:y2 + 1] = properties["opaque"]
+
+    def fill_mask(self, terrain, mask):
+        # Set the tiles picked out by a bool mask, the same shape as the layers, to a terrain. Layers which aren't
+        # arrays (BitLayers and ChunkedGrids) only write the parts the mask touches.
+        properties = TERRAIN[terrain]
+        for layer, value in ((self.terrain, terrain), (self.blocked, properties["blocked"]), (self.opaque, properties["opaque"])):
+            if isinstance(layer, np.ndarray):
+                layer[mask] = value
+            else:
+                layer.set_mask(mask, value)
@@ -0,0 +1,192 @@
+"""
+Monster turns ordered by time, so monsters can act at different speeds. Each awake monster waits in a priority queue
+keyed by the time of its next action, and a monster turn only takes the monsters which are due off the front of the
+queue, rather than checking every entity in view.
+
+Time is counted in ticks. An action takes ACTION_TIME ticks at NORMAL_SPEED, so a monster with twice the speed acts
+twice for each player turn, and one with half the speed every other player turn.
+
+Monsters off the visible map chunk are dormant: they leave the queue when they next come up, and are only put back
+when the visible map chunk moves over them (or wake is called). When the view moves, only the strips of map coming
+into it are searched for monsters to wake, so the cost of a turn depends on the monsters in view rather than on the
+size of the game.
+
+The queue isn't quicker than game_functions.monster_turn: each monster in view costs a heap operation in Python,
+where monster_turn finds them all with one numpy test. What it gives is monsters acting at different speeds.
+"""
+
+import time
+import heapq
+from classes import Monster, NORMAL_SPEED, get_entities_in_chunk
+from profile_functions import profiler, timed
+
+
+# Ticks one action takes at NORMAL_SPEED.
+ACTION_TIME = 100
+
+
+def action_time(speed):
+    # Ticks between the actions of an entity with this speed.
+    return max(1, ACTION_TIME * NORMAL_SPEED // speed)
+
+
+class TurnScheduler:
+    """
+    Runs the monster turn from a priority queue of monsters by next action time, as a replacement for
+    game_functions.monster_turn. Monsters due at the same time act in the order they were added to the game, so with
+    every monster at the player's speed, games play out exactly as with monster_turn.
+
+    Only works with an EntityIndex of entities, as it orders monsters by EntityIndex.order.
+    """
+    def __init__(self):
+        self.time = 0  # Tick the current player turn started on.
+        self.queue = list()  # Heap of (due tick, order added, monster). Entries no longer in entries are skipped.
+        self.entries = dict()  # Awake monster -> its current entry in the queue.
+        self.index = None  # EntityIndex of the game being played.
+        self.map_chunk = None  # Visible map chunk dormant monsters were last woken from.
+        self.spawned = None  # EntityIndex.next_order at that time, to notice new monsters.
+        self.last_turn = dict()  # Numbers from the last turn: awake, woken, acted, dormant and seconds.
+
+    def clone(self, entity_map):
+        """
+        A copy of the scheduler for a copied game (see snapshot_functions.clone_game).
+
+        :param entity_map: dict of entity -> its copy.
+        """
+        scheduler = TurnScheduler()
+        scheduler.time = self.time
+        for monster, (due, order, queued) in self.entries.items():
+            if monster in entity_map:
+                scheduler.entries[entity_map[monster]] = (due, order, entity_map[monster])
+        scheduler.queue = list(scheduler.entries.values())
+        heapq.heapify(scheduler.queue)
+        scheduler.index = None  # Set by the first turn of the copy.
+        scheduler.map_chunk = self.map_chunk
+        scheduler.spawned = self.spawned
+        scheduler.last_turn = dict(self.last_turn)
+        return scheduler
+
+    def state(self, position):
+        """
+        The scheduler's state for a snapshot.
+
+        :param position: dict of entity -> its position in the entity list.
+        """
+        return {"time": self.time, "due": [[position[monster], entry[0]] for monster, entry in self.entries.items() if monster in position]}
+
+    def restore(self, state, entities):
+        # Put back a state from the state method, for the entities loaded from the same snapshot.
+        self.time = state["time"]
+        self.queue = list()
+        self.entries = dict()
+        self.index = entities
+        self.map_chunk = None  # Wake monsters in view on the next turn.
+        for number, due in state["due"]:
+            self.schedule(entities, entities[number], due)
+
+    def schedule(self, entities, monster, due):
+        # Queue a monster's next action.
+        entry = self.entries[monster] = (due, entities.order[monster], monster)
+        heapq.heappush(self.queue, entry)
+
+    def wake(self, entities, monster):
+        # Queue a dormant monster to act straight away. Monsters which are already awake keep their place.
+        if monster not in self.entries and monster.stats is not None and monster.stats.speed > 0:
+            self.schedule(entities, monster, self.time)
+            return True
+        return False
+
+    def sleep(self, monster):
+        # Take a monster out of the queue, e.g. when it is removed from the game.
+        self.entries.pop(monster, None)
+
+    def wake_in_chunk(self, player, entities, map_chunk, previous_chunk=None):
+        """
+        Wake the monsters in a map chunk, and give any without a target the player to chase.
+
+        :param previous_chunk: MapChunk - the chunk monsters were last woken from, if nothing has been added to the
+                               game since. Dormant monsters don't move, so only the part of map_chunk outside it is
+                               searched.
+        :return: number of monsters woken.
+        """
+        if previous_chunk is None:
+            entering = get_entities_in_chunk(entities, map_chunk)
+        else:
+            entering = [entity for part in map_chunk.difference(previous_chunk)
+                        for entity in entities.in_rect(part.x1, part.x2, part.y1, part.y2)]
+
+        woken = 0
+        for entity in entering:
+            if isinstance(entity, Monster) and entity not in self.entries:
+                if not entity.target:  # If the monster doesn't have a target, set it to the player.
+                    entity.target = player
+                woken += self.wake(entities, entity)
+        return woken
+
+    @timed("turn_scheduler")
+    def monster_turn(self, player, entities, game_map, visible_map_chunk):
+        """
+        Let every monster due before the player's next action take its turn.
+
+        :param player: player object
+        :param entities: EntityIndex - tracking all entities in game.
+        :param game_map: game map object
+        :param visible_map_chunk: MapChunk - the area of the map the player can see.
+        """
+        start = time.perf_counter()
+
+        # A new game, e.g. after Simulation.reset, starts with an empty queue.
+        if entities is not self.index and self.index is not None:
+            self.queue = list()
+            self.entries = dict()
+            self.map_chunk = None
+        self.index = entities
+
+        # Dormant monsters can only come into view when the view moves or new monsters are added.
+        woken = 0
+        if visible_map_chunk != self.map_chunk or entities.next_order != self.spawned:
+            previous_chunk = self.map_chunk if entities.next_order == self.spawned else None
+            woken = self.wake_in_chunk(player, entities, visible_map_chunk, previous_chunk)
+            self.map_chunk = visible_map_chunk
+            self.spawned = entities.next_order
+
+        end = self.time + action_time(player.stats.speed)
+        queue = self.queue
+        entries = self.entries
+        order = entities.order
+        x1, x2, y1, y2 = visible_map_chunk.x1, visible_map_chunk.x2, visible_map_chunk.y1, visible_map_chunk.y2
+        steps = dict()  # Speed -> action_time, as most monsters share a few speeds.
+        acted = 0
+        dormant = 0
+        while queue and queue[0][0] < end:
+            entry = queue[0]
+            due, number, monster = entry
+            if entries.get(monster) is not entry:
+                heapq.heappop(queue)  # Put to sleep, or queued again since.
+                continue
+
+            # Monsters which have left the view, or the game, go dormant.
+            if monster not in order or not (x1 <= monster.map_x <= x2 and y1 <= monster.map_y <= y2):
+                heapq.heappop(queue)
+                del entries[monster]
+                dormant += 1
+                continue
+
+            monster.take_turn(game_map, entities)
+            acted += 1
+            speed = monster.stats.speed
+            if speed > 0:
+                step = steps.get(speed)
+                if step is None:
+                    step = steps[speed] = action_time(speed)
+                # Put the monster back in the queue for its next action, in place of this one.
+                entry = entries[monster] = (due + step, number, monster)
+                heapq.heapreplace(queue, entry)
+            else:
+                heapq.heappop(queue)
+                del entries[monster]  # Stopped, e.g. held by a spell, until woken again.
+
+        self.time = end
+        self.last_turn = {"awake": len(self.entries), "woken": woken, "acted": acted, "dormant": dormant,
+                          "seconds": time.perf_counter() - start}
+        profiler.count("monsters_acted", acted)
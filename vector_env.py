@@ -0,0 +1,367 @@
+"""
+Many independent games stepped together with numpy, for high throughput agent rollouts.
+The rules are the same as the headless Simulation, but every game's state lives in stacked arrays and each rule is
+applied to all games at once rather than by looping over entity objects.
+"""
+
+import random
+import numpy as np
+from map_functions import display_to_map
+from game_functions import new_game
+from numpy.lib.stride_tricks import sliding_window_view
+from pathfinding import NEIGHBOURS, distance_map, safety_map
+from simulation import ACTIONS, OBS_MONSTER, OBS_PLAYER
+
+# Movement for each action index, (0, 0) for waiting.
+ACTION_DX = np.array([action.get("move", (0, 0))[0] for action in ACTIONS])
+ACTION_DY = np.array([action.get("move", (0, 0))[1] for action in ACTIONS])
+
+# Neighbouring tiles in the order Monster.calculate_path tries them, so ties are broken the same way.
+NEIGHBOUR_DX = np.array([dx for dx, dy in NEIGHBOURS])
+NEIGHBOUR_DY = np.array([dy for dx, dy in NEIGHBOURS])
+
+
+class VectorEnv:
+    """
+    A batch of games. Entity 0 in each game is the player and entities 1 onwards are monsters. Positions and StatBlock
+    fields are stored as (games, entities) arrays, and maps as (games, x, y) arrays.
+
+    Monsters only find paths within the visible map chunk plus a margin of tiles around it, rather than the whole map,
+    but their paths are exact within it. Simulation's pathfinding maps are only exact within FlowFieldCache's drift of
+    the player, and lead monsters further away back towards where the player was. So with the defaults the two drift
+    apart once a monster far from the player comes into view. Set a margin as large as the map, and give Simulation a
+    drift as large as the map too, to match it step for step (benchmarks/bench_vector_env.py checks this).
+    """
+    def __init__(self, num_envs, map_width=None, map_height=None, monster_count=10, view_port_width=800,
+                 view_port_height=480, margin=8, max_steps=1000):
+        if map_width is None or map_height is None:
+            map_width, map_height = display_to_map(800 * 2, 640 * 2)
+
+        self.num_envs = num_envs
+        self.map_width = map_width
+        self.map_height = map_height
+        self.monster_count = monster_count
+        self.visible_width, self.visible_height = display_to_map(view_port_width, view_port_height)
+        self.margin = margin
+        self.max_steps = max_steps
+
+        shape = (num_envs, monster_count + 1)
+        self.blocked = np.zeros((num_envs, map_width + 1, map_height + 1), dtype=bool)
+        self.padded_blocked = np.ones((num_envs, map_width + 1 + margin * 2, map_height + 1 + margin * 2), dtype=bool)  # Off the map is blocked.
+        self.occupied = np.zeros((num_envs, map_width + 1, map_height + 1), dtype=np.int16)  # Entities per tile.
+        self.map_x = np.zeros(shape, dtype=np.int32)
+        self.map_y = np.zeros(shape, dtype=np.int32)
+        self.h = np.zeros(shape, dtype=np.int32)
+        self.m = np.zeros(shape, dtype=np.int32)
+        self.s = np.zeros(shape, dtype=np.int32)
+        self.d = np.zeros(shape, dtype=np.int32)
+        self.max_h = np.zeros(shape, dtype=np.int32)
+        self.flee = np.zeros(shape, dtype=bool)
+        self.steps = np.zeros(num_envs, dtype=np.int32)
+
+        self.games = np.arange(num_envs)
+        self.next_seed = 0  # Seeds handed out to games which are reset automatically.
+
+    def reset(self, seeds=None):
+        """
+        Start a new game in every slot.
+
+        :param seeds: list of ints, one per game. Each game is the same as Simulation.reset(seed) would create.
+        :return: observations.
+        """
+        if seeds is None:
+            seeds = range(self.next_seed, self.next_seed + self.num_envs)
+        for game, seed in zip(self.games, seeds):
+            self.reset_game(game, seed)
+        return self.observation()
+
+    def reset_game(self, game, seed=None):
+        # Build a game with the normal objects, then copy it into the arrays.
+        if seed is None:
+            seed = self.next_seed
+        self.next_seed = max(self.next_seed, seed + 1)
+
+        player, entities, game_map = new_game(self.map_width, self.map_height, self.monster_count, random.Random(seed))
+        self.blocked[game] = game_map.blocked
+        self.padded_blocked[game, self.margin:self.margin + self.map_width + 1, self.margin:self.margin + self.map_height + 1] = game_map.blocked
+        self.occupied[game] = 0
+        self.flee[game] = False
+        self.steps[game] = 0
+
+        for number, entity in enumerate(entities):
+            self.map_x[game, number] = entity.map_x
+            self.map_y[game, number] = entity.map_y
+            self.occupied[game, entity.map_x, entity.map_y] += 1
+
+            stats = entity.stats
+            self.h[game, number], self.m[game, number], self.s[game, number], self.d[game, number] = stats.h, stats.m, stats.s, stats.d
+            self.max_h[game, number] = stats.max_h
+
+    def visible_map_chunks(self):
+        # Vectorised get_visible_map_chunk. Returns x1, x2, y1, y2 arrays, inclusive like MapChunk.
+        x1, x2 = self.clamp_chunk(self.map_x[:, 0] - int(self.visible_width * 0.5), self.visible_width, self.map_width)
+        y1, y2 = self.clamp_chunk(self.map_y[:, 0] - int(self.visible_height * 0.5), self.visible_height, self.map_height)
+        return x1, x2, y1, y2
+
+    @staticmethod
+    def clamp_chunk(start, visible_size, map_size):
+        end = start + visible_size
+        past_end = end > map_size
+        before_start = start < 0
+        end = np.where(past_end, map_size, np.where(before_start, end - start, end))
+        start = np.where(past_end, map_size - visible_size, np.where(before_start, 0, start))
+        return start, end
+
+    def step(self, actions):
+        """
+        Run one player turn and monster turn in every game. Finished games are reset automatically.
+
+        :param actions: array of ints, one index into ACTIONS per game.
+        :return: observations, rewards, dones, info dict of arrays.
+        """
+        actions = np.asarray(actions)
+        games = self.games
+        player_health = self.h[:, 0].copy()
+        monster_health = self.h[:, 1:].sum(axis=1)
+
+        # What can be seen is worked out before the player moves, like the engine.
+        x1, x2, y1, y2 = self.visible_map_chunks()
+
+        self.player_turn(actions)
+
+        # Monsters in view at the start of the monster phase take their turns.
+        monster_x, monster_y = self.map_x[:, 1:], self.map_y[:, 1:]
+        active = (x1[:, None] <= monster_x) & (monster_x <= x2[:, None]) & (y1[:, None] <= monster_y) & (monster_y <= y2[:, None])
+        if active.any():
+            self.monster_turn(active, x1, y1)
+
+        self.steps += 1
+        rewards = (monster_health - self.h[:, 1:].sum(axis=1)) - (player_health - self.h[:, 0])
+        dones = (self.h[:, 0] <= 0) | (self.steps >= self.max_steps)
+        info = {"steps": self.steps.copy(), "player_health": self.h[:, 0].copy()}
+
+        for game in games[dones]:
+            self.reset_game(game)
+
+        return self.observation(), rewards, dones, info
+
+    def player_turn(self, actions):
+        games = self.games
+        dx, dy = ACTION_DX[actions], ACTION_DY[actions]
+        x, y = self.map_x[:, 0], self.map_y[:, 0]
+        destination_x, destination_y = x + dx, y + dy
+
+        walkable = ((dx != 0) | (dy != 0)) & ~self.blocked[games, destination_x, destination_y]
+        occupied = self.occupied[games, destination_x, destination_y] > 0
+
+        # Attack whichever monster is in the way.
+        attacking = games[walkable & occupied]
+        if len(attacking):
+            at_destination = (self.map_x[attacking, 1:] == destination_x[attacking, None]) & (self.map_y[attacking, 1:] == destination_y[attacking, None])
+            target = at_destination.argmax(axis=1) + 1
+            self.h[attacking, target] -= self.s[attacking, 0] - self.d[attacking, target]
+
+        moving = games[walkable & ~occupied]
+        self.move(moving, 0, destination_x[moving], destination_y[moving])
+
+    def move(self, games, entity, destination_x, destination_y):
+        # Move one entity in each of the given games, keeping the occupancy grid up to date.
+        self.occupied[games, self.map_x[games, entity], self.map_y[games, entity]] -= 1
+        self.map_x[games, entity] = destination_x
+        self.map_y[games, entity] = destination_y
+        self.occupied[games, destination_x, destination_y] += 1
+
+    def monster_turn(self, active, x1, y1):
+        # Pathfinding maps cover the visible map chunk plus a margin, one per game.
+        # The padded map has the margin added to every side, so the window always starts at the chunk's corner.
+        origin_x, origin_y = x1 - self.margin, y1 - self.margin
+        window_width = self.visible_width + 1 + self.margin * 2
+        window_height = self.visible_height + 1 + self.margin * 2
+        blocked = sliding_window_view(self.padded_blocked, (window_width, window_height), axis=(1, 2))[self.games, x1, y1]
+
+        source_x, source_y = self.map_x[:, 0] - origin_x, self.map_y[:, 0] - origin_y
+        if window_height <= 64:
+            chase = PackedDistances(blocked, source_x, source_y)
+        else:
+            chase = DenseDistances(blocked, source_x, source_y)
+
+        # Flee maps are only needed in games where a monster which is about to act is fleeing.
+        flee_games = self.games[(active & self.flee[:, 1:]).any(axis=1)]
+        flee = np.full((self.num_envs, window_width, window_height), np.inf, dtype=np.float32)
+        if len(flee_games):
+            flee[flee_games] = safety_map(chase.dense(flee_games), blocked[flee_games])
+
+        player_x, player_y = self.map_x[:, 0], self.map_y[:, 0]
+
+        # Monsters act one after another within a game, so later monsters see where earlier ones moved to.
+        for monster in range(1, self.monster_count + 1):
+            games = self.games[active[:, monster - 1]]
+            if not len(games):
+                continue
+
+            x, y = self.map_x[games, monster], self.map_y[games, monster]
+
+            # Monster.calculate_path for every game at once: the lowest neighbouring tile not occupied by another entity.
+            neighbour_x, neighbour_y = x[:, None] + NEIGHBOUR_DX, y[:, None] + NEIGHBOUR_DY
+            local_x, local_y = neighbour_x - origin_x[games, None], neighbour_y - origin_y[games, None]
+            inside = (local_x >= 0) & (local_x < window_width) & (local_y >= 0) & (local_y < window_height)
+            local_x, local_y = local_x.clip(0, window_width - 1), local_y.clip(0, window_height - 1)
+
+            neighbour_games = np.broadcast_to(games[:, None], local_x.shape)
+            values = chase.lookup(neighbour_games, local_x, local_y)
+            fleeing = self.flee[games, monster]
+            values[fleeing] = flee[neighbour_games[fleeing], local_x[fleeing], local_y[fleeing]]
+            values[~inside] = np.inf
+
+            others = self.padded_occupied(games[:, None], neighbour_x, neighbour_y)
+            others = others - ((neighbour_x == player_x[games, None]) & (neighbour_y == player_y[games, None]))
+            values[others > 0] = np.inf
+
+            best = values.argmin(axis=1)
+            can_path = np.isfinite(values[np.arange(len(games)), best])
+            dx, dy = np.where(can_path, NEIGHBOUR_DX[best], 0), np.where(can_path, NEIGHBOUR_DY[best], 0)
+
+            # Move if the tile is free, otherwise attack the player if next to them.
+            destination_x, destination_y = x + dx, y + dy
+            free = ~self.blocked[games, destination_x, destination_y] & (self.occupied[games, destination_x, destination_y] == 0)
+            self.move(games[free], monster, destination_x[free], destination_y[free])
+
+            attacking = games[~free & ((x - player_x[games]) ** 2 + (y - player_y[games]) ** 2 < 4)]
+            self.h[attacking, 0] -= self.s[attacking, monster] - self.d[attacking, 0]
+
+            # Monster.check_state.
+            self.flee[games, monster] = self.h[games, monster] <= (self.max_h[games, monster] * 0.25).astype(np.int32)
+
+    def padded_occupied(self, games, x, y):
+        # Number of entities on each tile, counting tiles off the map as empty.
+        in_map = (x >= 0) & (x <= self.map_width) & (y >= 0) & (y <= self.map_height)
+        return np.where(in_map, self.occupied[games, x.clip(0, self.map_width), y.clip(0, self.map_height)], 0)
+
+    def observation(self):
+        """
+        The visible part of each game's map, as an int8 array indexed [game, x, y] of simulation OBS_ values.
+        """
+        x1, x2, y1, y2 = self.visible_map_chunks()
+        chunk_x = x1[:, None] + np.arange(self.visible_width + 1)
+        chunk_y = y1[:, None] + np.arange(self.visible_height + 1)
+        grid = self.blocked[self.games[:, None, None], chunk_x[:, :, None], chunk_y[:, None, :]].astype(np.int8)
+
+        local_x, local_y = self.map_x - x1[:, None], self.map_y - y1[:, None]
+        visible = (local_x >= 0) & (local_x <= self.visible_width) & (local_y >= 0) & (local_y <= self.visible_height)
+        games, monsters = np.nonzero(visible[:, 1:])
+        grid[games, local_x[games, monsters + 1], local_y[games, monsters + 1]] = OBS_MONSTER
+        grid[self.games, local_x[:, 0], local_y[:, 0]] = OBS_PLAYER
+        return grid
+
+    def observation_channels(self, encoder, out=None):
+        """
+        The visible part of every game as the stacked channels of an observation_functions.ObservationEncoder, the
+        same as encoding the matching Simulations.
+
+        :param encoder: ObservationEncoder made for this env's view port size.
+        :param out: array shaped (num_envs,) + encoder.shape to write into. Optional.
+        """
+        if encoder.window != (self.visible_width + 1, self.visible_height + 1):
+            raise ValueError("the encoder's window doesn't match the visible map chunk")
+
+        out, full = encoder.prepare(self.num_envs, out)
+        x1, x2, y1, y2 = self.visible_map_chunks()
+
+        walls = encoder.channel_index.get("walls")
+        if walls is not None:
+            chunk_x = x1[:, None] + np.arange(self.visible_width + 1)
+            chunk_y = y1[:, None] + np.arange(self.visible_height + 1)
+            full[:, walls, :self.visible_width + 1, :self.visible_height + 1] = self.blocked[self.games[:, None, None], chunk_x[:, :, None], chunk_y[:, None, :]]
+
+        local_x, local_y = self.map_x - x1[:, None], self.map_y - y1[:, None]
+        games, entities = np.nonzero((local_x >= 0) & (local_x <= self.visible_width) & (local_y >= 0) & (local_y <= self.visible_height))
+        encoder.add_entities(full, games, local_x[games, entities], local_y[games, entities], entities == 0,
+                             self.h[games, entities], self.max_h[games, entities], self.flee[games, entities])
+        return encoder.finish(full, out)
+
+
+class PackedDistances:
+    """
+    Breadth first search from one source per game, with each column of the map packed into the bits of a uint64
+    so a whole column moves one step per operation. Maps must be no more than 64 tiles high.
+    Distances are stored as bit planes: plane b holds bit b of every reached tile's distance.
+    """
+    def __init__(self, blocked, source_x, source_y):
+        num_games, width, height = blocked.shape
+        self.height = height
+        walkable = pack_columns(~blocked)
+
+        games = np.arange(num_games)
+        frontier = np.zeros((num_games, width), dtype=np.uint64)
+        frontier[games, source_x] = np.left_shift(1, source_y.astype(np.uint64))
+        reached = frontier.copy()
+        planes = list()
+
+        step = 0
+        while True:
+            step += 1
+            grown_y = frontier | (frontier << 1) | (frontier >> 1)
+            grown = grown_y.copy()
+            grown[:, 1:] |= grown_y[:, :-1]
+            grown[:, :-1] |= grown_y[:, 1:]
+
+            frontier = grown & walkable & ~reached
+            if not frontier.any():
+                break
+            reached |= frontier
+
+            while len(planes) < step.bit_length():
+                planes.append(np.zeros_like(frontier))
+            for bit in range(step.bit_length()):
+                if step >> bit & 1:
+                    planes[bit] |= frontier
+
+        self.planes = planes
+        self.reached = reached
+
+    def lookup(self, games, x, y):
+        # Distances of tiles, inf if unreachable. All arguments are arrays of the same shape.
+        shift = y.astype(np.uint64)
+        values = np.zeros(x.shape, dtype=np.float32)
+        for bit, plane in enumerate(self.planes):
+            values += ((plane[games, x] >> shift) & 1) * float(1 << bit)
+
+        reached = (self.reached[games, x] >> shift) & 1
+        return np.where(reached == 1, values, np.inf).astype(np.float32)
+
+    def dense(self, games):
+        # Full distance maps for some games, as pathfinding.distance_map would give.
+        values = np.zeros((len(games), self.reached.shape[1], self.height), dtype=np.float32)
+        for bit, plane in enumerate(self.planes):
+            values += unpack_columns(plane[games], self.height) * float(1 << bit)
+
+        values[~unpack_columns(self.reached[games], self.height)] = np.inf
+        return values
+
+
+class DenseDistances:
+    """
+    The same interface as PackedDistances, for maps too high to pack.
+    """
+    def __init__(self, blocked, source_x, source_y):
+        self.values = np.stack([distance_map(game_blocked, [(x, y)]) for game_blocked, x, y in zip(blocked, source_x, source_y)])
+
+    def lookup(self, games, x, y):
+        return self.values[games, x, y]
+
+    def dense(self, games):
+        return self.values[games]
+
+
+def pack_columns(mask):
+    # (games, x, y) bool array with y <= 64 -> (games, x) uint64 array with bit y set for each True tile.
+    num_games, width, height = mask.shape
+    padded = np.zeros((num_games, width, 64), dtype=bool)
+    padded[:, :, :height] = mask
+    return np.packbits(padded, axis=2, bitorder="little").view("<u8")[:, :, 0]
+
+
+def unpack_columns(words, height):
+    # Reverse of pack_columns.
+    as_bytes = np.ascontiguousarray(words.astype("<u8")).view(np.uint8).reshape(words.shape + (8,))
+    return np.unpackbits(as_bytes, axis=2, bitorder="little")[:, :, :height].astype(bool)
@@ -0,0 +1,251 @@
+"""
+Storage for maps too big to keep in memory. A ChunkedGrid can stand in for GameMap.blocked: tiles are kept on disk
+in square chunks of packed bits, and only recently used chunks are unpacked in memory. The map's other tile layers
+are then kept the same way, see ChunkedGrid.sibling.
+"""
+
+import os
+import tempfile
+import numpy as np
+from collections import OrderedDict
+
+
+def grid_bounds(key, shape):
+    """
+    Turn an index into a 2d grid, made of ints and slices without steps, into a start and stop for each axis.
+
+    :param key: index, e.g. (x, y), (slice(x1, x2), y) or x.
+    :param shape: (width, height) of the grid.
+    :return: list of (start, stop, whether the axis was indexed with an int) for x and y.
+    """
+    if not isinstance(key, tuple):
+        key = (key, slice(None))
+    if len(key) != 2:
+        raise IndexError("grids take an x and a y index")
+
+    bounds = list()
+    for index, size in zip(key, shape):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(size)
+            if step != 1:
+                raise IndexError("grid slices can't have a step")
+            bounds.append((start, max(start, stop), False))
+        else:
+            index = int(index)
+            if index < 0:
+                index += size
+            if not 0 <= index < size:
+                raise IndexError("index {} is out of bounds for size {}".format(index, size))
+            bounds.append((index, index + 1, True))
+    return bounds
+
+
+def fit_value(value, width, height, x_int, y_int, dtype=bool):
+    # Line a value up with a rect of tiles, putting back any axis an int index dropped.
+    value = np.asarray(value, dtype=dtype)
+    if x_int and value.ndim:
+        value = value[None, ...]
+    elif y_int and value.ndim:
+        value = value[..., None]
+    return np.broadcast_to(value, (width, height))
+
+
+def read_only(array):
+    # A view of an array which can't be written to, for sharing it between copies of a game.
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+def writable(array):
+    # The array itself if it can be written to, or else a copy which can. Shared arrays are copied on first write.
+    return array if array.flags.writeable else array.copy()
+
+
+class ChunkedGrid:
+    """
+    A 2d bool grid indexed [x, y] like a numpy array, stored in a memory mapped file as chunks of
+    chunk_size x chunk_size tiles, eight tiles to a byte. Grids of another dtype, e.g. terrain ids, store each tile
+    as one value of that dtype instead.
+
+    Reading or writing a tile unpacks its chunk into a least recently used cache of cache_chunks chunks. Chunks pushed
+    out of the cache are packed and written back to the file if they were changed.
+
+    Supports indexing with ints and slices (without steps), e.g. grid[x, y], grid[x1:x2, y1:y2] or grid[0, :].
+    Slices return new numpy arrays rather than views.
+    """
+    def __init__(self, shape, path=None, chunk_size=64, cache_chunks=256, dtype=bool):
+        """
+        :param shape: (width, height) of the grid in tiles.
+        :param path: file to keep the grid in. An existing file is reopened, keeping its tiles. None for a temporary file.
+        :param chunk_size: int - chunk width and height in tiles, a multiple of 8.
+        :param cache_chunks: int - most chunks kept unpacked in memory.
+        :param dtype: numpy dtype of the tiles. Bools are packed eight to a byte.
+        """
+        if chunk_size % 8:
+            raise ValueError("chunk_size must be a multiple of 8, not {}".format(chunk_size))
+
+        self.shape = tuple(shape)
+        self.path = path
+        self.chunk_size = chunk_size
+        self.cache_chunks = cache_chunks
+        self.dtype = np.dtype(dtype)
+        self.chunks_x = -(-self.shape[0] // chunk_size)
+        self.chunks_y = -(-self.shape[1] // chunk_size)
+
+        # Packed chunks, one row of bytes per x. Other dtypes are stored as they are.
+        if self.dtype == bool:
+            file_dtype, file_shape = np.uint8, (self.chunks_x, self.chunks_y, chunk_size, chunk_size // 8)
+        else:
+            file_dtype, file_shape = self.dtype, (self.chunks_x, self.chunks_y, chunk_size, chunk_size)
+        if path is None:
+            self.file = tempfile.TemporaryFile()
+            self.packed = np.memmap(self.file, dtype=file_dtype, mode="w+", shape=file_shape)
+        else:
+            self.file = None
+            mode = "r+" if os.path.exists(path) else "w+"
+            self.packed = np.lib.format.open_memmap(path, mode=mode, dtype=file_dtype, shape=file_shape if mode == "w+" else None)
+            if self.packed.shape != file_shape or self.packed.dtype != file_dtype:
+                raise ValueError("{} holds a grid with a different size, chunk size or dtype".format(path))
+
+        self.chunks = OrderedDict()  # (chunk x, chunk y) -> unpacked bool array, least recently used first.
+        self.dirty = set()  # Unpacked chunks which have been changed.
+        self.loads = 0  # Number of chunks read from the file, for tuning cache_chunks.
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def nbytes(self):
+        # Memory used by the unpacked chunks. The rest of the grid is on disk.
+        return sum(chunk.nbytes for chunk in self.chunks.values())
+
+    def sibling(self, name, dtype=bool):
+        """
+        An empty grid of the same size and chunking, e.g. for another layer of the same map. Its file is next to this
+        grid's, with name added before the extension, or a temporary file if this grid has one.
+
+        :param name: str - what the grid holds, e.g. "terrain".
+        :param dtype: numpy dtype of the new grid's tiles.
+        """
+        path = None
+        if self.path is not None:
+            root, extension = os.path.splitext(self.path)
+            path = "{}.{}{}".format(root, name, extension)
+        return ChunkedGrid(self.shape, path, self.chunk_size, self.cache_chunks, dtype)
+
+    def pack(self, chunk):
+        # A chunk as it is stored in the file.
+        return np.packbits(chunk, axis=1) if self.dtype == bool else chunk
+
+    def chunk(self, chunk_x, chunk_y):
+        # The unpacked chunk, loading it from the file if needed.
+        key = (chunk_x, chunk_y)
+        chunk = self.chunks.get(key)
+
+        if chunk is None:
+            if self.dtype == bool:
+                chunk = np.unpackbits(self.packed[chunk_x, chunk_y], axis=1).view(bool)
+            else:
+                chunk = np.array(self.packed[chunk_x, chunk_y])
+            self.chunks[key] = chunk
+            self.loads += 1
+            while len(self.chunks) > self.cache_chunks:
+                self.evict()
+        else:
+            self.chunks.move_to_end(key)
+
+        return chunk
+
+    def evict(self):
+        # Drop the least recently used chunk, saving it first if it changed.
+        key, chunk = self.chunks.popitem(last=False)
+        if key in self.dirty:
+            self.packed[key] = self.pack(chunk)
+            self.dirty.discard(key)
+
+    def flush(self):
+        # Write every changed chunk to the file.
+        for key in self.dirty:
+            self.packed[key] = self.pack(self.chunks[key])
+        self.dirty.clear()
+        self.packed.flush()
+
+    def prefetch(self, x1, x2, y1, y2):
+        # Load the chunks covering a rect of tiles (including the edges), e.g. the area around the view port.
+        x1, y1 = max(x1, 0), max(y1, 0)
+        x2, y2 = min(x2, self.shape[0] - 1), min(y2, self.shape[1] - 1)
+        for chunk_x in range(x1 // self.chunk_size, x2 // self.chunk_size + 1):
+            for chunk_y in range(y1 // self.chunk_size, y2 // self.chunk_size + 1):
+                self.chunk(chunk_x, chunk_y)
+
+    def parts(self, x_start, x_stop, y_start, y_stop):
+        # Split a rect of tiles into the parts in each chunk: chunk key, slices in the chunk, slices in the rect.
+        size = self.chunk_size
+        for chunk_x in range(x_start // size, (x_stop - 1) // size + 1):
+            x1, x2 = max(x_start, chunk_x * size), min(x_stop, (chunk_x + 1) * size)
+            for chunk_y in range(y_start // size, (y_stop - 1) // size + 1):
+                y1, y2 = max(y_start, chunk_y * size), min(y_stop, (chunk_y + 1) * size)
+                yield ((chunk_x, chunk_y), (slice(x1 - chunk_x * size, x2 - chunk_x * size), slice(y1 - chunk_y * size, y2 - chunk_y * size)),
+                       (slice(x1 - x_start, x2 - x_start), slice(y1 - y_start, y2 - y_start)))
+
+    def __getitem__(self, key):
+        (x_start, x_stop, x_int), (y_start, y_stop, y_int) = grid_bounds(key, self.shape)
+
+        # Single tiles are the common case, so skip building an array for them.
+        if x_int and y_int:
+            size = self.chunk_size
+            return self.chunk(x_start // size, y_start // size).item(x_start % size, y_start % size)
+
+        result = np.zeros((x_stop - x_start, y_stop - y_start), dtype=self.dtype)
+        if result.size:
+            for chunk_key, in_chunk, in_result in self.parts(x_start, x_stop, y_start, y_stop):
+                result[in_result] = self.chunk(*chunk_key)[in_chunk]
+
+        if x_int:
+            return result[0]
+        if y_int:
+            return result[:, 0]
+        return result
+
+    def __setitem__(self, key, value):
+        (x_start, x_stop, x_int), (y_start, y_stop, y_int) = grid_bounds(key, self.shape)
+
+        if x_int and y_int:
+            size = self.chunk_size
+            chunk_key = (x_start // size, y_start // size)
+            self.chunk(*chunk_key)[x_start % size, y_start % size] = value
+            self.dirty.add(chunk_key)
+            return
+
+        value = fit_value(value, x_stop - x_start, y_stop - y_start, x_int, y_int, self.dtype)
+
+        if value.size:
+            for chunk_key, in_chunk, in_result in self.parts(x_start, x_stop, y_start, y_stop):
+                self.chunk(*chunk_key)[in_chunk] = value[in_result]
+                self.dirty.add(chunk_key)
+
+    def __array__(self, dtype=None, copy=None):
+        # The whole grid in memory. Only sensible for grids which would fit in memory anyway.
+        grid = self[:, :]
+        return grid if dtype is None else grid.astype(dtype)
+
+    def set_mask(self, mask, value=True):
+        """
+        Set the tiles picked out by a mask. Only the chunks with tiles in the mask are loaded and written.
+
+        :param mask: bool array the same shape as the grid.
+        :param value: what to set the tiles to.
+        """
+        for chunk_key, in_chunk, in_mask in self.parts(0, self.shape[0], 0, self.shape[1]):
+            part = mask[in_mask]
+            if part.any():
+                self.chunk(*chunk_key)[in_chunk][part] = value
+                self.dirty.add(chunk_key)
+
+    def clear(self):
+        # Set every tile to False (or 0), writing the whole file.
+        self.chunks.clear()
+        self.dirty.clear()
+        self.packed[:] = 0